@@ -0,0 +1,171 @@
+# Package imports
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import (
+    AuthenticationFailed,
+    InvalidToken,
+)
+from rest_framework_simplejwt.settings import api_settings
+
+# Utility imports
+from app.utils import (
+    get_global_values,
+)
+
+
+class HotUserCache:
+    """ Cache: Bounded per-process LRU of recently loaded users, each entry expiring after a TTL """
+
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        """ Return a private copy of the cached user, or None when missing or expired """
+
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+            if entry is None:
+                return None
+
+            user, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                del self.entries[user_id]
+                return None
+
+            self.entries.move_to_end(user_id)
+
+        # Requests on other threads must never share (and mutate) the same instance
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        """ Store the user, evicting the least recently used entries past the size bound """
+
+        with self.lock:
+            self.entries[user_id] = (copy.copy(user), time.monotonic() + self.timeout)
+            self.entries.move_to_end(user_id)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def evict(self, user_id):
+        """ Drop the cached user, if any """
+
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        """ Drop every cached user """
+
+        with self.lock:
+            self.entries.clear()
+
+
+hot_user_cache = HotUserCache(
+    max_size=settings.HOT_USER_CACHE_SIZE,
+    timeout=settings.HOT_USER_CACHE_TIMEOUT,
+)
+
+
+def load_token_user(user_id):
+    """ Authentication: Full user row for the token, from the hot-user LRU falling back to the database """
+
+    user = hot_user_cache.get(user_id)
+
+    if user is None:
+
+        try:
+            user = get_user_model().objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+
+        hot_user_cache.set(user_id, user)
+
+    if not api_settings.USER_AUTHENTICATION_RULE(user):
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+
+    return user
+
+
+class LazyTokenUser(SimpleLazyObject):
+    """ Authentication: User built from the token, the row is only loaded when a model attribute is touched """
+
+    def __init__(self, user_id):
+        self.__dict__['_user_id'] = user_id
+        super().__init__(lambda: load_token_user(user_id))
+
+    # Answered from the token alone, so lookups like filter(user=request.user) stay query free
+    @property
+    def id(self):
+        return self._user_id
+
+    @property
+    def pk(self):
+        return self._user_id
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+    @property
+    def _meta(self):
+        return get_user_model()._meta
+
+    @property
+    def __class__(self):
+        return get_user_model()
+
+    def __getattr__(self, name):
+
+        # Probes for attributes the model does not have (e.g. resolve_expression) must not load the row
+        if name != '_state' and not hasattr(get_user_model(), name):
+            raise AttributeError(name)
+
+        if self._wrapped is empty:
+            self._setup()
+
+        return getattr(self._wrapped, name)
+
+    def __eq__(self, other):
+        if hasattr(other, '_meta'):
+            return other._meta.concrete_model is self._meta.concrete_model and other.pk == self.pk
+
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """ Authentication: JWT authentication that skips the per-request user query in stateless mode """
+
+    def get_user(self, validated_token):
+
+        # Only tokens carrying the permissions version are checked for deactivation without the user row
+        permissions_version_claim = get_global_values()['PERMISSIONS_VERSION_CLAIM']
+
+        if not settings.JWT_STATELESS_AUTHENTICATION or permissions_version_claim not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        return LazyTokenUser(user_id)
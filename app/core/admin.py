@@ -49,4 +49,11 @@ admin.site.register(ServiceExclusion)
 admin.site.register(ServiceRequestServiceSlot)
 admin.site.register(Payment)
 admin.site.register(AmenityBookingAmenitySlot)
-admin.site.register(BillPayment)
\ No newline at end of file
+admin.site.register(BillPayment)
+admin.site.register(LoginOTP)
+admin.site.register(NotificationOutbox)
+admin.site.register(Notification)
+admin.site.register(NotificationCounter)
+admin.site.register(NotificationTopicSubscription)
+admin.site.register(NotificationTopicUnsubscription)
+admin.site.register(PaymentWebhookEvent)
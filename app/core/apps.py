@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app.core'
+
+    def ready(self):
+        # Register the cache invalidation signals
+        import app.core.signals
+
+        # Register the system checks
+        import app.core.checks
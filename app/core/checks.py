@@ -0,0 +1,100 @@
+# Package imports
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Utility imports
+from app.utils import (
+    is_shared_cache,
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_default_cache(app_configs, **kwargs):
+    """ Check: Role and permissions version invalidations only reach every worker through a shared cache """
+
+    if is_shared_cache('default'):
+        return []
+
+    return [
+        Error(
+            'The default cache is local to each process.',
+            hint='Set CACHE_URL to a shared backend (e.g. redis://), or role changes reach other workers only after ROLE_CACHE_TIMEOUT.',
+            id='core.E001',
+        ),
+    ]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_throttle_cache(app_configs, **kwargs):
+    """ Check: The OTP throttles only hold across workers when their counters live in a shared cache """
+
+    if is_shared_cache(settings.THROTTLE_CACHE_ALIAS):
+        return []
+
+    return [
+        Error(
+            'The throttle cache is local to each process.',
+            hint='Set THROTTLE_CACHE_URL to a shared backend (e.g. redis://), or every worker allows the full OTP rate on its own.',
+            id='core.E002',
+        ),
+    ]
+
+
+@register(Tags.security)
+def check_api_login_sessions(app_configs, **kwargs):
+    """ Check: OTP login with sessions needs the session and authentication middleware on the API stack """
+
+    if settings.SESSIONLESS_API_LOGIN:
+        return []
+
+    required_middleware = [
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+    ]
+
+    missing_middleware = [middleware for middleware in required_middleware if middleware not in settings.API_MIDDLEWARE]
+
+    if not missing_middleware:
+        return []
+
+    return [
+        Error(
+            'SESSIONLESS_API_LOGIN is off but API_MIDDLEWARE lacks %s.' % ', '.join(missing_middleware),
+            hint='Add the middleware to API_MIDDLEWARE or set SESSIONLESS_API_LOGIN, OTP login calls login() which needs request.session.',
+            id='core.E003',
+        ),
+    ]
+
+
+@register()
+def check_notification_outbox_lease(app_configs, **kwargs):
+    """ Check: The outbox lease leaves room for an FCM request, or a worker never sends anything """
+
+    if settings.NOTIFICATION_OUTBOX_LEASE > 2 * settings.FCM_TIMEOUT:
+        return []
+
+    return [
+        Error(
+            'NOTIFICATION_OUTBOX_LEASE (%ss) is not longer than an FCM request may take (%ss).' % (settings.NOTIFICATION_OUTBOX_LEASE, 2 * settings.FCM_TIMEOUT),
+            hint='Raise NOTIFICATION_OUTBOX_LEASE above twice FCM_TIMEOUT (connect and read timeout).',
+            id='core.E004',
+        ),
+    ]
+
+
+@register(Tags.security, deploy=True)
+def check_razorpay_credentials(app_configs, **kwargs):
+    """ Check: Payments need the Razorpay key id and secret, the checkout signature is verified with the secret """
+
+    missing_settings = [name for name in ('RAZORPAY_KEY_ID', 'RAZORPAY_KEY_SECRET') if not getattr(settings, name)]
+
+    if not missing_settings:
+        return []
+
+    return [
+        Error(
+            '%s not set.' % ', '.join(missing_settings),
+            hint='Set PUBLIC_KEY and SECRET_KEY in the environment, every checkout callback is refused without them.',
+            id='core.E005',
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Package imports
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+# Utility imports
+from app.middleware import (
+    MiddlewareChain,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Compare the per-request overhead of the full and the API middleware stacks """
+
+    help = 'Benchmark the per-request overhead of FULL_MIDDLEWARE against API_MIDDLEWARE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--path', default='/api/attendance/current-status/')
+
+    def get_response(self, request):
+        return HttpResponse('{}', content_type='application/json')
+
+    def run_chain(self, chain, requests):
+        start = time.perf_counter()
+
+        for request in requests:
+            for process_view in chain.view_middleware:
+                process_view(request, self.get_response, (), {})
+
+            chain.handler(request)
+
+        return (time.perf_counter() - start) / len(requests)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+
+        chains = {
+            'FULL_MIDDLEWARE': MiddlewareChain(settings.FULL_MIDDLEWARE, self.get_response),
+            'API_MIDDLEWARE': MiddlewareChain(settings.API_MIDDLEWARE, self.get_response),
+        }
+
+        timings = {}
+
+        for name, chain in chains.items():
+            # Warm up, then time fresh requests (middleware caches per-request state on them)
+            self.run_chain(chain, [factory.get(options['path']) for _ in range(100)])
+
+            requests = [factory.get(options['path'], HTTP_AUTHORIZATION='Bearer x') for _ in range(options['requests'])]
+
+            timings[name] = self.run_chain(chain, requests)
+
+            self.stdout.write('%s: %.1f us per request' % (name, timings[name] * 1000000))
+
+        self.stdout.write('Overhead removed: %.1f us per request' % (
+            (timings['FULL_MIDDLEWARE'] - timings['API_MIDDLEWARE']) * 1000000
+        ))
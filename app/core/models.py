@@ -60,6 +60,23 @@ class Role(models.Model):
     name = models.CharField(max_length=255)
 
 
+class RoleMaskField(models.BigIntegerField):
+    """ Field: Bitmask of role IDs (bit n set for role n) """
+
+
+@RoleMaskField.register_lookup
+class HasAnyRoleLookup(models.Lookup):
+    """ Lookup: role_mask__has_any_role=<mask>, true when any bit of the mask is set """
+
+    lookup_name = 'has_any_role'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+
+        return '(%s & %s) <> 0' % (lhs, rhs), lhs_params + rhs_params
+
+
 # Start Super-Admin related models
 class UserManager(BaseUserManager):
     """ Manager: User model """
@@ -90,6 +107,36 @@ class UserManager(BaseUserManager):
         return user
 
 
+class OrganizationScopedManager(models.Manager):
+    """ Manager: Rows of the organization the current request acts for, no rows outside of a request """
+
+    def __init__(self, organization_field, fallback_organization_field=None):
+        super().__init__()
+        self.organization_field = organization_field
+        # Lookup of the organization for rows whose denormalized column is still NULL
+        self.fallback_organization_field = fallback_organization_field
+
+    def get_queryset(self):
+        # Imported here, app.utils imports the models of this module
+        from app.utils import get_current_organization_id
+
+        organization_id = get_current_organization_id()
+
+        if organization_id is None:
+            return super().get_queryset().none()
+
+        # Filters on the local foreign key column, no join
+        organization_filter = models.Q(**{self.organization_field + '_id': organization_id})
+
+        if self.fallback_organization_field is not None:
+            organization_filter |= models.Q(**{
+                self.organization_field + '__isnull': True,
+                self.fallback_organization_field: organization_id,
+            })
+
+        return super().get_queryset().filter(organization_filter)
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """ Model: User """
 
@@ -109,6 +156,12 @@ class User(AbstractBaseUser, PermissionsMixin):
     profile_image=models.ImageField(upload_to=user_image_path, null=True)
     # This field will be used for OTP based logic
     otp_counter = models.IntegerField(default=0, blank=True)
+    # Bumped whenever roles or organization change, access tokens carrying an older value are rejected
+    permissions_version = models.PositiveIntegerField(default=0)
+    # Denormalized from UserRole (see app.roles), filter with role_mask__has_any_role=get_role_mask([...])
+    role_mask = RoleMaskField(default=0)
+    # Low-priority notifications are collected into one digest push instead of one push each
+    notification_digest = models.BooleanField(default=False)
 
     is_active = models.BooleanField(default=True)
 
@@ -127,10 +180,24 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Fields for superuser creation
     REQUIRED_FIELDS = ['first_name', 'last_name', 'email']
 
+    # Written by queryset updates only (app.roles, app.tokens), a full save() of an instance loaded earlier must not put old values back
+    DENORMALIZED_FIELDS = ('role_mask', 'permissions_version')
+
     # String representation of model
     def __str__(self):
         return self.phone
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if update_fields is None and not force_insert and not self._state.adding:
+            deferred_fields = self.get_deferred_fields()
+
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DENORMALIZED_FIELDS and field.attname not in deferred_fields
+            ]
+
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
 
 class UserDetail(models.Model):
     """ Model: UserDetail """
@@ -206,6 +273,10 @@ class EmployeeCategory(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    # Reference managers, org_objects only returns rows of the requesting user's organization
+    objects = models.Manager()
+    org_objects = OrganizationScopedManager('organization')
+
 
 class UserEmployeeCategory(models.Model):
     """ Model: UserEmployeeCategory (Many-To-Many through model) """
@@ -405,6 +476,10 @@ class ServiceCategory(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    # Reference managers, org_objects only returns rows of the requesting user's organization
+    objects = models.Manager()
+    org_objects = OrganizationScopedManager('owner_organization')
+
 
 class ServiceSubCategory(models.Model):
     """ Model: ServiceSubCategory """
@@ -433,6 +508,10 @@ class ServiceSubCategory(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    # Reference managers, org_objects only returns rows of the requesting user's organization
+    objects = models.Manager()
+    org_objects = OrganizationScopedManager('owner_organization')
+
 
 class Service(models.Model):
     """ Model: Service """
@@ -463,6 +542,10 @@ class Service(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    # Reference managers, org_objects only returns rows of the requesting user's organization
+    objects = models.Manager()
+    org_objects = OrganizationScopedManager('owner_organization')
+
 
 class ServiceSlot(models.Model):
     """ Model: ServiceSlot """
@@ -703,6 +786,16 @@ class ServiceRequest(models.Model):
         null=True
     )
 
+    # Copy of service.owner_organization, set on save
+    owner_organization = models.ForeignKey(
+        'Organization',
+        on_delete=models.CASCADE,
+        related_name='owned_service_requests',
+        related_query_name='owned_service_request',
+        null=True,
+        editable=False
+    )
+
     requested_service_slots = models.ManyToManyField(
         'ServiceSlot',
         through='ServiceRequestServiceSlot',
@@ -726,6 +819,39 @@ class ServiceRequest(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    # Reference managers, org_objects only returns rows of the requesting user's organization.
+    # Rows created before owner_organization existed are matched through their service until they are backfilled
+    objects = models.Manager()
+    org_objects = OrganizationScopedManager('owner_organization', 'service__owner_organization_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Service the row was loaded with, save() recomputes the organization when it changes
+        instance._loaded_service_id = instance.__dict__.get('service_id')
+
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Denormalized from the service so org-scoped queries need no join, recomputed when the service changes.
+        # A row loaded without its service (only/defer) keeps its organization, reading it would cost a query
+        service_loaded = 'service_id' not in self.get_deferred_fields()
+
+        if service_loaded and self.service_id is not None and (
+            self.owner_organization_id is None or self.service_id != getattr(self, '_loaded_service_id', None)
+        ):
+            self.owner_organization_id = self.service.owner_organization_id
+
+            update_fields = kwargs.get('update_fields')
+
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'owner_organization'}
+
+        super().save(*args, **kwargs)
+
+        self._loaded_service_id = self.__dict__.get('service_id')
+
 
 class ServiceRequestServiceSlot(models.Model):
     """ Model: ServiceRequestServiceSlot (Many-To-Many through model) """
@@ -768,7 +894,10 @@ class Payment(models.Model):
         FAIL = 'Fail', _('Fail')
 
     # Field declarations
-    order_id = models.CharField(max_length=255)
+    # Blank until the gateway order is created, after the booking transaction has committed
+    order_id = models.CharField(max_length=255, blank=True)
+    # Idempotency key of the gateway order, one order per booking however often its creation is retried
+    receipt = models.CharField(max_length=40, blank=True)
     payment_id = models.CharField(max_length=255, blank=True)
     signature = models.TextField(blank=True)
     amount = models.CharField(max_length=255)
@@ -781,11 +910,63 @@ class Payment(models.Model):
     # Additional field declarations
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Callbacks resolve the payment by its gateway order, payments still waiting for one are left out
+        constraints = [
+            models.UniqueConstraint(
+                fields=['order_id'],
+                condition=~models.Q(order_id=''),
+                name='unique_payment_order_id'
+            ),
+        ]
+        # Keyset scan of pending payments by manage.py reconcile_payments
+        indexes = [
+            models.Index(fields=['payment_status', 'id']),
+        ]
+
+
+class PaymentWebhookEvent(models.Model):
+    """ Model: PaymentWebhookEvent (raw gateway webhook, stored as received and applied by process_payment_webhooks) """
+
+    # ENUM declarations
+    class Outcome(models.TextChoices):
+        SETTLED = 'Settled', _('Settled')
+        NO_CHANGE = 'No change', _('No change')
+        UNKNOWN_ORDER = 'Unknown order', _('Unknown order')
+        IGNORED = 'Ignored', _('Ignored')
+        INVALID = 'Invalid', _('Invalid')
+
+    # Field declarations
+    # Gateway event id, a redelivered event hits the unique index and is stored once
+    event_id = models.CharField(max_length=64, unique=True)
+    # Request body exactly as signed, parsed only by the worker
+    payload = models.TextField()
+
+    outcome = models.CharField(
+        max_length=20,
+        choices=Outcome.choices,
+        blank=True
+    )
+    processed_at = models.DateTimeField(null=True)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Unprocessed events in arrival order, the processed ones stay out of the index
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(processed_at__isnull=True),
+                name='payment_webhook_event_pending'
+            ),
+        ]
 # End Payment model
 
 # Start Notification models
 class PushNotificationToken(models.Model):
-    """ Model: PushNotificationToken """
+    """ Model: PushNotificationToken (one row per device, every device gets the user's notifications) """
 
     # Key declarations
     user = models.ForeignKey(
@@ -802,4 +983,184 @@ class PushNotificationToken(models.Model):
     # Additional field declarations
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # One token per device of a user, the unique index also serves lookups by user
+        unique_together = ('user', 'device_id',)
+        indexes = [
+            models.Index(fields=['current_token']),
+        ]
+
+
+class NotificationOutbox(models.Model):
+    """ Model: NotificationOutbox (written with the business change, delivered by process_notification_outbox) """
+
+    # ENUM declarations
+    class OutboxStatus(models.TextChoices):
+        PENDING = 'Pending', _('Pending')
+        SENT = 'Sent', _('Sent')
+        FAILED = 'Failed', _('Failed')
+
+    class Priority(models.TextChoices):
+        HIGH = 'High', _('High')
+        LOW = 'Low', _('Low')
+
+    # Key declarations
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='outbox_notifications',
+        related_query_name='outbox_notification',
+        null=True,
+        blank=True,
+    )
+
+    # Field declarations
+    # Set instead of user for a broadcast, delivered as one FCM message to the topic
+    topic = models.CharField(max_length=255, blank=True)
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+
+    priority = models.CharField(
+        max_length=20,
+        choices=Priority.choices,
+        default=Priority.HIGH
+    )
+    # Later messages with the same key for the user merge into this row while it waits out its window
+    coalesce_key = models.CharField(max_length=255, blank=True)
+    coalesced_count = models.PositiveIntegerField(default=1)
+
+    status = models.CharField(
+        max_length=20,
+        choices=OutboxStatus.choices,
+        default=OutboxStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    # Pending rows are picked up from this time on, pushed forward while a worker holds them and on retry
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['user', 'coalesce_key', 'status']),
+        ]
+
+
+class Notification(models.Model):
+    """ Model: Notification (inbox entry of a user, written together with the push notification) """
+
+    # Key declarations
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notifications',
+        related_query_name='notification',
+    )
+
+    # Field declarations
+    title = models.CharField(max_length=255)
+    body = models.TextField()
+
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(null=True)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # Serves the inbox pages, newest first and continued from the last id seen
+        indexes = [
+            models.Index(fields=['user', '-id']),
+        ]
+
+
+class NotificationCounter(models.Model):
+    """ Model: NotificationCounter (unread notifications of a user, kept in step with the inbox) """
+
+    # Key declarations
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='notification_counter',
+    )
+
+    # Field declarations
+    unread_count = models.PositiveIntegerField(default=0)
+
+    # Additional field declarations
+    modified = models.DateTimeField(auto_now=True)
+
+
+class NotificationTopicSubscription(models.Model):
+    """ Model: NotificationTopicSubscription (broadcast topics of a user, mirrored to FCM by the outbox worker) """
+
+    # Key declarations
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='notification_topic_subscriptions',
+        related_query_name='notification_topic_subscription',
+    )
+
+    # Field declarations
+    topic = models.CharField(max_length=255)
+
+    # False once the user left the topic, the row is deleted after the devices are unsubscribed
+    is_active = models.BooleanField(default=True)
+    # False until the user's devices are (un)subscribed at FCM
+    is_synced = models.BooleanField(default=False)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('user', 'topic',)
+        indexes = [
+            models.Index(fields=['topic', 'is_active']),
+            models.Index(fields=['is_synced', 'modified']),
+        ]
+
+
+class NotificationTopicUnsubscription(models.Model):
+    """ Model: NotificationTopicUnsubscription (device token to remove from a topic at FCM, queued when the token leaves its user) """
+
+    # Field declarations
+    # The token row is gone by the time the worker runs, so the token itself is kept
+    registration_id = models.CharField(max_length=255)
+    topic = models.CharField(max_length=255)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('registration_id', 'topic',)
+        indexes = [
+            models.Index(fields=['modified']),
+        ]
 # End Notification models
+
+
+# Start OTP models
+class LoginOTP(models.Model):
+    """ Model: LoginOTP (one pending login code per phone) """
+
+    # Field declarations
+    phone = models.CharField(validators=[MinLengthValidator(10)], max_length=10, unique=True)
+    # HMAC of the code, verification is a single lookup on phone and digest
+    otp_digest = models.CharField(max_length=64)
+    expires_at = models.DateTimeField(db_index=True)
+
+    # Additional field declarations
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+# End OTP models
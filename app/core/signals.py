@@ -0,0 +1,201 @@
+# Package imports
+from django.db.models.signals import (
+    post_save,
+    post_delete,
+    m2m_changed,
+)
+from django.db import transaction
+from django.dispatch import receiver
+
+# Model imports
+from app.core.models import (
+    Establishment,
+    EstablishmentGuard,
+    FlatMember,
+    Location,
+    ManagementCommittee,
+    Role,
+    User,
+    UserRole,
+    UserDetail,
+)
+
+# Utility imports
+from app.authentication import (
+    hot_user_cache,
+)
+from app.permissions import (
+    invalidate_user_role_ids,
+)
+from app.roles import (
+    role_registry,
+    sync_user_role_mask,
+)
+from app.utils import (
+    invalidate_current_flat,
+    invalidate_memberships,
+)
+from app.tokens import (
+    bump_permissions_version,
+)
+from app.notifications.topics import (
+    sync_user_topics,
+)
+
+
+# Start User signals
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """ Signal: Drop the hot user and revoke stateless access tokens of deactivated users """
+
+    hot_user_cache.evict(instance.pk)
+
+    # Partial saves that leave is_active alone (e.g. the OTP counter) must not load the deferred field
+    if update_fields is not None and 'is_active' not in update_fields:
+        return
+
+    # Rejects stateless access tokens at once, get_permissions_version only sees is_active once its cache expires
+    if not instance.is_active:
+        bump_permissions_version(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    """ Signal: Drop the hot user and the cached permissions version of deleted users """
+
+    hot_user_cache.evict(instance.pk)
+    bump_permissions_version(instance.pk)
+# End User signals
+
+
+# Start Role signals
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, instance, **kwargs):
+    """ Signal: Reload the role registry after the fixture or an admin edit changes roles """
+
+    role_registry.clear()
+# End Role signals
+
+
+# Start UserRole signals
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def user_role_changed(sender, instance, **kwargs):
+    """ Signal: Drop the cached roles and resync the role mask when a UserRole row is written or removed """
+
+    invalidate_user_role_ids(instance.user_id)
+    bump_permissions_version(instance.user_id)
+    sync_user_role_mask(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserRole)
+def user_role_set_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Signal: Drop the cached roles when roles are changed through User.role (bulk, no post_save) """
+
+    # Clearing a role's users sends no pk_set, remember who held it before the rows go
+    if action == 'pre_clear' and reverse:
+        instance._cleared_user_ids = list(sender.objects.filter(
+            role_id=instance.pk
+        ).values_list(
+            'user_id',
+            flat=True
+        ))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear' and reverse:
+        pk_set = instance.__dict__.pop('_cleared_user_ids', [])
+
+    if not reverse:
+        invalidate_user_role_ids(instance.pk)
+        bump_permissions_version(instance.pk)
+        sync_user_role_mask(instance.pk)
+
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_user_role_ids(user_id)
+            bump_permissions_version(user_id)
+            sync_user_role_mask(user_id)
+# End UserRole signals
+
+
+# Start UserDetail signals
+@receiver(post_save, sender=UserDetail)
+@receiver(post_delete, sender=UserDetail)
+def user_detail_changed(sender, instance, **kwargs):
+    """ Signal: Reject access tokens carrying the old organization claim """
+
+    bump_permissions_version(instance.user_id)
+# End UserDetail signals
+
+
+# Start FlatMember signals
+@receiver(post_save, sender=FlatMember)
+@receiver(post_delete, sender=FlatMember)
+def flat_member_changed(sender, instance, **kwargs):
+    """ Signal: Drop the cached current flat when a membership is switched, deactivated or removed """
+
+    invalidate_current_flat(instance.user_id)
+# End FlatMember signals
+
+
+# Start membership signals
+@receiver(post_save, sender=EstablishmentGuard)
+@receiver(post_delete, sender=EstablishmentGuard)
+@receiver(post_save, sender=ManagementCommittee)
+@receiver(post_delete, sender=ManagementCommittee)
+def membership_changed(sender, instance, **kwargs):
+    """ Signal: Drop the cached memberships when a guard or committee record is written or removed """
+
+    invalidate_memberships(instance.user_id)
+
+
+@receiver(post_save, sender=Establishment)
+def establishment_changed(sender, instance, **kwargs):
+    """ Signal: Drop the cached guards carrying the old establishment (radius, location) """
+
+    guard_user_ids = EstablishmentGuard.objects.filter(
+        establishment=instance
+    ).values_list(
+        'user_id',
+        flat=True
+    )
+
+    for user_id in guard_user_ids:
+        invalidate_memberships(user_id)
+
+
+@receiver(post_save, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    """ Signal: Drop the cached guards carrying the old establishment location """
+
+    guard_user_ids = EstablishmentGuard.objects.filter(
+        establishment__location=instance
+    ).values_list(
+        'user_id',
+        flat=True
+    )
+
+    for user_id in guard_user_ids:
+        invalidate_memberships(user_id)
+# End membership signals
+
+
+# Start notification topic signals
+@receiver(post_save, sender=FlatMember)
+@receiver(post_delete, sender=FlatMember)
+@receiver(post_save, sender=EstablishmentGuard)
+@receiver(post_delete, sender=EstablishmentGuard)
+@receiver(post_save, sender=ManagementCommittee)
+@receiver(post_delete, sender=ManagementCommittee)
+def notification_topics_changed(sender, instance, **kwargs):
+    """ Signal: Recompute the broadcast topics of the user once the membership change is committed """
+
+    user_id = instance.user_id
+
+    # After commit, so a cascade deleting the user does not re-create subscription rows for it
+    transaction.on_commit(lambda: sync_user_topics(user_id))
+# End notification topic signals
@@ -1,3 +1,112 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 
-# Create your tests here.
+# Model imports
+from app.core.models import (
+    Role,
+    User,
+    UserRole,
+)
+
+# Utility imports
+from app.core.checks import (
+    check_api_login_sessions,
+    check_notification_outbox_lease,
+    check_razorpay_credentials,
+)
+from app.permissions import (
+    get_cached_user_role_ids,
+)
+from app.utils import (
+    get_global_values,
+)
+
+
+class RoleCacheTests(TestCase):
+    """ Test: Role IDs cached across requests and dropped when the roles change """
+
+    fixtures = ['role']
+
+    def setUp(self):
+        cache.clear()
+
+        self.user = User.objects.create_user(phone='9000000001', first_name='Role', last_name='Cache')
+
+    def test_role_ids_are_cached(self):
+        self.assertEqual(get_cached_user_role_ids(self.user.pk), [])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_user_role_ids(self.user.pk), [])
+
+    def test_role_ids_are_dropped_when_a_role_is_added(self):
+        get_cached_user_role_ids(self.user.pk)
+
+        UserRole.objects.create(user=self.user, role_id=get_global_values()['RESIDENT_USERS_ROLE_ID'])
+
+        self.assertEqual(get_cached_user_role_ids(self.user.pk), [get_global_values()['RESIDENT_USERS_ROLE_ID']])
+
+    def test_role_ids_are_dropped_when_a_role_is_set(self):
+        get_cached_user_role_ids(self.user.pk)
+
+        self.user.role.set([get_global_values()['EMPLOYEE_ROLE_ID']])
+
+        self.assertEqual(get_cached_user_role_ids(self.user.pk), [get_global_values()['EMPLOYEE_ROLE_ID']])
+
+    def test_role_ids_are_dropped_when_a_role_is_cleared_from_its_users(self):
+        role = Role.objects.get(pk=get_global_values()['EMPLOYEE_ROLE_ID'])
+
+        self.user.role.add(role)
+
+        self.assertEqual(get_cached_user_role_ids(self.user.pk), [role.pk])
+
+        # Reverse clear, the m2m signal carries no pk_set
+        role.role.clear()
+
+        self.assertEqual(get_cached_user_role_ids(self.user.pk), [])
+
+
+class APILoginSessionCheckTests(SimpleTestCase):
+    """ Test: Session login on the API stack is refused without the session middleware """
+
+    @override_settings(SESSIONLESS_API_LOGIN=False, API_MIDDLEWARE=['app.middleware.RequestContextMiddleware'])
+    def test_session_login_without_session_middleware_is_an_error(self):
+        self.assertEqual([error.id for error in check_api_login_sessions(None)], ['core.E003'])
+
+    @override_settings(
+        SESSIONLESS_API_LOGIN=False,
+        API_MIDDLEWARE=[
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'app.middleware.RequestContextMiddleware',
+        ]
+    )
+    def test_session_login_with_session_middleware_passes(self):
+        self.assertEqual(check_api_login_sessions(None), [])
+
+    @override_settings(SESSIONLESS_API_LOGIN=True, API_MIDDLEWARE=['app.middleware.RequestContextMiddleware'])
+    def test_sessionless_login_passes(self):
+        self.assertEqual(check_api_login_sessions(None), [])
+
+
+class NotificationOutboxLeaseCheckTests(SimpleTestCase):
+    """ Test: An outbox lease too short for one FCM request is refused """
+
+    @override_settings(NOTIFICATION_OUTBOX_LEASE=10, FCM_TIMEOUT=5)
+    def test_lease_shorter_than_a_request_is_an_error(self):
+        self.assertEqual([error.id for error in check_notification_outbox_lease(None)], ['core.E004'])
+
+    @override_settings(NOTIFICATION_OUTBOX_LEASE=300, FCM_TIMEOUT=5)
+    def test_lease_longer_than_a_request_passes(self):
+        self.assertEqual(check_notification_outbox_lease(None), [])
+
+
+class RazorpayCredentialsCheckTests(SimpleTestCase):
+    """ Test: Deploying without the Razorpay key id or secret is refused """
+
+    @override_settings(RAZORPAY_KEY_ID='key', RAZORPAY_KEY_SECRET='')
+    def test_missing_secret_is_an_error(self):
+        self.assertEqual([error.id for error in check_razorpay_credentials(None)], ['core.E005'])
+
+    @override_settings(RAZORPAY_KEY_ID='key', RAZORPAY_KEY_SECRET='secret')
+    def test_credentials_pass(self):
+        self.assertEqual(check_razorpay_credentials(None), [])
@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -9,3 +9,16 @@ class CustomPageNumberPagination(PageNumberPagination):
 
     # Set the name of the query param
     page_size_query_param = 'size'
+
+
+class CustomCursorPagination(CursorPagination):
+    """ 
+        Keyset pagination, newest first. 
+        Pages continue from the last id seen, so deep pages cost the same as the first one.
+    """
+
+    ordering = '-id'
+
+    # Set the name of the query param
+    page_size_query_param = 'size'
+    max_page_size = 100
@@ -1,6 +1,6 @@
 # Package imports
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
@@ -27,6 +27,7 @@ from app.utils import (
     get_global_success_messages,
     get_global_error_messages,
     get_global_values,
+    get_user_organization_id,
 )
 from app.permissions import (
     does_permission_exist
@@ -61,7 +62,7 @@ class EmployeeCategoryCreate(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        request.data['organization'] = request.user.user_details.organization.id
+        request.data['organization'] = get_user_organization_id(request)
 
         serializer = EmployeeCategoryCreateSerializer(data=request.data)
 
@@ -88,9 +89,8 @@ class EmployeeCategoryDetail(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        employee_category_queryset = EmployeeCategory.objects.filter(
+        employee_category_queryset = EmployeeCategory.org_objects.filter(
             pk=pk,
-            organization_id=request.user.user_details.organization.id,
             organization__is_active=True
         )
 
@@ -124,7 +124,7 @@ class EmployeeCategoryDetail(GenericAPIView):
         if employee_category == None:    
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
-        request.data['organization'] = request.user.user_details.organization.id
+        request.data['organization'] = get_user_organization_id(request)
 
         serializer = EmployeeCategoryCreateSerializer(employee_category, data=request.data)
 
@@ -163,9 +163,7 @@ class EmployeeCategoryList(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        queryset = EmployeeCategory.objects.filter(
-            organization_id=request.user.user_details.organization.id
-        ).order_by(
+        queryset = EmployeeCategory.org_objects.order_by(
             'name'
         )
 
@@ -193,9 +191,7 @@ class EmployeeCategoryListFilter(ListAPIView):
         if not permissions['allowed']:
             return []
 
-        queryset = EmployeeCategory.objects.filter(
-            organization_id=self.request.user.user_details.organization_id
-        ).order_by(
+        queryset = EmployeeCategory.org_objects.order_by(
             'name'
         )
 
@@ -1,7 +1,7 @@
 # Package imports
 from django.conf import settings
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
@@ -37,7 +37,8 @@ from app.utils import (
     get_response_schema,
     get_global_success_messages,
     get_global_error_messages,
-    get_global_values
+    get_global_values,
+    get_user_organization_id,
 )
 from app.permissions import (
     does_permission_exist
@@ -123,7 +124,7 @@ class EstablishmentCreate(GenericAPIView):
                     address_obj = address_create_serializer.save()
 
                     # Register owner_organization, location and address request
-                    request.data['establishment']['owner_organization'] = request.user.user_details.organization.id
+                    request.data['establishment']['owner_organization'] = get_user_organization_id(request)
                     request.data['establishment']['location'] = location_obj.id
                     request.data['establishment']['address'] = address_obj.id
 
@@ -190,7 +191,7 @@ class EstablishmentDetail(GenericAPIView):
         ).filter(
             pk=pk,
             is_active=True,
-            owner_organization=request.user.user_details.organization
+            owner_organization_id=get_user_organization_id(request)
         )
 
         if establishment_queryset:
@@ -286,7 +287,7 @@ class EstablishmentDetail(GenericAPIView):
                 return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
         # Handle establishment
-        request.data['establishment']['owner_organization'] = request.user.user_details.organization.id
+        request.data['establishment']['owner_organization'] = get_user_organization_id(request)
 
         establishment_create_serializer = EstablishmentCreateSerializer(establishment, data=request.data['establishment'], context={'request': request})
 
@@ -345,7 +346,7 @@ class EstablishmentList(GenericAPIView):
             'establishment_admin__user_details__employee_categories'
         ).filter(
             is_active=True,
-            owner_organization=self.request.user.user_details.organization
+            owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             '-start_date'
         )
@@ -384,7 +385,7 @@ class EstablishmentListFilter(ListAPIView):
             'establishment_admin__user_details__employee_categories'
         ).filter(
             is_active=True,
-            owner_organization=self.request.user.user_details.organization
+            owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             '-start_date'
         )
@@ -0,0 +1,117 @@
+# Package imports
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+# Utility imports
+from app.utils import (
+    current_request,
+    MembershipIndex,
+    OrganizationContext,
+    ResidentContextResolver,
+)
+from app.permissions import (
+    RoleResolver,
+)
+
+
+class RequestContextMiddleware:
+    """ Middleware: Attach request-scoped resolvers and bind the request for utilities """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+
+        # Role IDs are loaded at most once per request, whichever view or helper asks first
+        request.role_resolver = RoleResolver(request)
+
+        # Residents' current flat is resolved once, however many checks in the view need it
+        request.resident_context = ResidentContextResolver()
+
+        # Guard and committee checks share one lookup per user
+        request.membership_index = MembershipIndex()
+
+        # Organization of the requesting user for org-scoped views and managers (org_objects)
+        request.organization_context = OrganizationContext(request)
+
+        token = current_request.set(request)
+
+        try:
+            return self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+
+class MiddlewareChain:
+    """ Middleware: A middleware stack built the way Django's handler builds settings.MIDDLEWARE """
+
+    def __init__(self, middleware_paths, get_response):
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+
+        handler = get_response
+
+        for middleware_path in reversed(middleware_paths):
+            middleware_class = import_string(middleware_path)
+
+            try:
+                middleware = middleware_class(handler)
+            except MiddlewareNotUsed:
+                continue
+
+            if hasattr(middleware, 'process_view'):
+                self.view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_middleware.append(middleware.process_template_response)
+            if hasattr(middleware, 'process_exception'):
+                self.exception_middleware.append(middleware.process_exception)
+
+            handler = convert_exception_to_response(middleware)
+
+        self.handler = handler
+
+
+class RoutingMiddleware:
+    """ Middleware: Send API requests through settings.API_MIDDLEWARE and everything else through settings.FULL_MIDDLEWARE """
+
+    def __init__(self, get_response):
+        self.api_chain = MiddlewareChain(settings.API_MIDDLEWARE, get_response)
+        self.full_chain = MiddlewareChain(settings.FULL_MIDDLEWARE, get_response)
+
+    def get_chain(self, request):
+        if request.path_info.startswith(settings.API_PATH_PREFIXES):
+            return self.api_chain
+
+        return self.full_chain
+
+    def __call__(self, request):
+        return self.get_chain(request).handler(request)
+
+    # Django only calls the hooks of settings.MIDDLEWARE, so the routed stack's hooks (e.g. CSRF's process_view) run from here
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        for process_view in self.get_chain(request).view_middleware:
+            response = process_view(request, view_func, view_args, view_kwargs)
+
+            if response is not None:
+                return response
+
+        return None
+
+    def process_template_response(self, request, response):
+        for process_template_response in self.get_chain(request).template_response_middleware:
+            response = process_template_response(request, response)
+
+        return response
+
+    def process_exception(self, request, exception):
+        for process_exception in self.get_chain(request).exception_middleware:
+            response = process_exception(request, exception)
+
+            if response is not None:
+                return response
+
+        return None
@@ -0,0 +1,137 @@
+# Package imports
+import json
+from functools import lru_cache
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Per-device errors worth retrying, the others will not go away by sending again
+RETRYABLE_DEVICE_ERRORS = frozenset({
+    'Unavailable',
+    'InternalServerError',
+    'DeviceMessageRateExceeded',
+})
+
+# Per-device errors for tokens that will never work again, the token rows are pruned
+INVALID_DEVICE_ERRORS = frozenset({
+    'NotRegistered',
+    'InvalidRegistration',
+})
+
+
+class FCMError(Exception):
+    """ Exception: FCM request failed, retryable when the same request may succeed later """
+
+    def __init__(self, message, retryable):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+@lru_cache(maxsize=None)
+def get_fcm_session():
+    """ FCM: Keep-alive HTTP session of this process, so messages reuse pooled connections """
+
+    session = requests.Session()
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.FCM_POOL_SIZE)
+
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    session.headers.update({
+        'Content-Type': 'application/json',
+        'Authorization': 'key=' + settings.FCM_TOKEN,
+    })
+
+    return session
+
+
+def build_fcm_payload(target, title, body):
+    """ FCM: Legacy HTTP API payload, target is {'registration_ids': [...]} or {'to': '/topics/...'} """
+
+    return {
+        **target,
+        'priority': 'high',
+        'notification': {
+            'body': body,
+            'title': title,
+            'image': '',
+            'icon': settings.FCM_NOTIFICATION_ICON,
+        }
+    }
+
+
+def parse_fcm_results(registration_ids, response_data):
+    """ FCM: Error of every device in the request, None for the devices that got the message """
+
+    results = response_data.get('results') or []
+
+    # A response without per-device results means FCM did not process the devices one by one
+    if len(results) != len(registration_ids):
+        raise FCMError('FCM responded with ' + str(len(results)) + ' results for ' + str(len(registration_ids)) + ' devices', retryable=True)
+
+    return {
+        registration_id: result.get('error')
+        for registration_id, result in zip(registration_ids, results)
+    }
+
+
+def post_fcm_request(url, payload):
+    """ FCM: POST on the pooled session, the response data or FCMError when it was not accepted """
+
+    try:
+        response = get_fcm_session().post(
+            url,
+            data=json.dumps(payload),
+            timeout=settings.FCM_TIMEOUT
+        )
+    except requests.RequestException as e:
+        raise FCMError(str(e), retryable=True)
+
+    # Throttled or unavailable, FCM asks for a retry with backoff
+    if response.status_code == 429 or response.status_code >= 500:
+        raise FCMError('FCM responded with ' + str(response.status_code), retryable=True)
+
+    if response.status_code != 200:
+        raise FCMError('FCM responded with ' + str(response.status_code) + ': ' + response.text[:255], retryable=False)
+
+    return response.json()
+
+
+def send_fcm_message(registration_ids, title, body):
+    """ FCM: Send one multicast message, raising FCMError when it was not accepted """
+
+    if len(registration_ids) > settings.FCM_MULTICAST_LIMIT:
+        raise ValueError('At most ' + str(settings.FCM_MULTICAST_LIMIT) + ' devices per FCM message')
+
+    response_data = post_fcm_request(settings.FCM_URL, build_fcm_payload({'registration_ids': registration_ids}, title, body))
+
+    return parse_fcm_results(registration_ids, response_data)
+
+
+def send_fcm_topic_message(topic, title, body):
+    """ FCM: Send one message to every device subscribed to the topic """
+
+    response_data = post_fcm_request(settings.FCM_URL, build_fcm_payload({'to': '/topics/' + topic}, title, body))
+
+    if 'error' in response_data:
+        raise FCMError(response_data['error'], retryable=response_data['error'] in RETRYABLE_DEVICE_ERRORS)
+
+    return response_data.get('message_id')
+
+
+def update_fcm_topic_subscriptions(topic, registration_ids, subscribe):
+    """ FCM: Subscribe the devices to the topic (or unsubscribe them), up to FCM_MULTICAST_LIMIT per call """
+
+    if len(registration_ids) > settings.FCM_MULTICAST_LIMIT:
+        raise ValueError('At most ' + str(settings.FCM_MULTICAST_LIMIT) + ' devices per FCM topic update')
+
+    url = settings.FCM_IID_URL + (':batchAdd' if subscribe else ':batchRemove')
+
+    response_data = post_fcm_request(url, {
+        'to': '/topics/' + topic,
+        'registration_tokens': registration_ids,
+    })
+
+    return parse_fcm_results(registration_ids, response_data)
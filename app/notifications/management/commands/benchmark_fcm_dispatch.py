@@ -0,0 +1,59 @@
+# Package imports
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+# Utility imports
+from app.notifications.fcm import (
+    get_fcm_session,
+    send_fcm_message,
+)
+from app.notifications.stub import (
+    FCMStubServer,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Compare one request per device with multicast batches against the local FCM stub """
+
+    help = 'Benchmark broadcasting one notification to many devices'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=500)
+        parser.add_argument('--latency', type=float, default=0.02, help='Seconds the stub takes per response')
+
+    def handle(self, *args, **options):
+        server = FCMStubServer(('127.0.0.1', 0), latency=options['latency'])
+        server.start()
+
+        registration_ids = ['device-%d' % i for i in range(options['devices'])]
+
+        try:
+            with override_settings(FCM_URL=server.url):
+                get_fcm_session.cache_clear()
+
+                start = time.perf_counter()
+
+                for registration_id in registration_ids:
+                    send_fcm_message([registration_id], 'Benchmark', 'One request per device')
+
+                single_elapsed = time.perf_counter() - start
+                single_requests = server.request_count
+
+                start = time.perf_counter()
+
+                for offset in range(0, len(registration_ids), settings.FCM_MULTICAST_LIMIT):
+                    send_fcm_message(registration_ids[offset:offset + settings.FCM_MULTICAST_LIMIT], 'Benchmark', 'Multicast')
+
+                multicast_elapsed = time.perf_counter() - start
+                multicast_requests = server.request_count - single_requests
+        finally:
+            get_fcm_session.cache_clear()
+            server.shutdown()
+            server.server_close()
+
+        self.stdout.write('Devices: %d' % options['devices'])
+        self.stdout.write('One per device: %d requests in %.2fs' % (single_requests, single_elapsed))
+        self.stdout.write('Multicast: %d requests in %.2fs' % (multicast_requests, multicast_elapsed))
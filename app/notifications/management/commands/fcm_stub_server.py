@@ -0,0 +1,39 @@
+# Package imports
+from django.core.management.base import BaseCommand
+
+# Utility imports
+from app.notifications.stub import (
+    FCMStubServer,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Run a local FCM stand-in, start the outbox worker with FCM_URL pointing at it """
+
+    help = 'Serve a local stub of the FCM legacy HTTP API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+        parser.add_argument('--invalid-prefix', default='invalid-', help='Tokens starting with it are answered with NotRegistered')
+
+    def handle(self, *args, **options):
+        server = FCMStubServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            invalid_prefix=options['invalid_prefix'],
+            verbose=options['verbosity'] > 1
+        )
+
+        self.stdout.write('FCM stub listening on %s' % server.url)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        self.stdout.write('Requests served: %d' % server.request_count)
+        self.stdout.write('Devices addressed: %d' % server.device_count)
@@ -0,0 +1,50 @@
+# Package imports
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Utility imports
+from app.notifications.utils import (
+    deliver_pending_notifications,
+    sync_topic_subscriptions,
+    sync_topic_unsubscriptions,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Worker delivering queued push notifications in batches (with retries and backoff) and syncing topic subscriptions """
+
+    help = 'Drain the notification outbox (runs until stopped unless --once is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.NOTIFICATION_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once no notification is due')
+
+    def handle(self, *args, **options):
+        delivered = 0
+        synced = 0
+
+        while True:
+            # Tokens that left their user are removed first, then a token that moved is added to its new user's topics.
+            # Subscriptions before sending, so a broadcast queued right after a membership change reaches the new member
+            subscriptions_synced = sync_topic_unsubscriptions(options['batch_size'])
+            subscriptions_synced += sync_topic_subscriptions(options['batch_size'])
+
+            synced += subscriptions_synced
+
+            processed = deliver_pending_notifications(options['batch_size'])
+
+            delivered += processed
+
+            if processed or subscriptions_synced:
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write('Notifications processed: %d' % delivered)
+        self.stdout.write('Topic subscriptions synced: %d' % synced)
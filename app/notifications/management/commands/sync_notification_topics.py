@@ -0,0 +1,44 @@
+# Package imports
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+# Utility imports
+from app.notifications.topics import (
+    sync_user_topics,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Recompute the broadcast topic subscriptions of every user (run once after the migration) """
+
+    help = 'Rebuild the notification topic subscriptions of all users, the outbox worker then mirrors them to FCM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        last_user_id = 0
+        users = 0
+
+        while True:
+            user_ids = list(get_user_model().objects.filter(
+                pk__gt=last_user_id,
+                is_active=True
+            ).order_by(
+                'pk'
+            ).values_list(
+                'pk',
+                flat=True
+            )[:options['batch_size']])
+
+            if not user_ids:
+                break
+
+            last_user_id = user_ids[-1]
+
+            for user_id in user_ids:
+                sync_user_topics(user_id)
+
+            users += len(user_ids)
+
+        self.stdout.write('Users synced: %d' % users)
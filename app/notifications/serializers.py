@@ -0,0 +1,31 @@
+# Package imports
+from rest_framework import serializers
+
+# Model imports
+from app.core.models import (
+    Notification,
+)
+
+
+class NotificationDisplaySerializer(serializers.ModelSerializer):
+    """ Serializer: Notification Display """
+
+    class Meta:
+        model = Notification
+        fields = ('pk', 'title', 'body', 'is_read', 'read_at', 'created',)
+
+
+class NotificationMarkReadSerializer(serializers.Serializer):
+    """ Serializer: Notifications to mark read, all unread ones when the list is left out """
+
+    notifications = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        max_length=1000
+    )
+
+
+class NotificationPreferencesSerializer(serializers.Serializer):
+    """ Serializer: Notification preferences of the logged in user """
+
+    notification_digest = serializers.BooleanField()
@@ -0,0 +1,93 @@
+# Package imports
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FCMStubRequestHandler(BaseHTTPRequestHandler):
+    """ Stub: Answers legacy FCM send and topic subscription requests like FCM does, without delivering anything """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        registration_ids = payload.get('registration_ids') or payload.get('registration_tokens') or []
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        # Instance ID topic (un)subscription, one empty result per device
+        if self.path.endswith((':batchAdd', ':batchRemove')):
+            return self.send_json({'results': [{} for _ in registration_ids]}, len(registration_ids))
+
+        # Topic message, FCM answers with a single message id
+        if 'to' in payload:
+            return self.send_json({'message_id': next(self.server.message_ids)}, 0)
+
+        results = []
+
+        for registration_id in registration_ids:
+            if registration_id.startswith(self.server.invalid_prefix):
+                results.append({'error': 'NotRegistered'})
+            else:
+                results.append({'message_id': '0:stub:' + str(next(self.server.message_ids))})
+
+        failure = sum(1 for result in results if 'error' in result)
+
+        self.send_json({
+            'multicast_id': next(self.server.message_ids),
+            'success': len(results) - failure,
+            'failure': failure,
+            'canonical_ids': 0,
+            'results': results,
+        }, len(registration_ids))
+
+    def send_json(self, data, device_count):
+        body = json.dumps(data).encode()
+
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.device_count += device_count
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FCMStubServer(ThreadingHTTPServer):
+    """ Stub: Local FCM stand-in for tests and benchmarks, point settings.FCM_URL (and FCM_IID_URL at /iid/v1) at it """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0, invalid_prefix='invalid-', verbose=False):
+        super().__init__(address, FCMStubRequestHandler)
+
+        self.latency = latency
+        self.invalid_prefix = invalid_prefix
+        self.verbose = verbose
+
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+        self.request_count = 0
+        self.device_count = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%d/fcm/send' % self.server_address[:2]
+
+    def start(self):
+        """ Serve from a background thread, returns the thread """
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+        return thread
@@ -0,0 +1,235 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+# Model imports
+from app.core.models import (
+    NotificationOutbox,
+    NotificationTopicSubscription,
+    NotificationTopicUnsubscription,
+    PushNotificationToken,
+    User,
+)
+
+# Utility imports
+from app.notifications.fcm import (
+    FCMError,
+)
+from app.notifications.utils import (
+    DIGEST_COALESCE_KEY,
+    claim_pending_notifications,
+    coalesce_notifications,
+    deliver_pending_notifications,
+    get_digest_body,
+    get_unread_notification_count,
+    increment_unread_counts,
+    sync_topic_subscriptions,
+    sync_topic_unsubscriptions,
+)
+from app.utils import (
+    save_current_token,
+)
+
+
+class NotificationOutboxLeaseTests(TestCase):
+    """ Test: Outbox rows are leased to one worker and handed back when they could not be sent in time """
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone='9000000010', first_name='Outbox', last_name='Lease')
+
+        PushNotificationToken.objects.create(user=self.user, device_id='device', current_token='token')
+
+        self.outbox_notification = NotificationOutbox.objects.create(
+            user=self.user,
+            title='Title',
+            body='Body',
+            next_attempt_at=timezone.now()
+        )
+
+    def test_claimed_notifications_are_skipped_by_other_workers(self):
+        self.assertEqual(claim_pending_notifications(10), [self.outbox_notification])
+        self.assertEqual(claim_pending_notifications(10), [])
+
+        self.outbox_notification.refresh_from_db()
+
+        self.assertEqual(self.outbox_notification.attempts, 1)
+        self.assertGreater(self.outbox_notification.next_attempt_at, timezone.now() + timedelta(seconds=settings.NOTIFICATION_OUTBOX_LEASE - 60))
+
+    @mock.patch('app.notifications.utils.send_fcm_message', return_value={'token': None})
+    def test_delivered_notification_is_sent(self, send_fcm_message):
+        self.assertEqual(deliver_pending_notifications(10), 1)
+
+        self.outbox_notification.refresh_from_db()
+
+        self.assertEqual(self.outbox_notification.status, NotificationOutbox.OutboxStatus.SENT)
+        send_fcm_message.assert_called_once_with(['token'], 'Title', 'Body')
+
+    @mock.patch('app.notifications.utils.send_fcm_message', side_effect=FCMError('FCM responded with 503', retryable=True))
+    def test_retryable_error_is_retried_later(self, send_fcm_message):
+        deliver_pending_notifications(10)
+
+        self.outbox_notification.refresh_from_db()
+
+        self.assertEqual(self.outbox_notification.status, NotificationOutbox.OutboxStatus.PENDING)
+        self.assertEqual(self.outbox_notification.attempts, 1)
+        self.assertGreater(self.outbox_notification.next_attempt_at, timezone.now())
+
+    @override_settings(NOTIFICATION_OUTBOX_LEASE=10, FCM_TIMEOUT=5)
+    @mock.patch('app.notifications.utils.send_fcm_message')
+    def test_notifications_not_sent_within_the_lease_are_handed_back(self, send_fcm_message):
+        # No time is left for a request once the lease is taken
+        deliver_pending_notifications(10)
+
+        send_fcm_message.assert_not_called()
+
+        self.outbox_notification.refresh_from_db()
+
+        self.assertEqual(self.outbox_notification.status, NotificationOutbox.OutboxStatus.PENDING)
+        self.assertEqual(self.outbox_notification.attempts, 0)
+        self.assertLessEqual(self.outbox_notification.next_attempt_at, timezone.now())
+
+
+class UnreadCountTests(TestCase):
+    """ Test: Unread counters are created on first use and counted once per user """
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(phone='9000000011', first_name='Unread', last_name='First'),
+            User.objects.create_user(phone='9000000012', first_name='Unread', last_name='Second'),
+        ]
+
+    def test_counters_are_incremented_for_unsorted_and_repeated_ids(self):
+        user_ids = [self.users[1].pk, self.users[0].pk, self.users[1].pk]
+
+        increment_unread_counts(user_ids)
+        increment_unread_counts(user_ids)
+
+        self.assertEqual([get_unread_notification_count(user.pk) for user in self.users], [2, 2])
+
+
+class TokenTopicUnsubscriptionTests(TestCase):
+    """ Test: A device token that moves to another user leaves the previous user's topics """
+
+    topic = 'establishment-1-residents'
+
+    def setUp(self):
+        self.previous_user = User.objects.create_user(phone='9000000013', first_name='Previous', last_name='Owner')
+        self.user = User.objects.create_user(phone='9000000014', first_name='New', last_name='Owner')
+
+        NotificationTopicSubscription.objects.create(user=self.previous_user, topic=self.topic, is_synced=True)
+
+        save_current_token(self.previous_user, 'token', 'device')
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions')
+    def test_moved_token_is_removed_from_the_previous_topics(self, update_fcm_topic_subscriptions):
+        save_current_token(self.user, 'token', 'device')
+
+        self.assertFalse(PushNotificationToken.objects.filter(user=self.previous_user).exists())
+        self.assertTrue(NotificationTopicUnsubscription.objects.filter(registration_id='token', topic=self.topic).exists())
+
+        self.assertEqual(sync_topic_unsubscriptions(10), 1)
+
+        update_fcm_topic_subscriptions.assert_called_once_with(self.topic, ['token'], False)
+        self.assertFalse(NotificationTopicUnsubscription.objects.exists())
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions')
+    def test_moved_token_keeps_a_topic_of_the_new_user(self, update_fcm_topic_subscriptions):
+        NotificationTopicSubscription.objects.create(user=self.user, topic=self.topic, is_synced=True)
+
+        save_current_token(self.user, 'token', 'device')
+
+        self.assertEqual(sync_topic_unsubscriptions(10), 1)
+
+        update_fcm_topic_subscriptions.assert_not_called()
+        self.assertFalse(NotificationTopicUnsubscription.objects.exists())
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions', side_effect=FCMError('FCM responded with 503', retryable=True))
+    def test_failed_removal_stays_queued(self, update_fcm_topic_subscriptions):
+        save_current_token(self.user, 'token', 'device')
+
+        self.assertEqual(sync_topic_unsubscriptions(10), 0)
+        self.assertTrue(NotificationTopicUnsubscription.objects.filter(registration_id='token', topic=self.topic).exists())
+
+
+class NotificationDigestTests(TestCase):
+    """ Test: Low-priority messages merge into one digest push of bounded size """
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone='9000000015', first_name='Digest', last_name='User')
+
+    def coalesce(self, body):
+        coalesce_notifications([self.user.pk], DIGEST_COALESCE_KEY, 'Title', body, NotificationOutbox.Priority.LOW, settings.NOTIFICATION_DIGEST_WINDOW, digest=True)
+
+    def test_digest_counts_every_message_and_keeps_the_latest(self):
+        for number in range(1, 21):
+            self.coalesce('Message %d' % number)
+
+        outbox_notification = NotificationOutbox.objects.get(user=self.user)
+
+        self.assertEqual(outbox_notification.coalesced_count, 20)
+        self.assertEqual(outbox_notification.title, '20 new updates.')
+        self.assertEqual(
+            outbox_notification.body.split('\n'),
+            ['Message %d' % number for number in range(21 - settings.NOTIFICATION_DIGEST_LINES, 21)]
+        )
+
+    @override_settings(NOTIFICATION_DIGEST_LINES=5, NOTIFICATION_DIGEST_MAX_BYTES=20)
+    def test_digest_body_is_cut_to_the_byte_limit(self):
+        self.assertEqual(get_digest_body('An older message', 'Newest'), 'Newest')
+        self.assertEqual(get_digest_body('Older', 'a' * 30), 'a' * 20)
+
+        # Multi-byte characters are never split
+        self.assertEqual(get_digest_body('Older', '\u20b9' * 10), '\u20b9' * 6)
+
+
+class TopicSyncDeviceErrorTests(TestCase):
+    """ Test: Devices FCM reports as failed in a topic update are retried, dead ones are pruned """
+
+    topic = 'establishment-1-residents'
+
+    def setUp(self):
+        self.user = User.objects.create_user(phone='9000000016', first_name='Topic', last_name='Sync')
+
+        PushNotificationToken.objects.create(user=self.user, device_id='first', current_token='first_token')
+        PushNotificationToken.objects.create(user=self.user, device_id='second', current_token='second_token')
+
+        self.subscription = NotificationTopicSubscription.objects.create(user=self.user, topic=self.topic)
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions', return_value={'first_token': None, 'second_token': 'Unavailable'})
+    def test_subscription_with_a_retryable_device_error_stays_queued(self, update_fcm_topic_subscriptions):
+        self.assertEqual(sync_topic_subscriptions(10), 0)
+
+        self.subscription.refresh_from_db()
+
+        self.assertFalse(self.subscription.is_synced)
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions', return_value={'first_token': None, 'second_token': 'NotRegistered'})
+    def test_subscription_with_a_dead_device_is_synced_and_the_token_pruned(self, update_fcm_topic_subscriptions):
+        self.assertEqual(sync_topic_subscriptions(10), 1)
+
+        self.subscription.refresh_from_db()
+
+        self.assertTrue(self.subscription.is_synced)
+        self.assertEqual(
+            list(PushNotificationToken.objects.filter(user=self.user).values_list('current_token', flat=True)),
+            ['first_token']
+        )
+
+    @mock.patch('app.notifications.utils.update_fcm_topic_subscriptions', return_value={'first_token': 'Unavailable', 'second_token': 'NotRegistered'})
+    def test_unsubscriptions_with_device_errors(self, update_fcm_topic_subscriptions):
+        self.subscription.delete()
+
+        for registration_id in ('first_token', 'second_token'):
+            NotificationTopicUnsubscription.objects.create(registration_id=registration_id, topic=self.topic)
+
+        self.assertEqual(sync_topic_unsubscriptions(10), 1)
+
+        # The retryable one stays queued, the dead token is pruned and its removal is done
+        self.assertEqual(
+            list(NotificationTopicUnsubscription.objects.values_list('registration_id', flat=True)),
+            ['first_token']
+        )
+        self.assertFalse(PushNotificationToken.objects.filter(current_token='second_token').exists())
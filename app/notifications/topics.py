@@ -0,0 +1,157 @@
+# Package imports
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+# Model imports
+from app.core.models import (
+    EstablishmentGuard,
+    FlatMember,
+    ManagementCommittee,
+    NotificationTopicSubscription,
+    NotificationTopicUnsubscription,
+)
+
+# Audiences of an establishment, each one a broadcast topic
+RESIDENTS_AUDIENCE = 'residents'
+GUARDS_AUDIENCE = 'guards'
+MANAGEMENT_COMMITTEE_AUDIENCE = 'committee'
+
+
+def get_establishment_topic(establishment_id, audience):
+    """ Topic: Name of the broadcast topic of an audience in the establishment """
+
+    return 'establishment-%d-%s' % (int(establishment_id), audience)
+
+
+def get_user_topics(user_id):
+    """ Topic: Broadcast topics the user belongs to, from the active flat, guard and committee records """
+
+    topics = set()
+
+    for establishment_id in FlatMember.objects.filter(
+        user_id=user_id,
+        is_active=True
+    ).values_list(
+        'flat__building__establishment_id',
+        flat=True
+    ):
+        topics.add(get_establishment_topic(establishment_id, RESIDENTS_AUDIENCE))
+
+    for establishment_id in EstablishmentGuard.objects.filter(
+        user_id=user_id,
+        is_active=True
+    ).values_list(
+        'establishment_id',
+        flat=True
+    ):
+        topics.add(get_establishment_topic(establishment_id, GUARDS_AUDIENCE))
+
+    for establishment_id in ManagementCommittee.objects.filter(
+        user_id=user_id,
+        is_active=True
+    ).values_list(
+        'establishment_id',
+        flat=True
+    ):
+        topics.add(get_establishment_topic(establishment_id, MANAGEMENT_COMMITTEE_AUDIENCE))
+
+    return topics
+
+
+def sync_user_topics(user_id):
+    """ Topic: Bring the user's subscription rows in line with their memberships, the worker mirrors them to FCM """
+
+    topics = get_user_topics(user_id)
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        subscribed_topics = set(NotificationTopicSubscription.objects.select_for_update().filter(
+            user_id=user_id,
+            is_active=True
+        ).values_list(
+            'topic',
+            flat=True
+        ))
+
+        joined_topics = topics - subscribed_topics
+        left_topics = subscribed_topics - topics
+
+        if joined_topics:
+            # Also revives a row the user left before the worker got to unsubscribe it
+            NotificationTopicSubscription.objects.bulk_create(
+                [
+                    NotificationTopicSubscription(
+                        user_id=user_id,
+                        topic=topic,
+                        is_active=True,
+                        is_synced=False
+                    )
+                    for topic in joined_topics
+                ],
+                update_conflicts=True,
+                unique_fields=['user', 'topic'],
+                update_fields=['is_active', 'is_synced', 'modified'],
+            )
+
+        if left_topics:
+            NotificationTopicSubscription.objects.filter(
+                user_id=user_id,
+                topic__in=left_topics
+            ).update(
+                is_active=False,
+                is_synced=False,
+                modified=now
+            )
+
+    return topics
+
+
+def resync_user_devices(user_id):
+    """ Topic: Subscribe the user's devices again, called when the user registers a new device token """
+
+    NotificationTopicSubscription.objects.filter(
+        user_id=user_id,
+        is_active=True
+    ).update(
+        is_synced=False,
+        modified=timezone.now()
+    )
+
+
+def queue_token_unsubscriptions(push_notification_tokens):
+    """ Topic: Queue the removal of the tokens from their users' topics, called before the token rows are deleted """
+
+    user_tokens = defaultdict(set)
+
+    for user_id, current_token in push_notification_tokens.exclude(
+        current_token=''
+    ).values_list(
+        'user_id',
+        'current_token'
+    ):
+        user_tokens[user_id].add(current_token)
+
+    if not user_tokens:
+        return 0
+
+    # Every topic the user has a row for, a left topic may not have been removed from the device yet
+    unsubscriptions = [
+        NotificationTopicUnsubscription(
+            registration_id=current_token,
+            topic=topic
+        )
+        for user_id, topic in NotificationTopicSubscription.objects.filter(
+            user_id__in=user_tokens
+        ).values_list(
+            'user_id',
+            'topic'
+        )
+        for current_token in user_tokens[user_id]
+    ]
+
+    NotificationTopicUnsubscription.objects.bulk_create(unsubscriptions, ignore_conflicts=True)
+
+    return len(unsubscriptions)
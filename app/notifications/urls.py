@@ -0,0 +1,14 @@
+from django.urls import path
+from app.notifications.views import (
+    NotificationList,
+    NotificationUnreadCount,
+    NotificationMarkRead,
+    NotificationPreferences,
+)
+
+urlpatterns = [
+    path('list/', NotificationList.as_view(), name='notification-list'),
+    path('unread-count/', NotificationUnreadCount.as_view(), name='notification-unread-count'),
+    path('mark-read/', NotificationMarkRead.as_view(), name='notification-mark-read'),
+    path('preferences/', NotificationPreferences.as_view(), name='notification-preferences'),
+]
@@ -0,0 +1,661 @@
+# Package imports
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+# Model imports
+from app.core.models import (
+    Notification,
+    NotificationCounter,
+    NotificationOutbox,
+    NotificationTopicSubscription,
+    NotificationTopicUnsubscription,
+    PushNotificationToken,
+)
+
+# Utility imports
+from app.notifications.fcm import (
+    INVALID_DEVICE_ERRORS,
+    RETRYABLE_DEVICE_ERRORS,
+    FCMError,
+    send_fcm_message,
+    send_fcm_topic_message,
+    update_fcm_topic_subscriptions,
+)
+from app.notifications.topics import (
+    get_establishment_topic,
+    queue_token_unsubscriptions,
+)
+from app.utils import (
+    get_global_success_messages,
+)
+
+# Coalescing key shared by the low-priority notifications of a digest user
+DIGEST_COALESCE_KEY = 'digest'
+
+
+def get_coalesce_key(instance):
+    """ Utility: Coalescing key of the notifications about one record, e.g. 'servicerequest:42' """
+
+    return '%s:%d' % (instance._meta.model_name, instance.pk)
+
+
+def enqueue_notification(user, title, body, coalesce_key='', priority=NotificationOutbox.Priority.HIGH):
+    """ Utility: Queue a push notification for the user, committed together with the caller's transaction """
+
+    enqueue_notifications([user], title, body, coalesce_key, priority)
+
+
+def enqueue_notifications(recipients, title, body, coalesce_key='', priority=NotificationOutbox.Priority.HIGH):
+    """ Utility: Queue the same push notification for several users (instances or ids) and add it to their inboxes """
+
+    # Ids only, callers pass *_id values so no recipient row is loaded, and a user listed twice is notified once
+    recipient_ids = list(dict.fromkeys(getattr(recipient, 'pk', recipient) for recipient in recipients if recipient is not None))
+
+    if not recipient_ids:
+        return
+
+    with transaction.atomic():
+        # The inbox keeps every message, only the pushes are merged
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=recipient_id,
+                title=title,
+                body=body
+            )
+            for recipient_id in recipient_ids
+        ])
+
+        increment_unread_counts(recipient_ids)
+
+        digest_user_ids = set()
+
+        if priority == NotificationOutbox.Priority.LOW:
+            digest_user_ids = set(get_user_model().objects.filter(
+                pk__in=recipient_ids,
+                notification_digest=True
+            ).values_list(
+                'pk',
+                flat=True
+            ))
+
+        if digest_user_ids:
+            coalesce_notifications(digest_user_ids, DIGEST_COALESCE_KEY, title, body, priority, settings.NOTIFICATION_DIGEST_WINDOW, digest=True)
+
+        recipient_ids = [recipient_id for recipient_id in recipient_ids if recipient_id not in digest_user_ids]
+
+        if coalesce_key:
+            coalesce_notifications(recipient_ids, coalesce_key, title, body, priority, settings.NOTIFICATION_COALESCE_WINDOW)
+
+        else:
+            now = timezone.now()
+
+            NotificationOutbox.objects.bulk_create([
+                NotificationOutbox(
+                    user_id=recipient_id,
+                    title=title,
+                    body=body,
+                    priority=priority,
+                    next_attempt_at=now
+                )
+                for recipient_id in recipient_ids
+            ])
+
+
+def coalesce_notifications(recipient_ids, coalesce_key, title, body, priority, window, digest=False):
+    """ Utility: Merge the message into the recipients' waiting push of the key, queue a push delayed by the window for the others """
+
+    if not recipient_ids:
+        return
+
+    now = timezone.now()
+
+    # Still inside its window and never claimed by a worker (the claim counts an attempt), so it is safe to rewrite.
+    # Locked in user order like the unread counters
+    waiting_notifications = {
+        outbox_notification.user_id: outbox_notification
+        for outbox_notification in NotificationOutbox.objects.select_for_update().filter(
+            user_id__in=recipient_ids,
+            coalesce_key=coalesce_key,
+            status=NotificationOutbox.OutboxStatus.PENDING,
+            attempts=0,
+            next_attempt_at__gt=now
+        ).order_by(
+            'user_id'
+        ).only(
+            'pk',
+            'user_id',
+            'body',
+            'coalesced_count'
+        )
+    }
+
+    # The window is not extended, a steady stream of messages still goes out once per window
+    if digest:
+        # A digest shows how many messages it stands for and the latest of them, it stays within the FCM payload limit
+        for outbox_notification in waiting_notifications.values():
+            outbox_notification.coalesced_count += 1
+            outbox_notification.title = get_global_success_messages()['NOTIFICATION_DIGEST'] % outbox_notification.coalesced_count
+            outbox_notification.body = get_digest_body(outbox_notification.body, body)
+            outbox_notification.modified = now
+
+        NotificationOutbox.objects.bulk_update(
+            waiting_notifications.values(),
+            ['title', 'body', 'coalesced_count', 'modified']
+        )
+
+    elif waiting_notifications:
+        # Newer messages about the same record supersede the older ones (Pending, Approved, Assigned, ...)
+        NotificationOutbox.objects.filter(
+            pk__in=[outbox_notification.pk for outbox_notification in waiting_notifications.values()]
+        ).update(
+            title=title,
+            body=body,
+            coalesced_count=F('coalesced_count') + 1,
+            modified=now
+        )
+
+    NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(
+            user_id=recipient_id,
+            title=title,
+            body=body,
+            priority=priority,
+            coalesce_key=coalesce_key,
+            next_attempt_at=now + timedelta(seconds=window)
+        )
+        for recipient_id in recipient_ids
+        if recipient_id not in waiting_notifications
+    ])
+
+
+def get_digest_body(digest_body, body):
+    """ Utility: Digest body with the message added, the latest NOTIFICATION_DIGEST_LINES lines within NOTIFICATION_DIGEST_MAX_BYTES """
+
+    lines = (digest_body + '\n' + body).split('\n')[-settings.NOTIFICATION_DIGEST_LINES:]
+
+    # Oldest lines go first, newest last
+    while len(lines) > 1 and len('\n'.join(lines).encode()) > settings.NOTIFICATION_DIGEST_MAX_BYTES:
+        lines.pop(0)
+
+    # A single message over the limit is cut, never in the middle of a character
+    return '\n'.join(lines).encode()[:settings.NOTIFICATION_DIGEST_MAX_BYTES].decode(errors='ignore')
+
+
+def increment_unread_counts(user_ids):
+    """ Utility: Add one unread notification to the counters of the users """
+
+    # Rows are written in user order, two transactions notifying overlapping users wait on each other instead of deadlocking
+    user_ids = sorted(set(user_ids))
+
+    with transaction.atomic():
+        # Counter rows are created on first use, the increment itself is a single UPDATE with no read
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True
+        )
+
+        # An UPDATE locks rows in scan order, so they are locked in user order first
+        list(NotificationCounter.objects.select_for_update().filter(
+            user_id__in=user_ids
+        ).order_by(
+            'user_id'
+        ).values_list(
+            'pk',
+            flat=True
+        ))
+
+        NotificationCounter.objects.filter(
+            user_id__in=user_ids
+        ).update(
+            unread_count=F('unread_count') + 1,
+            modified=timezone.now()
+        )
+
+
+def enqueue_topic_notification(topic, title, body):
+    """ Utility: Queue one push notification to the topic and add it to the inbox of every subscribed user """
+
+    with transaction.atomic():
+        recipient_ids = list(NotificationTopicSubscription.objects.filter(
+            topic=topic,
+            is_active=True
+        ).values_list(
+            'user_id',
+            flat=True
+        ))
+
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=recipient_id,
+                title=title,
+                body=body
+            )
+            for recipient_id in recipient_ids
+        ])
+
+        if recipient_ids:
+            increment_unread_counts(recipient_ids)
+
+        return NotificationOutbox.objects.create(
+            topic=topic,
+            title=title,
+            body=body,
+            next_attempt_at=timezone.now()
+        )
+
+
+def broadcast_to_establishment(establishment_id, audience, title, body):
+    """ Utility: Queue a push notification to an audience (residents, guards, committee) of the establishment """
+
+    return enqueue_topic_notification(get_establishment_topic(establishment_id, audience), title, body)
+
+
+def get_unread_notification_count(user_id):
+    """ Utility: Unread notifications of the user, a primary key read of the counter row """
+
+    unread_count = NotificationCounter.objects.filter(
+        user_id=user_id
+    ).values_list(
+        'unread_count',
+        flat=True
+    ).first()
+
+    return unread_count or 0
+
+
+def mark_notifications_read(user_id, notification_ids=None):
+    """ Utility: Mark the user's notifications read (all of them when no ids are given), returns the number marked """
+
+    now = timezone.now()
+
+    notification_queryset = Notification.objects.filter(
+        user_id=user_id,
+        is_read=False
+    )
+
+    if notification_ids is not None:
+        notification_queryset = notification_queryset.filter(
+            pk__in=notification_ids
+        )
+
+    with transaction.atomic():
+        marked = notification_queryset.update(
+            is_read=True,
+            read_at=now,
+            modified=now
+        )
+
+        # Only rows this UPDATE flipped are taken off, concurrent reads and new notifications keep the counter exact
+        if marked:
+            NotificationCounter.objects.filter(
+                user_id=user_id
+            ).update(
+                unread_count=Greatest(F('unread_count') - marked, 0),
+                modified=now
+            )
+
+    return marked
+
+
+def get_retry_delay(attempts):
+    """ Utility: Exponential backoff with jitter for the n-th failed attempt """
+
+    delay = min(
+        settings.NOTIFICATION_OUTBOX_BACKOFF * 2 ** (attempts - 1),
+        settings.NOTIFICATION_OUTBOX_MAX_BACKOFF
+    )
+
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def claim_pending_notifications(batch_size):
+    """ Utility: Lease a batch of due notifications to this worker, other workers skip them meanwhile """
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        outbox_notifications = list(NotificationOutbox.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            status=NotificationOutbox.OutboxStatus.PENDING,
+            next_attempt_at__lte=now
+        ).order_by(
+            'next_attempt_at'
+        )[:batch_size])
+
+        # Rows left behind by a crashed worker become due again once the lease runs out
+        NotificationOutbox.objects.filter(
+            pk__in=[outbox_notification.pk for outbox_notification in outbox_notifications]
+        ).update(
+            attempts=F('attempts') + 1,
+            next_attempt_at=now + timedelta(seconds=settings.NOTIFICATION_OUTBOX_LEASE)
+        )
+
+    # Counted at claim time, so enqueue_notifications never merges into a row that is being sent
+    for outbox_notification in outbox_notifications:
+        outbox_notification.attempts += 1
+
+    return outbox_notifications
+
+
+def group_notification_messages(outbox_notifications, registration_ids):
+    """ Utility: Multicast messages for the notifications, one per payload and chunk of at most FCM_MULTICAST_LIMIT devices """
+
+    # (title, body) -> device -> notifications it delivers, identical notifications reach a device once
+    payload_devices = defaultdict(dict)
+
+    for outbox_notification in outbox_notifications:
+        for registration_id in registration_ids[outbox_notification.user_id]:
+            payload_devices[(outbox_notification.title, outbox_notification.body)].setdefault(registration_id, []).append(outbox_notification)
+
+    for (title, body), devices in payload_devices.items():
+        device_ids = list(devices)
+
+        for offset in range(0, len(device_ids), settings.FCM_MULTICAST_LIMIT):
+            yield title, body, {
+                registration_id: devices[registration_id]
+                for registration_id in device_ids[offset:offset + settings.FCM_MULTICAST_LIMIT]
+            }
+
+
+def prune_push_notification_tokens(registration_ids):
+    """ Utility: Delete the tokens FCM reported as dead, in batches, returns the number of rows deleted """
+
+    registration_ids = list(registration_ids)
+
+    deleted = 0
+
+    for offset in range(0, len(registration_ids), settings.PUSH_TOKEN_PRUNE_BATCH_SIZE):
+        push_notification_tokens = PushNotificationToken.objects.filter(
+            current_token__in=registration_ids[offset:offset + settings.PUSH_TOKEN_PRUNE_BATCH_SIZE]
+        )
+
+        with transaction.atomic():
+            # FCM may report a token unregistered for a while and then accept it again, it leaves the topics with its row
+            queue_token_unsubscriptions(push_notification_tokens)
+
+            batch_deleted, _ = push_notification_tokens.delete()
+
+        deleted += batch_deleted
+
+    return deleted
+
+
+def deliver_pending_notifications(batch_size):
+    """ Utility: Deliver one batch of due notifications, returns the number of notifications processed """
+
+    outbox_notifications = claim_pending_notifications(batch_size)
+
+    if not outbox_notifications:
+        return 0
+
+    # Broadcasts go out as one message per topic, the rest per device of the user
+    topic_notifications = [outbox_notification for outbox_notification in outbox_notifications if outbox_notification.topic]
+    user_notifications = [outbox_notification for outbox_notification in outbox_notifications if not outbox_notification.topic]
+
+    registration_ids = defaultdict(list)
+
+    for user_id, current_token in PushNotificationToken.objects.filter(
+        user_id__in={outbox_notification.user_id for outbox_notification in user_notifications}
+    ).exclude(
+        current_token=''
+    ).values_list(
+        'user_id',
+        'current_token'
+    ):
+        registration_ids[user_id].append(current_token)
+
+    delivered = set()
+    errors = {}
+    invalid_registration_ids = set()
+
+    # Sending stops while the lease still holds, or another worker could claim and send the same rows.
+    # A request started before the deadline takes at most the connect and the read timeout
+    send_deadline = time.monotonic() + settings.NOTIFICATION_OUTBOX_LEASE - 2 * settings.FCM_TIMEOUT
+
+    def record_error(outbox_notification, error):
+        # A retryable error wins, the notification is retried when any of its devices may still get it
+        if outbox_notification.pk not in errors or not errors[outbox_notification.pk].retryable:
+            errors[outbox_notification.pk] = error
+
+    for outbox_notification in topic_notifications:
+        if time.monotonic() >= send_deadline:
+            break
+
+        try:
+            send_fcm_topic_message(outbox_notification.topic, outbox_notification.title, outbox_notification.body)
+
+            delivered.add(outbox_notification.pk)
+
+        except FCMError as e:
+            record_error(outbox_notification, e)
+
+    for title, body, devices in group_notification_messages(user_notifications, registration_ids):
+        if time.monotonic() >= send_deadline:
+            break
+
+        try:
+            device_errors = send_fcm_message(list(devices), title, body)
+
+        except FCMError as e:
+            for device_notifications in devices.values():
+                for outbox_notification in device_notifications:
+                    record_error(outbox_notification, e)
+            continue
+
+        for registration_id, device_error in device_errors.items():
+            for outbox_notification in devices[registration_id]:
+                if device_error is None:
+                    delivered.add(outbox_notification.pk)
+                else:
+                    record_error(outbox_notification, FCMError(device_error, retryable=device_error in RETRYABLE_DEVICE_ERRORS))
+
+            if device_error in INVALID_DEVICE_ERRORS:
+                invalid_registration_ids.add(registration_id)
+
+    # Stop paying for sends to uninstalled apps and rotated tokens
+    if invalid_registration_ids:
+        prune_push_notification_tokens(invalid_registration_ids)
+
+    now = timezone.now()
+
+    for outbox_notification in outbox_notifications:
+        outbox_notification.modified = now
+
+        if not outbox_notification.topic and not registration_ids[outbox_notification.user_id]:
+            outbox_notification.status = NotificationOutbox.OutboxStatus.FAILED
+            outbox_notification.last_error = 'No push notification token'
+
+        # Reaching any one of the user's devices counts as sent, retrying would duplicate it on the others
+        elif outbox_notification.pk in delivered:
+            outbox_notification.status = NotificationOutbox.OutboxStatus.SENT
+            outbox_notification.sent_at = now
+            outbox_notification.last_error = ''
+
+        # Not sent before the deadline, due again right away and the attempt is given back
+        elif outbox_notification.pk not in errors:
+            outbox_notification.attempts -= 1
+            outbox_notification.next_attempt_at = now
+
+        else:
+            error = errors[outbox_notification.pk]
+
+            outbox_notification.last_error = str(error)
+
+            if error.retryable and outbox_notification.attempts < settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS:
+                outbox_notification.next_attempt_at = now + get_retry_delay(outbox_notification.attempts)
+            else:
+                outbox_notification.status = NotificationOutbox.OutboxStatus.FAILED
+
+    NotificationOutbox.objects.bulk_update(
+        outbox_notifications,
+        ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at', 'modified']
+    )
+
+    return len(outbox_notifications)
+
+
+def sync_topic_subscriptions(batch_size):
+    """ Utility: Mirror one batch of changed topic subscriptions to FCM, returns the number of subscriptions synced """
+
+    # No row locks while FCM is called, membership changes are never blocked by the worker
+    subscriptions = list(NotificationTopicSubscription.objects.filter(
+        is_synced=False
+    ).order_by(
+        'modified'
+    )[:batch_size])
+
+    if not subscriptions:
+        return 0
+
+    registration_ids = defaultdict(list)
+
+    for user_id, current_token in PushNotificationToken.objects.filter(
+        user_id__in={subscription.user_id for subscription in subscriptions}
+    ).exclude(
+        current_token=''
+    ).values_list(
+        'user_id',
+        'current_token'
+    ):
+        registration_ids[user_id].append(current_token)
+
+    # (topic, subscribe) -> devices, one batchAdd / batchRemove call per topic and chunk
+    topic_devices = defaultdict(dict)
+
+    for subscription in subscriptions:
+        for registration_id in registration_ids[subscription.user_id]:
+            topic_devices[(subscription.topic, subscription.is_active)].setdefault(registration_id, []).append(subscription)
+
+    failed = set()
+    invalid_registration_ids = set()
+
+    for (topic, subscribe), devices in topic_devices.items():
+        device_ids = list(devices)
+
+        for offset in range(0, len(device_ids), settings.FCM_MULTICAST_LIMIT):
+            chunk = device_ids[offset:offset + settings.FCM_MULTICAST_LIMIT]
+
+            try:
+                device_errors = update_fcm_topic_subscriptions(topic, chunk, subscribe)
+            except FCMError:
+                for registration_id in chunk:
+                    failed.update(subscription.pk for subscription in devices[registration_id])
+                continue
+
+            for registration_id, device_error in device_errors.items():
+                # The subscription is retried for all of the user's devices when any one of them may still make it
+                if device_error in RETRYABLE_DEVICE_ERRORS:
+                    failed.update(subscription.pk for subscription in devices[registration_id])
+
+                elif device_error in INVALID_DEVICE_ERRORS:
+                    invalid_registration_ids.add(registration_id)
+
+    # Dead tokens are dropped here too, the next broadcast would only report them again
+    if invalid_registration_ids:
+        prune_push_notification_tokens(invalid_registration_ids)
+
+    synced = [subscription for subscription in subscriptions if subscription.pk not in failed]
+
+    def unchanged(subscriptions):
+        # Rows rewritten by sync_user_topics meanwhile carry a newer modified and stay queued
+        condition = Q(pk__in=[])
+
+        for subscription in subscriptions:
+            condition |= Q(pk=subscription.pk, modified=subscription.modified)
+
+        return NotificationTopicSubscription.objects.filter(condition)
+
+    with transaction.atomic():
+        # Left topics are done once unsubscribed, joined ones stay as the broadcast recipients
+        unchanged([subscription for subscription in synced if not subscription.is_active]).delete()
+
+        unchanged([subscription for subscription in synced if subscription.is_active]).update(
+            is_synced=True
+        )
+
+        # Failed ones go to the back of the queue and are retried on a later batch
+        unchanged([subscription for subscription in subscriptions if subscription.pk in failed]).update(
+            modified=timezone.now()
+        )
+
+    return len(synced)
+
+
+def sync_topic_unsubscriptions(batch_size):
+    """ Utility: Remove one batch of queued device tokens from their topics at FCM, returns the number of removals done """
+
+    # No row locks while FCM is called, same as the subscriptions
+    unsubscriptions = list(NotificationTopicUnsubscription.objects.order_by(
+        'modified'
+    )[:batch_size])
+
+    if not unsubscriptions:
+        return 0
+
+    # A token that moved to a user of the same topic stays subscribed, the new user is not unsubscribed by the old one
+    current_topics = set(NotificationTopicSubscription.objects.filter(
+        is_active=True,
+        user__push_notification_record__current_token__in={unsubscription.registration_id for unsubscription in unsubscriptions}
+    ).values_list(
+        'user__push_notification_record__current_token',
+        'topic'
+    ))
+
+    # topic -> device -> its queued row, one batchRemove call per topic and chunk
+    topic_devices = defaultdict(dict)
+
+    for unsubscription in unsubscriptions:
+        if (unsubscription.registration_id, unsubscription.topic) not in current_topics:
+            topic_devices[unsubscription.topic][unsubscription.registration_id] = unsubscription
+
+    failed = set()
+    invalid_registration_ids = set()
+
+    for topic, devices in topic_devices.items():
+        device_ids = list(devices)
+
+        for offset in range(0, len(device_ids), settings.FCM_MULTICAST_LIMIT):
+            chunk = device_ids[offset:offset + settings.FCM_MULTICAST_LIMIT]
+
+            try:
+                device_errors = update_fcm_topic_subscriptions(topic, chunk, False)
+            except FCMError:
+                failed.update(devices[registration_id].pk for registration_id in chunk)
+                continue
+
+            for registration_id, device_error in device_errors.items():
+                if device_error in RETRYABLE_DEVICE_ERRORS:
+                    failed.add(devices[registration_id].pk)
+
+                elif device_error in INVALID_DEVICE_ERRORS:
+                    invalid_registration_ids.add(registration_id)
+
+    # A dead token gets no broadcasts, its row is done and a user it moved to stops paying for it
+    if invalid_registration_ids:
+        prune_push_notification_tokens(invalid_registration_ids)
+
+    synced = [unsubscription.pk for unsubscription in unsubscriptions if unsubscription.pk not in failed]
+
+    with transaction.atomic():
+        NotificationTopicUnsubscription.objects.filter(
+            pk__in=synced
+        ).delete()
+
+        # Failed ones go to the back of the queue and are retried on a later batch
+        NotificationTopicUnsubscription.objects.filter(
+            pk__in=failed
+        ).update(
+            modified=timezone.now()
+        )
+
+    return len(synced)
@@ -0,0 +1,147 @@
+# Package imports
+from django.contrib.auth import get_user_model
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.generics import GenericAPIView, ListAPIView
+from rest_framework.permissions import IsAuthenticated
+
+from app.authentication import JWTAuthentication
+from app.core.views import (
+    CustomCursorPagination,
+)
+
+# Model imports
+from app.core.models import (
+    Notification,
+)
+
+# Serializer imports
+from app.notifications.serializers import (
+    NotificationDisplaySerializer,
+    NotificationMarkReadSerializer,
+    NotificationPreferencesSerializer,
+)
+
+# Utility imports
+from app.utils import (
+    get_response_schema,
+    get_global_error_messages,
+    get_global_success_messages,
+)
+from app.notifications.utils import (
+    get_unread_notification_count,
+    mark_notifications_read,
+)
+
+
+class NotificationList(ListAPIView):
+    """ View: List Notifications of the logged in user (newest first, cursor paginated) """
+
+    serializer_class = NotificationDisplaySerializer
+    pagination_class = CustomCursorPagination
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+
+        queryset = Notification.objects.filter(
+            user_id=self.request.user.id
+        )
+
+        if self.request.query_params.get('unread') == 'true':
+            queryset = queryset.filter(
+                is_read=False
+            )
+
+        return queryset
+
+
+class NotificationUnreadCount(GenericAPIView):
+    """ View: Unread Notification count (badge) of the logged in user """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+
+        return_data = {
+            'unread_count': get_unread_notification_count(request.user.id)
+        }
+
+        return get_response_schema(return_data, get_global_success_messages()['RECORD_RETRIEVED'], status.HTTP_200_OK)
+
+
+class NotificationMarkRead(GenericAPIView):
+    """ View: Mark Notifications of the logged in user as read """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'notifications': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_INTEGER)),
+            }
+        )
+    )
+    def patch(self, request):
+
+        serializer = NotificationMarkReadSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return get_response_schema(serializer.errors, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+
+        marked = mark_notifications_read(request.user.id, serializer.validated_data.get('notifications'))
+
+        return_data = {
+            'marked': marked,
+            'unread_count': get_unread_notification_count(request.user.id)
+        }
+
+        return get_response_schema(return_data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
+
+
+class NotificationPreferences(GenericAPIView):
+    """ View: Notification preferences (digest of low-priority notifications) of the logged in user """
+
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self, request):
+        return get_user_model().objects.only(
+            'pk',
+            'notification_digest'
+        ).get(
+            pk=request.user.id
+        )
+
+    def get(self, request):
+
+        serializer = NotificationPreferencesSerializer(self.get_object(request))
+
+        return get_response_schema(serializer.data, get_global_success_messages()['RECORD_RETRIEVED'], status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'notification_digest': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+            }
+        )
+    )
+    def patch(self, request):
+
+        serializer = NotificationPreferencesSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return get_response_schema(serializer.errors, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+
+        user = self.get_object(request)
+
+        user.notification_digest = serializer.validated_data['notification_digest']
+        user.save(update_fields=['notification_digest', 'modified'])
+
+        return get_response_schema(NotificationPreferencesSerializer(user).data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
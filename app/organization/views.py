@@ -1,7 +1,7 @@
 # Package imports
 from django.conf import settings
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
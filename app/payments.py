@@ -0,0 +1,337 @@
+# Package imports
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+
+import razorpay
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from razorpay.errors import BadRequestError, GatewayError, ServerError
+from requests.adapters import HTTPAdapter
+
+# Model imports
+from app.core.models import (
+    Payment,
+    PaymentWebhookEvent,
+    ServiceRequest,
+)
+
+# Utility imports
+from app.utils import (
+    get_global_values,
+)
+
+
+# Webhook events that report a captured payment, the others leave the booking alone
+SETTLING_WEBHOOK_EVENTS = frozenset({
+    'payment.captured',
+    'order.paid',
+})
+
+
+class PaymentGatewayError(Exception):
+    """ Exception: The payment gateway could not be reached or refused the call """
+
+
+class CircuitBreaker:
+    """ Payment: Fail fast while the gateway is down, let one trial call through after the cooldown """
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+
+            # Half open, this caller makes the trial call and the others keep failing fast until it reports back
+            self.opened_at = time.monotonic()
+
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class PaymentGateway:
+    """ Payment: Razorpay client of this process, pooled connections, timeouts, retries and a circuit breaker """
+
+    # The request never reached the gateway or the gateway itself failed, safe to send again when idempotent
+    RETRYABLE_ERRORS = (
+        requests.ConnectionError,
+        GatewayError,
+        ServerError,
+        ValueError, # Error page that is not JSON, from a proxy in front of the gateway
+    )
+
+    def __init__(self):
+        session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.PAYMENT_GATEWAY_POOL_SIZE)
+
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        self.client = razorpay.Client(
+            session=session,
+            auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+            base_url=settings.RAZORPAY_BASE_URL
+        )
+
+        self.breaker = CircuitBreaker(settings.PAYMENT_GATEWAY_FAILURE_THRESHOLD, settings.PAYMENT_GATEWAY_COOLDOWN)
+
+    def call(self, method, *args, idempotent=False):
+        """ Call a client method, only idempotent calls are retried and a read timeout never is """
+
+        if not self.breaker.allow_request():
+            raise PaymentGatewayError('Payment gateway is unavailable')
+
+        attempts = 1 + (settings.PAYMENT_GATEWAY_RETRIES if idempotent else 0)
+
+        for attempt in range(attempts):
+            if attempt:
+                # Full jitter, workers retrying together do not hit a recovering gateway together
+                time.sleep(random.uniform(0, settings.PAYMENT_GATEWAY_BACKOFF * 2 ** (attempt - 1)))
+
+            try:
+                result = method(*args, timeout=settings.PAYMENT_GATEWAY_TIMEOUT)
+
+            except BadRequestError as e:
+                # The gateway is up and refused the call, it would refuse it again
+                self.breaker.record_success()
+                raise PaymentGatewayError(str(e)) from e
+
+            except self.RETRYABLE_ERRORS as e:
+                error = e
+
+            except Exception as e:
+                error = e
+                break
+
+            else:
+                self.breaker.record_success()
+                return result
+
+        self.breaker.record_failure()
+
+        raise PaymentGatewayError(str(error)) from error
+
+    def create_order(self, data):
+        """ Create an order, never retried here, a lost response is recovered through the receipt """
+
+        return self.call(self.client.order.create, data)
+
+    def find_order(self, receipt):
+        """ Id of an order already created for the receipt, None when there is none """
+
+        orders = self.call(self.client.order.all, {'receipt': receipt}, idempotent=True)
+
+        for order in orders.get('items', []):
+            if order.get('receipt') == receipt:
+                return order['id']
+
+        return None
+
+    def fetch_order_payments(self, order_id):
+        """ Payment attempts the gateway recorded for the order """
+
+        return self.call(self.client.order.payments, order_id, idempotent=True).get('items', [])
+
+
+@lru_cache(maxsize=None)
+def get_payment_gateway():
+    """ Payment: Gateway adapter shared by every request of this process """
+
+    return PaymentGateway()
+
+
+def get_service_request_receipt(service_request_id):
+    """ Payment: Receipt (idempotency key) of the gateway order paying a service request """
+
+    return 'service_request_%d' % service_request_id
+
+
+def create_payment_order(payment, service_request_id, retry=False):
+    """ Payment: Create the gateway order of a pending payment, call it outside any transaction """
+
+    if payment.order_id:
+        return payment.order_id
+
+    gateway = get_payment_gateway()
+
+    order_id = None
+
+    # A retry may follow an attempt whose order was created but whose response was lost
+    if retry:
+        order_id = gateway.find_order(payment.receipt)
+
+    if order_id is None:
+        order = gateway.create_order({
+            'amount': int(payment.amount) * 100, # To convert amount into Ruppess
+            'currency': get_global_values()['CURRENCY'],
+            'receipt': payment.receipt,
+            'notes': {
+                get_global_values()['SERVICE_REQUEST_OBJECT_ID']: service_request_id
+            }
+        })
+
+        order_id = order['id']
+
+    # Conditional, when two attempts race the order stored first wins and both return it
+    if Payment.objects.filter(pk=payment.pk, order_id='').update(order_id=order_id):
+        payment.order_id = order_id
+    else:
+        payment.refresh_from_db(fields=['order_id'])
+
+    return payment.order_id
+
+
+def verify_payment_signature(order_id, payment_id, signature):
+    """ Payment: Check the checkout signature locally, the HMAC-SHA256 of 'order_id|payment_id' under the key secret """
+
+    # An unset secret would make the signature an HMAC anyone can compute
+    if not settings.RAZORPAY_KEY_SECRET:
+        return False
+
+    message = (str(order_id) + '|' + str(payment_id)).encode()
+
+    expected_signature = hmac.new(settings.RAZORPAY_KEY_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+    return hmac.compare_digest(expected_signature, str(signature))
+
+
+def settle_payment(payment_pk, payment_id, signature='', now=None):
+    """ Payment: Mark a pending payment paid and activate its booking, False when it was no longer pending """
+
+    now = now or timezone.now()
+
+    with transaction.atomic():
+
+        # Conditional UPDATE, only the first callback or webhook of the order moves it out of Pending
+        updated = Payment.objects.filter(
+            pk=payment_pk,
+            payment_status=Payment.PaymentStatus.PENDING
+        ).update(
+            payment_status=Payment.PaymentStatus.SUCCESS,
+            payment_id=payment_id,
+            signature=signature,
+            modified=now
+        )
+
+        if updated:
+            ServiceRequest.objects.filter(
+                payment_info_id=payment_pk
+            ).update(
+                is_active=True,
+                modified=now
+            )
+
+    return bool(updated)
+
+
+def verify_webhook_signature(body, signature):
+    """ Payment: Check a webhook locally, the HMAC-SHA256 of the raw body under the webhook secret """
+
+    if not settings.RAZORPAY_WEBHOOK_SECRET:
+        return False
+
+    expected_signature = hmac.new(settings.RAZORPAY_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+    return hmac.compare_digest(expected_signature, str(signature))
+
+
+def get_webhook_event_id(event_id, body):
+    """ Payment: De-duplication key of a webhook, the gateway event id or else the digest of the body """
+
+    return event_id or hashlib.sha256(body).hexdigest()
+
+
+def apply_payment_webhook_event(payload, now):
+    """ Payment: Apply one stored webhook event, returns its PaymentWebhookEvent outcome """
+
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return PaymentWebhookEvent.Outcome.INVALID
+
+    if not isinstance(event, dict):
+        return PaymentWebhookEvent.Outcome.INVALID
+
+    if event.get('event') not in SETTLING_WEBHOOK_EVENTS:
+        return PaymentWebhookEvent.Outcome.IGNORED
+
+    try:
+        payment_entity = event['payload']['payment']['entity']
+        order_id = str(payment_entity['order_id'] or '')
+        payment_id = str(payment_entity['id'])
+    except (KeyError, TypeError):
+        return PaymentWebhookEvent.Outcome.INVALID
+
+    if payment_entity.get('status') != 'captured':
+        return PaymentWebhookEvent.Outcome.IGNORED
+
+    payment_pk = Payment.objects.filter(
+        order_id=order_id
+    ).exclude(
+        order_id=''
+    ).values_list(
+        'pk',
+        flat=True
+    ).first()
+
+    if payment_pk is None:
+        return PaymentWebhookEvent.Outcome.UNKNOWN_ORDER
+
+    if settle_payment(payment_pk, payment_id, now=now):
+        return PaymentWebhookEvent.Outcome.SETTLED
+
+    # Settled already, by the checkout callback, reconcile_payments or an earlier event of the same payment
+    return PaymentWebhookEvent.Outcome.NO_CHANGE
+
+
+def process_payment_webhook_events(batch_size):
+    """ Payment: Apply the oldest unprocessed webhook events in arrival order, returns how many were processed """
+
+    now = timezone.now()
+
+    # The events are marked processed in the transaction that applies them, so each one takes effect once.
+    # Settling is a conditional UPDATE, so concurrent workers skipping each other's rows still agree on the outcome
+    with transaction.atomic():
+        events = list(PaymentWebhookEvent.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            processed_at__isnull=True
+        ).order_by(
+            'id'
+        )[:batch_size])
+
+        for event in events:
+            event.outcome = apply_payment_webhook_event(event.payload, now)
+            event.processed_at = now
+
+        PaymentWebhookEvent.objects.bulk_update(events, ['outcome', 'processed_at'])
+
+    return len(events)
@@ -1,8 +1,124 @@
+# Package imports
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework_simplejwt.settings import api_settings
+
 # Model imports
 from app.core.models import (
     UserRole,
 )
 
+# Utility imports
+from app.utils import (
+    get_current_request,
+    get_global_values,
+)
+
+
+class RoleResolver:
+    """ Resolver: Role IDs of users, loaded at most once per request """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.user_role_ids = {}
+        self.changed_user_ids = set()
+
+    def get_token_role_ids(self, user_id):
+        """ Return the role IDs signed into the request's access token for this user, if any """
+
+        # Set by DRF once the request is authenticated, already verified against the permissions version
+        token = getattr(self.request, 'auth', None)
+
+        roles_claim = get_global_values()['ROLES_CLAIM']
+
+        if token is None or roles_claim not in token or user_id in self.changed_user_ids:
+            return None
+
+        if str(token.get(api_settings.USER_ID_CLAIM)) != str(user_id):
+            return None
+
+        return token[roles_claim]
+
+    def get_role_ids(self, user_id):
+        """ Return the role IDs of the user, memoized for the lifetime of the request """
+
+        if user_id not in self.user_role_ids:
+
+            user_role_list = self.get_token_role_ids(user_id)
+
+            if user_role_list is None:
+                user_role_list = get_cached_user_role_ids(user_id)
+
+            self.user_role_ids[user_id] = user_role_list
+
+        return self.user_role_ids[user_id]
+
+    def invalidate(self, user_id):
+        """ Forget the memoized role IDs of the user and stop trusting the token claims for them """
+
+        self.user_role_ids.pop(user_id, None)
+        self.changed_user_ids.add(user_id)
+
+
+def get_user_role_ids_cache_key(user_id):
+    """ Permission: Cache key holding the role IDs of the user """
+
+    return 'user_role_ids:' + str(user_id)
+
+
+def get_cached_user_role_ids(user_id):
+    """ Permission: Role IDs of the user from the shared cache, falling back to the database """
+
+    cache_key = get_user_role_ids_cache_key(user_id)
+
+    user_role_list = cache.get(cache_key)
+
+    if user_role_list is None:
+
+        # Run query to find user roles
+        user_role_list = list(UserRole.objects.filter(
+            user_id=user_id
+        ).values_list(
+            'role_id',
+            flat=True
+        ))
+
+        cache.set(cache_key, user_role_list, settings.ROLE_CACHE_TIMEOUT)
+
+    return user_role_list
+
+
+def get_user_role_ids(user_id):
+    """ Permission: Role IDs of the user, resolved once per request when called inside one """
+
+    request = get_current_request()
+
+    role_resolver = getattr(request, 'role_resolver', None)
+
+    if role_resolver is None:
+        return get_cached_user_role_ids(user_id)
+
+    return role_resolver.get_role_ids(user_id)
+
+
+def invalidate_user_role_ids(user_id):
+    """ Permission: Drop the cached role IDs of the user (called from the UserRole signals) """
+
+    cache_key = get_user_role_ids_cache_key(user_id)
+
+    cache.delete(cache_key)
+
+    # A concurrent request may have re-read the old rows before our transaction committed
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+    request = get_current_request()
+
+    role_resolver = getattr(request, 'role_resolver', None)
+
+    if role_resolver is not None:
+        role_resolver.invalidate(user_id)
+
 
 def does_permission_exist(required_role_list, user_id):
     """ To check Role based permisison of the user """
@@ -16,16 +132,10 @@ def does_permission_exist(required_role_list, user_id):
     for role in required_role_list:
         permissions['' + str(role)] = False
 
-    # Run query to find user roles
-    user_role_queryset = UserRole.objects.filter(
-        user_id=user_id
-    ).values(
-        'role_id'
-    )
+    # Find user roles (request-scoped, then shared cache, then database)
+    user_role_list = get_user_role_ids(user_id)
 
-    if user_role_queryset:
-
-        user_role_list = [i['role_id'] for i in user_role_queryset]
+    if user_role_list:
 
         # Check for common roles
         common_roles = set(user_role_list).intersection(required_role_list)
@@ -35,5 +145,5 @@ def does_permission_exist(required_role_list, user_id):
 
             for common_role in common_roles:
                 permissions['' + str(common_role)] = True
-    
+
     return permissions
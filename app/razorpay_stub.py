@@ -0,0 +1,134 @@
+# Package imports
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class RazorpayStubRequestHandler(BaseHTTPRequestHandler):
+    """ Stub: Answers the Razorpay order endpoints the app uses, from orders kept in memory """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.count_request()
+
+        path = urlparse(self.path).path.rstrip('/')
+
+        if not path.endswith('/orders'):
+            return self.send_json({'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Unknown endpoint'}}, 404)
+
+        data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+
+        self.simulate_latency()
+
+        with self.server.lock:
+            order = {
+                'id': 'order_stub%d' % next(self.server.ids),
+                'entity': 'order',
+                'amount': data.get('amount'),
+                'currency': data.get('currency'),
+                'receipt': data.get('receipt'),
+                'notes': data.get('notes') or {},
+                'status': 'created',
+                'created_at': int(time.time()),
+            }
+
+            self.server.orders[order['id']] = order
+
+        self.send_json(order)
+
+    def do_GET(self):
+        self.count_request()
+
+        url = urlparse(self.path)
+        parts = url.path.rstrip('/').split('/')
+
+        self.simulate_latency()
+
+        # /orders?receipt=...
+        if parts[-1] == 'orders':
+            receipt = parse_qs(url.query).get('receipt', [None])[0]
+
+            items = [order for order in self.server.orders.values() if receipt is None or order['receipt'] == receipt]
+
+            return self.send_json({'entity': 'collection', 'count': len(items), 'items': items})
+
+        # /orders/<id>/payments, any order id is known so the stub can reconcile payments of a real database
+        if parts[-1] == 'payments':
+            items = self.server.get_order_payments(parts[-2])
+
+            return self.send_json({'entity': 'collection', 'count': len(items), 'items': items})
+
+        # /orders/<id>
+        if parts[-1] in self.server.orders:
+            return self.send_json(self.server.orders[parts[-1]])
+
+        self.send_json({'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}}, 400)
+
+    def count_request(self):
+        # Counted on arrival, so calls that time out before the answer are counted too
+        with self.server.lock:
+            self.server.request_count += 1
+
+    def simulate_latency(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def send_json(self, data, status_code=200):
+        body = json.dumps(data).encode()
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RazorpayStubServer(ThreadingHTTPServer):
+    """ Stub: Local Razorpay stand-in for tests and benchmarks, point settings.RAZORPAY_BASE_URL at it """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0, payment_status='captured', verbose=False):
+        super().__init__(address, RazorpayStubRequestHandler)
+
+        self.latency = latency
+        # Status of the one payment every order gets, '' for orders nobody paid
+        self.payment_status = payment_status
+        self.verbose = verbose
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.orders = {}
+        self.request_count = 0
+
+    @property
+    def url(self):
+        return 'http://%s:%d/v1' % self.server_address[:2]
+
+    def get_order_payments(self, order_id):
+        if not self.payment_status:
+            return []
+
+        return [{
+            'id': 'pay_' + order_id,
+            'entity': 'payment',
+            'order_id': order_id,
+            'amount': self.orders.get(order_id, {}).get('amount', 0),
+            'status': self.payment_status,
+        }]
+
+    def start(self):
+        """ Serve from a background thread, returns the thread """
+
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+        return thread
@@ -6,6 +6,11 @@ from app.core.models import (
     Role,
 )
 
+# Utility imports
+from app.roles import (
+    role_registry,
+)
+
 
 class RoleDisplaySerializer(serializers.ModelSerializer):
     """ Serializer: Role Display """
@@ -13,3 +18,18 @@ class RoleDisplaySerializer(serializers.ModelSerializer):
     class Meta:
         model = Role
         fields = ('pk', 'name',)
+
+
+class RoleRegistryField(serializers.PrimaryKeyRelatedField):
+    """ Serializer field: Role by primary key, looked up in the role registry instead of the database """
+
+    def to_internal_value(self, data):
+        try:
+            role = role_registry.get(int(data))
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        if role is None:
+            self.fail('does_not_exist', pk_value=data)
+
+        return role
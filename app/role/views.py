@@ -1,6 +1,6 @@
 # Package imports
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
@@ -10,11 +10,6 @@ from app.role.serializers import (
     RoleDisplaySerializer,
 )
 
-# Model imports
-from app.core.models import (
-    Role
-)
-
 # Utility imports
 from app.utils import (
     get_response_schema,
@@ -27,6 +22,9 @@ from app.utils import (
 from app.permissions import (
     does_permission_exist
 )
+from app.roles import (
+    role_registry,
+)
 
 
 class RoleList(GenericAPIView):
@@ -79,12 +77,8 @@ class RoleList(GenericAPIView):
 
             allowed_roles = get_allowed_user_roles_for_create_user()['MANAGEMENT_COMMITTEE_ALLOWED_ROLE_IDS']
 
-        queryset = Role.objects.filter(
-            pk__in=allowed_roles
-        ).order_by(
-            'pk'
-        )
+        roles = role_registry.filter(allowed_roles)
 
-        role_display_serializer = RoleDisplaySerializer(queryset, many=True)
+        role_display_serializer = RoleDisplaySerializer(roles, many=True)
 
         return Response(role_display_serializer.data, status=status.HTTP_200_OK)
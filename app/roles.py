@@ -0,0 +1,81 @@
+# Package imports
+import threading
+
+from django.contrib.auth import get_user_model
+
+# Model imports
+from app.core.models import (
+    Role,
+    UserRole,
+)
+
+
+class RoleRegistry:
+    """ Registry: The fixed set of roles, loaded once per process on first use """
+
+    def __init__(self):
+        self.roles = None
+        self.lock = threading.Lock()
+
+    def get_roles(self):
+        """ Return every role by primary key, ordered by primary key """
+
+        roles = self.roles
+
+        if roles is None:
+            with self.lock:
+                if self.roles is None:
+                    self.roles = {role.pk: role for role in Role.objects.order_by('pk')}
+
+                roles = self.roles
+
+        return roles
+
+    def get(self, pk):
+        """ Return the role with this primary key, or None """
+
+        return self.get_roles().get(pk)
+
+    def filter(self, pks):
+        """ Return the roles with these primary keys, ordered by primary key """
+
+        pks = set(pks)
+
+        return [role for pk, role in self.get_roles().items() if pk in pks]
+
+    def clear(self):
+        """ Forget the loaded roles (called from the Role signals) """
+
+        with self.lock:
+            self.roles = None
+
+
+role_registry = RoleRegistry()
+
+
+def get_role_mask(role_ids):
+    """ Role: Bitmask with the bit of every role ID set (bit n for role n) """
+
+    role_mask = 0
+
+    for role_id in role_ids:
+        role_mask |= 1 << int(role_id)
+
+    return role_mask
+
+
+def sync_user_role_mask(user_id):
+    """ Role: Recompute User.role_mask from the UserRole rows of the user """
+
+    role_ids = UserRole.objects.filter(
+        user_id=user_id
+    ).values_list(
+        'role_id',
+        flat=True
+    )
+
+    get_user_model().objects.filter(
+        pk=user_id
+    ).update(
+        role_mask=get_role_mask(role_ids)
+    )
@@ -0,0 +1,48 @@
+# Package imports
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+
+# Model imports
+from app.core.models import (
+    Service,
+    ServiceRequest,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Copy service.owner_organization onto service requests created before the column existed """
+
+    help = 'Backfill ServiceRequest.owner_organization in batches (run once after the migration)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        owner_organization = Subquery(
+            Service.objects.filter(
+                pk=OuterRef('service_id')
+            ).values('owner_organization_id')[:1]
+        )
+
+        updated = 0
+
+        while True:
+            service_request_ids = list(ServiceRequest.objects.filter(
+                owner_organization__isnull=True
+            ).order_by(
+                'id'
+            ).values_list(
+                'id',
+                flat=True
+            )[:options['batch_size']])
+
+            if not service_request_ids:
+                break
+
+            updated += ServiceRequest.objects.filter(
+                id__in=service_request_ids
+            ).update(
+                owner_organization_id=owner_organization
+            )
+
+        self.stdout.write('Service requests backfilled: %d' % updated)
@@ -0,0 +1,86 @@
+# Package imports
+import time
+
+import razorpay
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+# Utility imports
+from app.payments import (
+    PaymentGatewayError,
+    get_payment_gateway,
+)
+from app.razorpay_stub import (
+    RazorpayStubServer,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Compare a client per call with the shared gateway adapter, and time calls to a hung gateway, against the local Razorpay stub """
+
+    help = 'Benchmark payment gateway calls'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.01, help='Seconds the stub takes per response')
+        parser.add_argument('--hung-latency', type=float, default=2, help='Seconds the hung stub takes per response')
+        parser.add_argument('--read-timeout', type=float, default=0.5, help='Read timeout used against the hung stub')
+
+    def handle(self, *args, **options):
+        server = RazorpayStubServer(('127.0.0.1', 0), latency=options['latency'])
+        server.start()
+
+        hung_server = RazorpayStubServer(('127.0.0.1', 0), latency=options['hung_latency'])
+        hung_server.start()
+
+        order_ids = ['order_benchmark%d' % i for i in range(options['calls'])]
+
+        try:
+            # A new client and connection per call, as the views used to do
+            start = time.perf_counter()
+
+            for order_id in order_ids:
+                client = razorpay.Client(auth=('key', 'secret'), base_url=server.url)
+                client.order.payments(order_id, timeout=settings.PAYMENT_GATEWAY_TIMEOUT)
+
+            client_elapsed = time.perf_counter() - start
+
+            with override_settings(RAZORPAY_BASE_URL=server.url):
+                get_payment_gateway.cache_clear()
+
+                start = time.perf_counter()
+
+                for order_id in order_ids:
+                    get_payment_gateway().fetch_order_payments(order_id)
+
+                gateway_elapsed = time.perf_counter() - start
+
+            with override_settings(
+                RAZORPAY_BASE_URL=hung_server.url,
+                PAYMENT_GATEWAY_TIMEOUT=(settings.PAYMENT_GATEWAY_TIMEOUT[0], options['read_timeout'])
+            ):
+                get_payment_gateway.cache_clear()
+
+                failures = 0
+
+                start = time.perf_counter()
+
+                for order_id in order_ids:
+                    try:
+                        get_payment_gateway().fetch_order_payments(order_id)
+                    except PaymentGatewayError:
+                        failures += 1
+
+                hung_elapsed = time.perf_counter() - start
+        finally:
+            get_payment_gateway.cache_clear()
+
+            for stub in (server, hung_server):
+                stub.shutdown()
+                stub.server_close()
+
+        self.stdout.write('Calls: %d' % options['calls'])
+        self.stdout.write('Client per call: %.2fs' % client_elapsed)
+        self.stdout.write('Shared gateway: %.2fs' % gateway_elapsed)
+        self.stdout.write('Hung gateway: %d failures in %.2fs, %d calls reached it' % (failures, hung_elapsed, hung_server.request_count))
@@ -0,0 +1,39 @@
+# Package imports
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Utility imports
+from app.payments import (
+    process_payment_webhook_events,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Worker applying stored Razorpay webhook events in arrival order """
+
+    help = 'Apply stored payment webhook events (runs until stopped unless --once is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PAYMENT_WEBHOOK_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when no event is waiting')
+        parser.add_argument('--once', action='store_true', help='Exit once no event is waiting')
+
+    def handle(self, *args, **options):
+        processed = 0
+
+        while True:
+            batch_processed = process_payment_webhook_events(options['batch_size'])
+
+            processed += batch_processed
+
+            if batch_processed:
+                continue
+
+            if options['once']:
+                break
+
+            time.sleep(options['poll_interval'])
+
+        self.stdout.write('Webhook events processed: %d' % processed)
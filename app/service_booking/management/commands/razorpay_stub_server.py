@@ -0,0 +1,38 @@
+# Package imports
+from django.core.management.base import BaseCommand
+
+# Utility imports
+from app.razorpay_stub import (
+    RazorpayStubServer,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Run a local Razorpay stand-in, start the app or reconcile_payments with RAZORPAY_BASE_URL pointing at it """
+
+    help = 'Serve a local stub of the Razorpay orders API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+        parser.add_argument('--payment-status', default='captured', help="Status of the payment of every order, '' for unpaid orders")
+
+    def handle(self, *args, **options):
+        server = RazorpayStubServer(
+            (options['host'], options['port']),
+            latency=options['latency'],
+            payment_status=options['payment_status'],
+            verbose=options['verbosity'] > 1
+        )
+
+        self.stdout.write('Razorpay stub listening on %s' % server.url)
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        self.stdout.write('Requests served: %d' % server.request_count)
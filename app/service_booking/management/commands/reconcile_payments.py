@@ -0,0 +1,125 @@
+# Package imports
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+# Model imports
+from app.core.models import (
+    Payment,
+)
+
+# Utility imports
+from app.payments import (
+    PaymentGatewayError,
+    get_payment_gateway,
+    settle_payment,
+)
+
+# Gateway verdicts on a pending payment
+PAID = 'paid'
+IN_PROGRESS = 'in_progress'
+UNPAID = 'unpaid'
+GATEWAY_ERROR = 'gateway_error'
+
+# Abandoned payments deleted per query, each one cascades to its booking and slots
+DELETE_CHUNK_SIZE = 100
+
+
+class Command(BaseCommand):
+    """ Command: Settle pending payments that never got a callback, from the gateway's records """
+
+    help = 'Reconcile stale pending payments with Razorpay and drop abandoned bookings (run periodically)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8, help='Gateway requests in flight at once')
+        parser.add_argument('--older-than', type=int, default=settings.PAYMENT_RECONCILE_AFTER, help='Seconds since creation before a pending payment is checked')
+        parser.add_argument('--abandon-after', type=int, default=settings.PAYMENT_ABANDON_AFTER, help='Seconds since creation before an unpaid booking is deleted')
+
+    def get_verdict(self, gateway, payment):
+        """ Verdict and gateway payment id of one pending payment """
+
+        # The order was never created, nobody could have paid it
+        if not payment.order_id:
+            return UNPAID, ''
+
+        try:
+            order_payments = gateway.fetch_order_payments(payment.order_id)
+        except PaymentGatewayError:
+            return GATEWAY_ERROR, ''
+
+        for order_payment in order_payments:
+            if order_payment.get('status') == 'captured':
+                return PAID, order_payment['id']
+
+        if any(order_payment.get('status') in ('created', 'authorized') for order_payment in order_payments):
+            return IN_PROGRESS, ''
+
+        return UNPAID, ''
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+
+        checked_before = now - timedelta(seconds=options['older_than'])
+        abandoned_before = now - timedelta(seconds=options['abandon_after'])
+
+        gateway = get_payment_gateway()
+
+        last_payment_id = 0
+        checked = paid = abandoned = errors = 0
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            while True:
+                # Keyset pagination, settled and deleted rows never shift the next batch
+                payments = list(Payment.objects.filter(
+                    payment_status=Payment.PaymentStatus.PENDING,
+                    pk__gt=last_payment_id,
+                    created__lt=checked_before
+                ).order_by(
+                    'pk'
+                ).only(
+                    'pk',
+                    'order_id',
+                    'created'
+                )[:options['batch_size']])
+
+                if not payments:
+                    break
+
+                last_payment_id = payments[-1].pk
+
+                abandoned_payment_ids = []
+
+                # One batch at a time, at most --concurrency gateway calls in flight
+                verdicts = executor.map(lambda payment: self.get_verdict(gateway, payment), payments)
+
+                for payment, (verdict, payment_id) in zip(payments, verdicts):
+                    if verdict == PAID:
+                        # Conditional, a callback, webhook or other run that settled it since the scan keeps its payment id
+                        if settle_payment(payment.pk, payment_id, now=now):
+                            paid += 1
+
+                    elif verdict == UNPAID and payment.created < abandoned_before:
+                        abandoned_payment_ids.append(payment.pk)
+
+                    elif verdict == GATEWAY_ERROR:
+                        errors += 1
+
+                for offset in range(0, len(abandoned_payment_ids), DELETE_CHUNK_SIZE):
+                    # Still pending at delete time, a callback that settled one meanwhile keeps it
+                    deleted, deleted_per_model = Payment.objects.filter(
+                        pk__in=abandoned_payment_ids[offset:offset + DELETE_CHUNK_SIZE],
+                        payment_status=Payment.PaymentStatus.PENDING
+                    ).delete()
+
+                    abandoned += deleted_per_model.get(Payment._meta.label, 0)
+
+                checked += len(payments)
+
+        self.stdout.write('Payments checked: %d' % checked)
+        self.stdout.write('Payments settled as paid: %d' % paid)
+        self.stdout.write('Abandoned bookings deleted: %d' % abandoned)
+        self.stdout.write('Gateway errors: %d' % errors)
@@ -91,7 +91,7 @@ class PaymentForBookingCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Payment
-        fields = ('pk', 'order_id', 'payment_id', 'signature', 'amount', 'payment_status',)
+        fields = ('pk', 'order_id', 'receipt', 'payment_id', 'signature', 'amount', 'payment_status',)
 # End Service booking serializers for Resident User
 
 
@@ -0,0 +1,183 @@
+import hashlib
+import hmac
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+
+# Model imports
+from app.core.models import (
+    Payment,
+    PaymentWebhookEvent,
+)
+
+# Utility imports
+from app.payments import (
+    process_payment_webhook_events,
+    settle_payment,
+    verify_payment_signature,
+)
+
+
+class PaymentSignatureTests(TestCase):
+    """ Test: Checkout signatures are only accepted under a configured key secret """
+
+    def get_signature(self, secret):
+        return hmac.new(secret.encode(), b'order_1|pay_1', hashlib.sha256).hexdigest()
+
+    @override_settings(RAZORPAY_KEY_SECRET='secret')
+    def test_signature_under_the_secret_is_accepted(self):
+        self.assertTrue(verify_payment_signature('order_1', 'pay_1', self.get_signature('secret')))
+        self.assertFalse(verify_payment_signature('order_1', 'pay_1', self.get_signature('other')))
+
+    @override_settings(RAZORPAY_KEY_SECRET='')
+    def test_signature_without_a_secret_is_refused(self):
+        self.assertFalse(verify_payment_signature('order_1', 'pay_1', self.get_signature('')))
+
+
+class SettlePaymentTests(TestCase):
+    """ Test: A payment is settled once, whichever of the callback, webhook or reconciliation gets there first """
+
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            order_id='order_1',
+            receipt='service_request_1',
+            amount='100',
+            payment_status=Payment.PaymentStatus.PENDING
+        )
+
+    def test_payment_is_settled_once(self):
+        self.assertTrue(settle_payment(self.payment.pk, 'pay_1', 'signature'))
+        self.assertFalse(settle_payment(self.payment.pk, 'pay_2'))
+
+        self.payment.refresh_from_db()
+
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.SUCCESS)
+        self.assertEqual(self.payment.payment_id, 'pay_1')
+        self.assertEqual(self.payment.signature, 'signature')
+
+    def test_failed_payment_is_not_settled(self):
+        Payment.objects.filter(pk=self.payment.pk).update(payment_status=Payment.PaymentStatus.FAIL)
+
+        self.assertFalse(settle_payment(self.payment.pk, 'pay_1'))
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='webhook_secret')
+class PaymentWebhookTests(TestCase):
+    """ Test: Webhooks are stored once per event and settle their payment once """
+
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            order_id='order_1',
+            receipt='service_request_1',
+            amount='100',
+            payment_status=Payment.PaymentStatus.PENDING
+        )
+
+    def get_body(self, payment_id='pay_1'):
+        return json.dumps({
+            'event': 'payment.captured',
+            'payload': {
+                'payment': {
+                    'entity': {
+                        'id': payment_id,
+                        'order_id': 'order_1',
+                        'status': 'captured',
+                    }
+                }
+            }
+        }).encode()
+
+    def post_webhook(self, body, event_id, secret='webhook_secret'):
+        return self.client.post(
+            reverse('payment-webhook'),
+            body,
+            content_type='application/json',
+            HTTP_X_RAZORPAY_SIGNATURE=hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(),
+            HTTP_X_RAZORPAY_EVENT_ID=event_id
+        )
+
+    def test_redelivered_event_is_stored_once(self):
+        body = self.get_body()
+
+        for _ in range(2):
+            self.assertEqual(self.post_webhook(body, 'evt_1').status_code, status.HTTP_200_OK)
+
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+
+    def test_unsigned_event_is_refused(self):
+        response = self.post_webhook(self.get_body(), 'evt_1', secret='other')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+    def test_events_of_one_payment_settle_it_once(self):
+        self.post_webhook(self.get_body(), 'evt_1')
+        self.post_webhook(self.get_body(), 'evt_2')
+
+        self.assertEqual(process_payment_webhook_events(10), 2)
+        self.assertEqual(process_payment_webhook_events(10), 0)
+
+        self.assertEqual(
+            list(PaymentWebhookEvent.objects.order_by('id').values_list('outcome', flat=True)),
+            [PaymentWebhookEvent.Outcome.SETTLED, PaymentWebhookEvent.Outcome.NO_CHANGE]
+        )
+
+        self.payment.refresh_from_db()
+
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.SUCCESS)
+        self.assertEqual(self.payment.payment_id, 'pay_1')
+
+
+class ReconcilePaymentsTests(TestCase):
+    """ Test: Reconciliation settles pending payments through the same conditional update as the callbacks """
+
+    def setUp(self):
+        self.payment = Payment.objects.create(
+            order_id='order_1',
+            receipt='service_request_1',
+            amount='100',
+            payment_status=Payment.PaymentStatus.PENDING
+        )
+
+        gateway = mock.Mock()
+        gateway.fetch_order_payments.return_value = [{'id': 'pay_gateway', 'status': 'captured'}]
+
+        patcher = mock.patch('app.service_booking.management.commands.reconcile_payments.get_payment_gateway', return_value=gateway)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reconcile(self):
+        stdout = StringIO()
+
+        call_command('reconcile_payments', older_than=0, concurrency=1, stdout=stdout)
+
+        return stdout.getvalue()
+
+    def test_captured_payment_is_settled(self):
+        self.assertIn('Payments settled as paid: 1', self.reconcile())
+
+        self.payment.refresh_from_db()
+
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.SUCCESS)
+        self.assertEqual(self.payment.payment_id, 'pay_gateway')
+
+    def test_payment_settled_after_the_scan_is_left_alone(self):
+        def settle_after_callback(payment_pk, payment_id, **kwargs):
+            # The checkout callback lands while the gateway was being asked
+            settle_payment(payment_pk, 'pay_callback', 'signature')
+
+            return settle_payment(payment_pk, payment_id, **kwargs)
+
+        with mock.patch('app.service_booking.management.commands.reconcile_payments.settle_payment', side_effect=settle_after_callback):
+            self.assertIn('Payments settled as paid: 0', self.reconcile())
+
+        self.payment.refresh_from_db()
+
+        self.assertEqual(self.payment.payment_status, Payment.PaymentStatus.SUCCESS)
+        self.assertEqual(self.payment.payment_id, 'pay_callback')
+        self.assertEqual(self.payment.signature, 'signature')
@@ -7,7 +7,9 @@ from app.service_booking.views import (
     ServiceSlotFromDate,
     PayableAmountOfServiceRequest,
     ServiceRequestCreate,
+    ServiceRequestPaymentOrder,
     ServiceRequestCallback,
+    PaymentWebhook,
     ServiceBookingHistoryListFilter,
     AddRatingServiceRequest,
 
@@ -47,8 +49,12 @@ urlpatterns = [
 
     path('service-request-create', ServiceRequestCreate.as_view(), name='service-request-create'),
 
+    path('service-request-payment-order/<int:pk>', ServiceRequestPaymentOrder.as_view(), name='service-request-payment-order'),
+
     path('service-request-callback', ServiceRequestCallback.as_view(), name='service-request-callback'),
 
+    path('payment-webhook', PaymentWebhook.as_view(), name='payment-webhook'),
+
     path('service-booking-history-list-filter', ServiceBookingHistoryListFilter.as_view(), name='service-booking-history-list-filter'),
 
     path('add-rating-service-request/<int:pk>', AddRatingServiceRequest.as_view(), name='add-rating-service-request'),
@@ -1,7 +1,7 @@
 # Package imports
 from django.conf import settings
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
@@ -10,9 +10,7 @@ from datetime import (
     date,
 )
 from django.db.models import Q
-import razorpay
 from django.db import transaction
-import environ
 
 # View imports
 from app.core.views import (
@@ -57,7 +55,9 @@ from app.core.models import (
     ServiceRequest,
     Establishment,
     Payment,
-    ServiceRequestServiceSlot
+    PaymentWebhookEvent,
+    ServiceRequestServiceSlot,
+    NotificationOutbox,
 )   
 from django.contrib.auth import get_user_model
 
@@ -68,20 +68,34 @@ from app.utils import (
     get_global_error_messages,
     get_global_values,
     get_current_flat,
-    send_notification,
-    get_payable_service_request_amount
+    get_payable_service_request_amount,
+    get_user_organization_id,
 )
 from app.permissions import (
     does_permission_exist
 )
+from app.roles import (
+    get_role_mask,
+)
+from app.payments import (
+    PaymentGatewayError,
+    create_payment_order,
+    get_service_request_receipt,
+    get_webhook_event_id,
+    settle_payment,
+    verify_payment_signature,
+    verify_webhook_signature,
+)
+from app.notifications.utils import (
+    enqueue_notification,
+    enqueue_notifications,
+    get_coalesce_key,
+)
 
 # Swagger imports
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-env = environ.Env()
-environ.Env.read_env()
-
 
 # Start Service Booking views for Resident User
 class ServiceForBookingListFilter(ListAPIView):
@@ -419,6 +433,16 @@ class PayableAmountOfServiceRequest(GenericAPIView):
             return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
 
+def notify_service_request_raised(service_request, service):
+    """ Utility: Tell the organization administrator about a new service request once its payment order exists """
+
+    # Sent notification to the respected Organization Administartor
+    msg = "New Service request " + str(service.name) + " has been raised."
+
+    # Low priority, administrators who opted into digests get one push for a burst of requests
+    enqueue_notification(service.owner_organization.owner_user_id,get_global_success_messages()['SERVICE_REQUEST'], msg, get_coalesce_key(service_request), NotificationOutbox.Priority.LOW)
+
+
 class ServiceRequestCreate(GenericAPIView):
     """ View: Create ServiceRequest booking for Resident User """
 
@@ -480,7 +504,9 @@ class ServiceRequestCreate(GenericAPIView):
             return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
         # Validating service ID
-        service_queryset = Service.objects.filter(
+        service_queryset = Service.objects.select_related(
+            'owner_organization'
+        ).filter(
             pk=request.data['service'],
             is_active=True,
         )
@@ -528,6 +554,7 @@ class ServiceRequestCreate(GenericAPIView):
 
                     if service_request_create_serializer.is_valid():
 
+                        # Phase one: the booking and its pending payment commit before the gateway is called
                         with transaction.atomic():
 
                             service_request_obj = service_request_create_serializer.save()
@@ -550,103 +577,101 @@ class ServiceRequestCreate(GenericAPIView):
 
                             service_request_service_slot_serializer = ServiceRequestServiceSlotForBookingCreateSerializer(data=requested_service_slots_data, many=True)
 
-                            if service_request_service_slot_serializer.is_valid():
-
-                                service_request_service_slot_serializer.save()
-
-                                # Validating if payable amount is 0 then Payment related stuffs will not be executed
-                                if int(amount_data['amount']) == 0:
-
-                                    return_data = {
-                                        'amenity_booking': service_request_create_serializer.data,
-                                        'requested_amenity_slots': service_request_service_slot_serializer.data,
-                                        'payment': None
-                                    }
-
-                                    return get_response_schema(return_data, get_global_success_messages()['RECORD_CREATED'], status.HTTP_201_CREATED)
-
-                                # Create order_id for the razorpay
-                                client = razorpay.Client(auth=(env('PUBLIC_KEY'), env('SECRET_KEY')))
-
-                                order_dictionary = {
-                                    'amount': int(amount_data['amount']) * 100, # To convert amount into Ruppess
-                                    'currency': get_global_values()['CURRENCY'],
-                                    'notes': {
-                                        get_global_values()['SERVICE_REQUEST_OBJECT_ID']: service_request_obj.pk
-                                    }
-                                }
+                            if not service_request_service_slot_serializer.is_valid():
 
-                                payment = client.order.create(order_dictionary)
+                                # ServiceRequestServiceSlotForBookingCreateSerializer serializer errors
+                                # Rollback the transaction
+                                transaction.set_rollback(True)
 
-                                payment_data = {
-                                    'order_id': payment['id'],
-                                    'payment_id': '',
-                                    'signature': '',
-                                    'amount': int(amount_data['amount']),
-                                    'payment_status': Payment.PaymentStatus.PENDING
+                                return_data = {
+                                    settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
+                                    get_global_values()['ERROR_KEY']: service_request_service_slot_serializer.errors
                                 }
+                                return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
-                                payment_create_serialzier = PaymentForBookingCreateSerializer(data=payment_data)
-
-                                if payment_create_serialzier.is_valid():
+                            service_request_service_slot_serializer.save()
 
-                                    payment_obj = payment_create_serialzier.save()
+                            # Validating if payable amount is 0 then Payment related stuffs will not be executed
+                            if int(amount_data['amount']) == 0:
 
-                                    # Update the service_request with Payment FK
-                                    service_request_update_body = {
-                                        'payment_info': payment_obj.pk
-                                    }
+                                return_data = {
+                                    'amenity_booking': service_request_create_serializer.data,
+                                    'requested_amenity_slots': service_request_service_slot_serializer.data,
+                                    'payment': None
+                                }
 
-                                    service_request_update_serializer = ServiceRequestCreateSerializer(service_request_obj, data=service_request_update_body, partial=True)
+                                return get_response_schema(return_data, get_global_success_messages()['RECORD_CREATED'], status.HTTP_201_CREATED)
 
-                                    if service_request_update_serializer.is_valid():
+                            # Pending payment without a gateway order yet, the receipt ties the order to this booking
+                            payment_data = {
+                                'order_id': '',
+                                'receipt': get_service_request_receipt(service_request_obj.pk),
+                                'payment_id': '',
+                                'signature': '',
+                                'amount': int(amount_data['amount']),
+                                'payment_status': Payment.PaymentStatus.PENDING
+                            }
 
-                                        service_request_update_serializer.save()
+                            payment_create_serialzier = PaymentForBookingCreateSerializer(data=payment_data)
 
-                                        # Sent notification to the respected Organization Administartor
-                                        msg = "New Service request " + str(service_queryset.first().name) + " has been raised."
+                            if not payment_create_serialzier.is_valid():
 
-                                        oragnization_administrator_user_obj = service_queryset.first().owner_organization.owner_user
+                                # PaymentForBookingCreateSerializer serializer errors
+                                # Rollback the transaction
+                                transaction.set_rollback(True)
 
-                                        send_notification(oragnization_administrator_user_obj,get_global_success_messages()['SERVICE_REQUEST'], msg)
+                                return_data = {
+                                    settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
+                                    get_global_values()['ERROR_KEY']: payment_create_serialzier.errors
+                                }
+                                return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
-                                        return_data = {
-                                            'service_request': service_request_update_serializer.data,
-                                            'requested_service_slots': service_request_service_slot_serializer.data,
-                                            'payment': payment_create_serialzier.data
-                                        }
+                            payment_obj = payment_create_serialzier.save()
 
-                                        return get_response_schema(return_data, get_global_success_messages()['RECORD_CREATED'], status.HTTP_201_CREATED)
+                            # Update the service_request with Payment FK
+                            service_request_update_body = {
+                                'payment_info': payment_obj.pk
+                            }
 
-                                    # ServiceRequestCreateSerializer serializer errors
-                                    # Rollback the transaction
-                                    transaction.set_rollback(True)
+                            service_request_update_serializer = ServiceRequestCreateSerializer(service_request_obj, data=service_request_update_body, partial=True)
 
-                                    return_data = {
-                                        settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
-                                        get_global_values()['ERROR_KEY']: service_request_update_serializer.errors
-                                    }
-                                    return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+                            if not service_request_update_serializer.is_valid():
 
-                                # PaymentForBookingCreateSerializer serializer errors
+                                # ServiceRequestCreateSerializer serializer errors
                                 # Rollback the transaction
                                 transaction.set_rollback(True)
 
                                 return_data = {
                                     settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
-                                    get_global_values()['ERROR_KEY']: payment_create_serialzier.errors
+                                    get_global_values()['ERROR_KEY']: service_request_update_serializer.errors
                                 }
                                 return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
-                            # ServiceRequestServiceSlotForBookingCreateSerializer serializer errors
-                            # Rollback the transaction
-                            transaction.set_rollback(True)
+                            service_request_update_serializer.save()
+
+                        # Phase two: the gateway order, created with no transaction or row lock open
+                        try:
+                            create_payment_order(payment_obj, service_request_obj.pk)
 
+                        except PaymentGatewayError:
+                            # The booking stays pending, the app retries through service-request-payment-order
                             return_data = {
-                                settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
-                                get_global_values()['ERROR_KEY']: service_request_service_slot_serializer.errors
+                                'service_request': service_request_update_serializer.data,
+                                'requested_service_slots': service_request_service_slot_serializer.data,
+                                'payment': None,
+                                'payment_order_pending': True
                             }
-                            return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+                            return get_response_schema(return_data, get_global_error_messages()['PAYMENT_GATEWAY_UNAVAILABLE'], status.HTTP_503_SERVICE_UNAVAILABLE)
+
+                        notify_service_request_raised(service_request_obj, service_queryset.first())
+
+                        return_data = {
+                            'service_request': service_request_update_serializer.data,
+                            'requested_service_slots': service_request_service_slot_serializer.data,
+                            'payment': PaymentForBookingCreateSerializer(payment_obj).data
+                        }
+
+                        return get_response_schema(return_data, get_global_success_messages()['RECORD_CREATED'], status.HTTP_201_CREATED)
 
                     else:
                         # ServiceRequestCreateSerializer serializer errors
@@ -671,135 +696,179 @@ class ServiceRequestCreate(GenericAPIView):
             return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
 
-class ServiceRequestCallback(GenericAPIView):
-    """ View: ServiceRequest callback to confirm payment Resident User """
+class ServiceRequestPaymentOrder(GenericAPIView):
+    """ View: Create the payment order of a booking whose order creation failed, for Resident User """
 
-    @swagger_auto_schema(
-        request_body=openapi.Schema(
-            type=openapi.TYPE_OBJECT,
-            properties={
-                'razorpay_order_id': openapi.Schema(type=openapi.TYPE_STRING),
-                'razorpay_payment_id': openapi.Schema(type=openapi.TYPE_STRING),
-                'razorpay_signature': openapi.Schema(type=openapi.TYPE_STRING),
-            },
-        )
-    )
-    def post(self, request, format=None):
+    authentication_classes = [JWTAuthentication]
+
+    permission_classes = [IsAuthenticated]
 
-        client = razorpay.Client(auth=(env('PUBLIC_KEY'), env('SECRET_KEY')))
+    def post(self, request, pk):
 
-        fetch_order_id = client.order.fetch(request.data['razorpay_order_id'])
+        permission_role_list = [get_global_values()['RESIDENT_USERS_ROLE_ID']]
 
-        service_request_object_id = fetch_order_id['notes'][get_global_values()['SERVICE_REQUEST_OBJECT_ID']]
+        permissions = does_permission_exist(permission_role_list, self.request.user.id)
 
-        service_request_queryset = ServiceRequest.objects.filter(
-            pk=service_request_object_id,
-            is_active=False
+        if not permissions['allowed']:
+            return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
+
+        service_request_queryset = ServiceRequest.objects.select_related(
+            'payment_info',
+            'service__owner_organization'
+        ).filter(
+            pk=pk,
+            requested_user=request.user,
+            is_active=False,
+            payment_info__payment_status=Payment.PaymentStatus.PENDING
         )
 
-        if request.data['razorpay_payment_id'] == '' and request.data['razorpay_signature'] == '':
+        if not service_request_queryset:
+            return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
-            try:
-                if service_request_queryset:
+        service_request = service_request_queryset[0]
 
-                    for i in service_request_queryset:
+        payment_obj = service_request.payment_info
 
-                        i.payment_info.delete()
+        order_existed = bool(payment_obj.order_id)
 
-                        i.delete()
+        try:
+            # Looks the receipt up first, an earlier attempt may have created the order before timing out
+            create_payment_order(payment_obj, service_request.pk, retry=True)
 
-                else:
-                    return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
+        except PaymentGatewayError:
+            return_data = {
+                'payment': None,
+                'payment_order_pending': True
+            }
+            return get_response_schema(return_data, get_global_error_messages()['PAYMENT_GATEWAY_UNAVAILABLE'], status.HTTP_503_SERVICE_UNAVAILABLE)
 
-                return get_response_schema({}, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
+        if not order_existed:
+            notify_service_request_raised(service_request, service_request.service)
 
-            except:
-                return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
+        return_data = {
+            'payment': PaymentForBookingCreateSerializer(payment_obj).data
+        }
 
-        else:
+        return get_response_schema(return_data, get_global_success_messages()['RECORD_CREATED'], status.HTTP_201_CREATED)
 
-            try:
-                check = client.utility.verify_payment_signature(request.data)
 
-                if check:
+class ServiceRequestCallback(GenericAPIView):
+    """ View: ServiceRequest callback to confirm payment Resident User """
 
-                    payment_status = Payment.PaymentStatus.SUCCESS
+    def get_outcome(self, payment_pk):
+        """ Stored payment and booking of the order, what every repeated callback answers with """
 
-                    is_active = True
+        service_request_queryset = ServiceRequest.objects.select_related(
+            'payment_info'
+        ).filter(
+            payment_info_id=payment_pk
+        )
 
-                else:
+        if not service_request_queryset:
+            return None
 
-                    payment_status = Payment.PaymentStatus.FAIL
+        service_request_obj = service_request_queryset[0]
 
-                    is_active = False
+        return {
+            'payment': PaymentForBookingCreateSerializer(service_request_obj.payment_info).data,
+            'service_request': ServiceRequestCreateSerializer(service_request_obj).data
+        }
 
-            except Exception as e:
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'razorpay_order_id': openapi.Schema(type=openapi.TYPE_STRING),
+                'razorpay_payment_id': openapi.Schema(type=openapi.TYPE_STRING),
+                'razorpay_signature': openapi.Schema(type=openapi.TYPE_STRING),
+            },
+        )
+    )
+    def post(self, request, format=None):
 
-                payment_status = Payment.PaymentStatus.FAIL
+        order_id = request.data.get('razorpay_order_id') or ''
+        payment_id = request.data.get('razorpay_payment_id') or ''
+        signature = request.data.get('razorpay_signature') or ''
+
+        # Unique index on the order id, the booking is found without asking the gateway
+        payment_queryset = Payment.objects.filter(
+            order_id=order_id
+        ).exclude(
+            order_id=''
+        ).only(
+            'pk',
+            'payment_status'
+        )
 
-                is_active = False
+        if not payment_queryset:
+            return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
-            try:
-                if service_request_queryset:
+        payment_obj = payment_queryset[0]
 
-                    payment_obj = service_request_queryset.first().payment_info
+        if payment_id == '' and signature == '':
 
-                    data={
-                        'payment_status': payment_status,
-                        'payment_id': request.data['razorpay_payment_id'],
-                        'signature': request.data['razorpay_signature']
-                    }
+            # Checkout abandoned, the pending payment goes and its booking with it (cascade)
+            deleted, _ = Payment.objects.filter(
+                pk=payment_obj.pk,
+                payment_status=Payment.PaymentStatus.PENDING
+            ).delete()
 
-                    payment_update_serialzier = PaymentForBookingCreateSerializer(payment_obj, data=data, partial=True)
+            if deleted:
+                return get_response_schema({}, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
 
-                    if payment_update_serialzier.is_valid():
+        # Checked locally against the key secret, no gateway round trip
+        elif verify_payment_signature(order_id, payment_id, signature):
 
-                        with transaction.atomic():
+            # A no-op when the webhook worker or reconcile_payments settled it first
+            settle_payment(payment_obj.pk, payment_id, signature)
 
-                            payment_obj = payment_update_serialzier.save()
+        elif payment_obj.payment_status == Payment.PaymentStatus.PENDING:
 
-                            service_request_obj = service_request_queryset.first()
+            # A forged or corrupted signature leaves the payment untouched, the genuine callback can still settle it
+            return_data = {
+                settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['INVALID_PAYMENT_SIGNATURE']]
+            }
+            return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
-                            service_request_data = {
-                                'is_active': is_active
-                            }
+        # First or repeated callback, both answer with what is stored
+        return_data = self.get_outcome(payment_obj.pk)
 
-                            service_request_update_serializer = ServiceRequestCreateSerializer(service_request_obj, data=service_request_data, partial=True)
+        if return_data is None:
+            return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
-                            if service_request_update_serializer.is_valid():
+        return get_response_schema(return_data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
 
-                                service_request_update_serializer.save()
 
-                                return_data = {
-                                    'payment': payment_update_serialzier.data,
-                                    'service_request': service_request_update_serializer.data
-                                }
+class PaymentWebhook(GenericAPIView):
+    """ View: Razorpay webhook, stores the signed event for manage.py process_payment_webhooks """
 
-                                return get_response_schema(return_data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
+    # The gateway signs the body instead of sending a token
+    authentication_classes = []
 
-                            # ServiceRequestCreateSerializer serializer errors
-                            # Rollback the transaction
-                            transaction.set_rollback(True)
+    @swagger_auto_schema(auto_schema=None)
+    def post(self, request, format=None):
 
-                            return_data = {
-                                settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
-                                get_global_values()['ERROR_KEY']: service_request_update_serializer.errors
-                            }
-                            return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+        # Read before anything parses the request, the signature covers the exact bytes
+        body = request.body
 
-                    else:
-                        # PaymentForBookingCreateSerializer serializer errors
-                        return_data = {
-                            settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['SOMETHING_WENT_WRONG']],
-                            get_global_values()['ERROR_KEY']: payment_update_serialzier.errors
-                        }
-                        return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
+        if not verify_webhook_signature(body, request.headers.get('X-Razorpay-Signature', '')):
+            return_data = {
+                settings.REST_FRAMEWORK['NON_FIELD_ERRORS_KEY']: [get_global_error_messages()['INVALID_PAYMENT_SIGNATURE']]
+            }
+            return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
-                else:
-                    return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)    
+        # A redelivered event is already stored, it is acknowledged the same way
+        PaymentWebhookEvent.objects.bulk_create(
+            [
+                PaymentWebhookEvent(
+                    event_id=get_webhook_event_id(request.headers.get('X-Razorpay-Event-Id', ''), body),
+                    payload=body.decode('utf-8', 'replace')
+                )
+            ],
+            ignore_conflicts=True
+        )
 
-            except:
-                return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
+        return get_response_schema({}, get_global_success_messages()['RECORD_CREATED'], status.HTTP_200_OK)
 
 
 class ServiceBookingHistoryListFilter(ListAPIView):
@@ -954,7 +1023,7 @@ class ServiceBookingsListFilterForOrganizationAdministrator(ListAPIView):
         if not permissions['allowed']:
             return []
 
-        queryset = ServiceRequest.objects.select_related(
+        queryset = ServiceRequest.org_objects.select_related(
             'service',
             'service__subcategory',
             'service__subcategory__category',
@@ -963,7 +1032,6 @@ class ServiceBookingsListFilterForOrganizationAdministrator(ListAPIView):
             'requested_user',
         ).filter(
             is_active=True,
-            service__owner_organization=self.request.user.user_details.organization
         ).order_by(
             '-requested_date',
         )
@@ -1027,7 +1095,7 @@ class EstablishmentDropdownForOrganizationAdministrator(GenericAPIView):
         ).filter(
             is_active=True,
             building__flat__requested_service__is_active=True,
-            building__flat__requested_service__service__owner_organization=self.request.user.user_details.organization
+            building__flat__requested_service__service__owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             'name',
             'owner_organization__name'
@@ -1056,9 +1124,9 @@ class RequestedUserDropdownForOrganizationAdministrator(GenericAPIView):
 
         queryset = get_user_model().objects.filter(
             is_active=True,
-            user_role__role__id__in=[get_global_values()['RESIDENT_USERS_ROLE_ID']],
+            role_mask__has_any_role=get_role_mask([get_global_values()['RESIDENT_USERS_ROLE_ID']]),
             requested_user__is_active=True,
-            requested_user__service__owner_organization=self.request.user.user_details.organization
+            requested_user__service__owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             'first_name',
             'last_name',
@@ -1087,10 +1155,10 @@ class AssignedUserDropdownForOrganizationAdministrator(GenericAPIView):
 
         queryset = get_user_model().objects.filter(
             is_active=True,
-            user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']],
+            role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']]),
             service_provider__is_active=True,
             service_provider__service_request_status=ServiceRequest.ServiceRequestStatus.ASSIGNED,
-            service_provider__service__owner_organization=self.request.user.user_details.organization
+            service_provider__service__owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             'first_name',
             'last_name',
@@ -1124,10 +1192,11 @@ class UpdateServiceRequestStatusForOrganizationAdministrator(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        service_request_queryset = ServiceRequest.objects.filter(
+        service_request_queryset = ServiceRequest.org_objects.select_related(
+            'service'
+        ).filter(
             pk=pk,
             is_active=True,
-            service__owner_organization=self.request.user.user_details.organization,
             service_request_status=ServiceRequest.ServiceRequestStatus.PENDING,
             requested_date__gte = date.today()
         )
@@ -1140,15 +1209,16 @@ class UpdateServiceRequestStatusForOrganizationAdministrator(GenericAPIView):
 
             if serializer.is_valid():
 
-                serializer.save()
+                # The notification is queued in the same transaction as the status change
+                with transaction.atomic():
 
-                # Notification sending scenario
+                    serializer.save()
 
-                msg = "Status has been updated for " + str(service_request.service.name) + " service."
+                    # Notification sending scenario
 
-                requested_user_obj = service_request.requested_user
+                    msg = "Status has been updated for " + str(service_request.service.name) + " service."
 
-                send_notification(requested_user_obj,get_global_success_messages()['STATUS_UPDATED'], msg)
+                    enqueue_notification(service_request.requested_user_id,get_global_success_messages()['STATUS_UPDATED'], msg, get_coalesce_key(service_request))
 
                 return get_response_schema(serializer.data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
 
@@ -1182,10 +1252,11 @@ class AssignedUserToServiceRequestForOrganizationAdministrator(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        service_request_queryset = ServiceRequest.objects.filter(
+        service_request_queryset = ServiceRequest.org_objects.select_related(
+            'service'
+        ).filter(
             pk=pk,
             is_active=True,
-            service__owner_organization=self.request.user.user_details.organization,
             service_request_status=ServiceRequest.ServiceRequestStatus.APPROVED,
             requested_date__gte = date.today()
         )
@@ -1194,8 +1265,8 @@ class AssignedUserToServiceRequestForOrganizationAdministrator(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['assigned_user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']],
-            user_detail__organization=request.user.user_details.organization
+            role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']]),
+            user_detail__organization_id=get_user_organization_id(request)
         )
 
         if service_request_queryset:
@@ -1211,23 +1282,22 @@ class AssignedUserToServiceRequestForOrganizationAdministrator(GenericAPIView):
 
                 if serializer.is_valid():
 
-                    serializer.save()
-
-                    # Notification sending scenario
+                    # The notifications are queued in the same transaction as the assignment
+                    with transaction.atomic():
 
-                    # To send notification to employee
-                    msg = "New Service request has been assigned for " + str(service_request.service.name) + " service."
+                        serializer.save()
 
-                    assigned_user_obj = service_request.assigned_user
+                        # Notification sending scenario
 
-                    send_notification(assigned_user_obj,get_global_success_messages()['REQUEST_ASSIGNED'], msg)
+                        # To send notification to employee
+                        msg = "New Service request has been assigned for " + str(service_request.service.name) + " service."
 
-                    # To send notification to resident user
-                    msg = "An employee has been assigned for " + str(service_request.service.name) + " service."
+                        enqueue_notification(service_request.assigned_user_id,get_global_success_messages()['REQUEST_ASSIGNED'], msg, get_coalesce_key(service_request))
 
-                    requested_user_obj = service_request.requested_user
+                        # To send notification to resident user
+                        msg = "An employee has been assigned for " + str(service_request.service.name) + " service."
 
-                    send_notification(requested_user_obj,get_global_success_messages()['EMPLOYEE_ASSIGNED'], msg)
+                        enqueue_notification(service_request.requested_user_id,get_global_success_messages()['EMPLOYEE_ASSIGNED'], msg, get_coalesce_key(service_request))
 
                     return get_response_schema(serializer.data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
 
@@ -1261,12 +1331,12 @@ class AssignedUserToServiceRequestDropdownForOrganizationAdministrator(GenericAP
 
         queryset = get_user_model().objects.filter(
             is_active=True,
-            user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']],
-            user_detail__organization=self.request.user.user_details.organization
+            role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']]),
+            user_detail__organization_id=get_user_organization_id(self.request)
         ).order_by(
             'first_name',
             'last_name',
-        ).distinct()
+        )
 
         user_display_serializer = UserDisplaySerializer(queryset, many=True)
 
@@ -1308,7 +1378,9 @@ class CompleteServiceRequest(GenericAPIView):
                 }
                 return get_response_schema(return_data, get_global_error_messages()['CURRENT_FLAT_NOT_FOUND'], status.HTTP_200_OK)
 
-            service_request_queryset = ServiceRequest.objects.filter(
+            service_request_queryset = ServiceRequest.objects.select_related(
+                'service__owner_organization'
+            ).filter(
                 pk=pk,
                 is_active=True,
                 requested_user=request.user,
@@ -1319,10 +1391,11 @@ class CompleteServiceRequest(GenericAPIView):
 
         if permissions[str(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])]:
 
-            service_request_queryset = ServiceRequest.objects.filter(
+            service_request_queryset = ServiceRequest.org_objects.select_related(
+                'service__owner_organization'
+            ).filter(
                 pk=pk,
                 is_active=True,
-                service__owner_organization=self.request.user.user_details.organization,
                 service_request_status=ServiceRequest.ServiceRequestStatus.ASSIGNED,
                 requested_date__gte = date.today()
             )
@@ -1341,27 +1414,29 @@ class CompleteServiceRequest(GenericAPIView):
 
             if serializer.is_valid():
 
-                serializer.save()
+                # The notifications are queued in the same transaction as the completion
+                with transaction.atomic():
 
-                # Notification sending scenario
+                    serializer.save()
 
-                msg = "Status has been marked completed for " + str(service_request.service.name) + " service request."
+                    # Notification sending scenario
 
-                assigned_user_obj = service_request.assigned_user
+                    msg = "Status has been marked completed for " + str(service_request.service.name) + " service request."
 
-                if permissions[str(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])]:
+                    # Recipient ids straight from the loaded rows, queued together and merged with earlier updates of the request
+                    recipient_ids = [service_request.assigned_user_id]
 
-                    requested_user_obj = service_request.requested_user
+                    if permissions[str(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])]:
 
-                    send_notification(requested_user_obj,get_global_success_messages()['SERVICE_REQUEST_MARKED_COMPLETED'], msg)
+                        recipient_ids.append(service_request.requested_user_id)
 
-                if permissions[str(get_global_values()['RESIDENT_USERS_ROLE_ID'])]:
+                    enqueue_notifications(recipient_ids,get_global_success_messages()['SERVICE_REQUEST_MARKED_COMPLETED'], msg, get_coalesce_key(service_request))
 
-                    oragnization_administrator_user_obj = service_request.service.owner_organization.owner_user
+                    if permissions[str(get_global_values()['RESIDENT_USERS_ROLE_ID'])]:
 
-                    send_notification(oragnization_administrator_user_obj,get_global_success_messages()['SERVICE_REQUEST_MARKED_COMPLETED'], msg)
+                        oragnization_administrator_user_id = service_request.service.owner_organization.owner_user_id
 
-                send_notification(assigned_user_obj,get_global_success_messages()['SERVICE_REQUEST_MARKED_COMPLETED'], msg)
+                        enqueue_notification(oragnization_administrator_user_id,get_global_success_messages()['SERVICE_REQUEST_MARKED_COMPLETED'], msg, get_coalesce_key(service_request), NotificationOutbox.Priority.LOW)
 
                 return get_response_schema(serializer.data, get_global_success_messages()['RECORD_UPDATED'], status.HTTP_200_OK)
 
@@ -1403,7 +1478,7 @@ class ServiceBookingsForEmployeeListFilter(ListAPIView):
         ).filter(
             Q(is_active=True) &
             Q(assigned_user=self.request.user) &
-            Q(service__owner_organization=self.request.user.user_details.organization) &
+            Q(service__owner_organization_id=get_user_organization_id(self.request)) &
             ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.PENDING) &
             ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.REJECTED) &
             ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.APPROVED)
@@ -1467,7 +1542,7 @@ class EstablishmentDropdownForEmployee(GenericAPIView):
             is_active=True,
             building__flat__requested_service__is_active=True,
             building__flat__requested_service__assigned_user=self.request.user,
-            building__flat__requested_service__service__owner_organization=self.request.user.user_details.organization
+            building__flat__requested_service__service__owner_organization_id=get_user_organization_id(self.request)
         ).filter(
             Q(building__flat__requested_service__service_request_status=ServiceRequest.ServiceRequestStatus.ASSIGNED) |
             Q(building__flat__requested_service__service_request_status=ServiceRequest.ServiceRequestStatus.COMPLETED) 
@@ -1499,10 +1574,10 @@ class RequestedUserDropdownForEmployee(GenericAPIView):
 
         queryset = get_user_model().objects.filter(
             is_active=True,
-            user_role__role__id__in=[get_global_values()['RESIDENT_USERS_ROLE_ID']],
+            role_mask__has_any_role=get_role_mask([get_global_values()['RESIDENT_USERS_ROLE_ID']]),
             requested_user__is_active=True,
             requested_user__assigned_user=self.request.user,
-            requested_user__service__owner_organization=self.request.user.user_details.organization,
+            requested_user__service__owner_organization_id=get_user_organization_id(self.request),
         ).filter(
             Q(requested_user__service_request_status=ServiceRequest.ServiceRequestStatus.ASSIGNED) |
             Q(requested_user__service_request_status=ServiceRequest.ServiceRequestStatus.COMPLETED)
@@ -1550,7 +1625,7 @@ class ServiceRequestDetail(GenericAPIView):
                 Q(pk=pk) &
                 Q(is_active=True) &
                 Q(assigned_user=self.request.user) &
-                Q(service__owner_organization=self.request.user.user_details.organization) &
+                Q(service__owner_organization_id=get_user_organization_id(self.request)) &
                 ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.PENDING) &
                 ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.REJECTED) &
                 ~Q(service_request_status=ServiceRequest.ServiceRequestStatus.APPROVED)
@@ -1586,7 +1661,7 @@ class ServiceRequestDetail(GenericAPIView):
 
         if permissions[str(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])]:
 
-            service_request_queryset = ServiceRequest.objects.select_related(
+            service_request_queryset = ServiceRequest.org_objects.select_related(
                 'service',
                 'service__owner_organization',
                 'service__subcategory',
@@ -1600,7 +1675,6 @@ class ServiceRequestDetail(GenericAPIView):
             ).filter(
                 pk=pk,
                 is_active=True,
-                service__owner_organization=self.request.user.user_details.organization
             )
 
         if service_request_queryset.exists():
@@ -1,7 +1,7 @@
 # Package imports
 from django.conf import settings
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from rest_framework.response import Response
@@ -48,7 +48,8 @@ from app.utils import (
     get_response_schema,
     get_global_success_messages,
     get_global_error_messages,
-    get_global_values
+    get_global_values,
+    get_user_organization_id,
 )
 from app.permissions import (
     does_permission_exist
@@ -84,7 +85,7 @@ class ServiceCategoryCreate(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        request.data['owner_organization'] = request.user.user_details.organization.id
+        request.data['owner_organization'] = get_user_organization_id(request)
 
         serializer = ServiceCategoryCreateSerializer(data=request.data)
 
@@ -111,10 +112,9 @@ class ServiceCategoryDetail(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        service_category_queryset = ServiceCategory.objects.filter(
+        service_category_queryset = ServiceCategory.org_objects.filter(
             pk=pk,
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         )
 
@@ -148,7 +148,7 @@ class ServiceCategoryDetail(GenericAPIView):
         if service_category == None:    
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
-        request.data['owner_organization'] = request.user.user_details.organization.id
+        request.data['owner_organization'] = get_user_organization_id(request)
 
         serializer = ServiceCategoryCreateSerializer(service_category, data=request.data)
 
@@ -188,9 +188,8 @@ class ServiceCategoryList(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        queryset = ServiceCategory.objects.filter(
+        queryset = ServiceCategory.org_objects.filter(
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -220,9 +219,8 @@ class ServiceCategoryListFilter(ListAPIView):
         if not permissions['allowed']:
             return []
 
-        queryset = ServiceCategory.objects.filter(
+        queryset = ServiceCategory.org_objects.filter(
             is_active=True,
-            owner_organization_id=self.request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -270,16 +268,15 @@ class ServiceSubCategoryCreate(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
         # Checking for valid category ID
-        service_category_queryset = ServiceCategory.objects.filter(
+        service_category_queryset = ServiceCategory.org_objects.filter(
             pk = request.data['category'],
             is_active=True,
-            owner_organization=request.user.user_details.organization,
             owner_organization__is_active=True
         )
 
         if service_category_queryset:
 
-            request.data['owner_organization'] = request.user.user_details.organization.id
+            request.data['owner_organization'] = get_user_organization_id(request)
 
             serializer = ServiceSubCategoryCreateSerializer(data=request.data)
 
@@ -312,12 +309,11 @@ class ServiceSubCategoryDetail(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        service_sub_category_queryset = ServiceSubCategory.objects.select_related(
+        service_sub_category_queryset = ServiceSubCategory.org_objects.select_related(
             'category'
         ).filter(
             pk=pk,
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         )
 
@@ -353,16 +349,15 @@ class ServiceSubCategoryDetail(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         # Checking for valid category ID
-        service_category_queryset = ServiceCategory.objects.filter(
+        service_category_queryset = ServiceCategory.org_objects.filter(
             pk = request.data['category'],
             is_active=True,
-            owner_organization=request.user.user_details.organization,
             owner_organization__is_active=True
         )
 
         if service_category_queryset:
 
-            request.data['owner_organization'] = request.user.user_details.organization.id
+            request.data['owner_organization'] = get_user_organization_id(request)
 
             serializer = ServiceSubCategoryCreateSerializer(service_sub_category, data=request.data)
 
@@ -407,11 +402,10 @@ class ServiceSubCategoryList(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        queryset = ServiceSubCategory.objects.select_related(
+        queryset = ServiceSubCategory.org_objects.select_related(
             'category'
         ).filter(
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -441,11 +435,10 @@ class ServiceSubCategoryListFilter(ListAPIView):
         if not permissions['allowed']:
             return []
 
-        queryset = ServiceSubCategory.objects.select_related(
+        queryset = ServiceSubCategory.org_objects.select_related(
             'category'
         ).filter(
             is_active=True,
-            owner_organization_id=self.request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -495,16 +488,15 @@ class ServiceCreate(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
         # Checking for valid category ID
-        service_sub_category_queryset = ServiceSubCategory.objects.filter(
+        service_sub_category_queryset = ServiceSubCategory.org_objects.filter(
             pk = request.data['subcategory'],
             is_active=True,
-            owner_organization=request.user.user_details.organization,
             owner_organization__is_active=True
         )
 
         if service_sub_category_queryset:
 
-            request.data['owner_organization'] = request.user.user_details.organization.id
+            request.data['owner_organization'] = get_user_organization_id(request)
 
             serializer = ServiceCreateSerializer(data=request.data)
 
@@ -537,13 +529,12 @@ class ServiceDetail(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        service_queryset = Service.objects.select_related(
+        service_queryset = Service.org_objects.select_related(
             'subcategory',
             'subcategory__category',
         ).filter(
             pk=pk,
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         )
 
@@ -581,16 +572,15 @@ class ServiceDetail(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         # Checking for valid category ID
-        service_sub_category_queryset = ServiceSubCategory.objects.filter(
+        service_sub_category_queryset = ServiceSubCategory.org_objects.filter(
             pk = request.data['subcategory'],
             is_active=True,
-            owner_organization=request.user.user_details.organization,
             owner_organization__is_active=True
         )
 
         if service_sub_category_queryset:
 
-            request.data['owner_organization'] = request.user.user_details.organization.id
+            request.data['owner_organization'] = get_user_organization_id(request)
 
             serializer = ServiceCreateSerializer(service, data=request.data)
 
@@ -635,12 +625,11 @@ class ServiceList(GenericAPIView):
         if not permissions['allowed']:
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
-        queryset = Service.objects.select_related(
+        queryset = Service.org_objects.select_related(
             'subcategory',
             'subcategory__category',
         ).filter(
             is_active=True,
-            owner_organization_id=request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -670,12 +659,11 @@ class ServiceListFilter(ListAPIView):
         if not permissions['allowed']:
             return []
 
-        queryset = Service.objects.select_related(
+        queryset = Service.org_objects.select_related(
             'subcategory',
             'subcategory__category',
         ).filter(
             is_active=True,
-            owner_organization_id=self.request.user.user_details.organization.id,
             owner_organization__is_active=True
         ).order_by(
             'name'
@@ -725,10 +713,9 @@ class ServiceSlotCreate(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
         # Validating service ID
-        service_queryset = Service.objects.filter(
+        service_queryset = Service.org_objects.filter(
             pk=request.data['service'],
             is_active=True,
-            owner_organization=request.user.user_details.organization
         )
 
         if service_queryset:
@@ -767,7 +754,7 @@ class ServiceSlotDetail(GenericAPIView):
         ).filter(
             pk=pk,
             is_active=True,
-            service__owner_organization=request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(request)
         )
 
         if service_slot_queryset:
@@ -820,10 +807,9 @@ class ServiceSlotDetail(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         # Validating service ID
-        service_queryset = Service.objects.filter(
+        service_queryset = Service.org_objects.filter(
             pk=request.data['service'],
             is_active=True,
-            owner_organization=request.user.user_details.organization
         )
 
         if service_queryset:
@@ -890,7 +876,7 @@ class ServiceSlotList(GenericAPIView):
             'service__subcategory__category',
         ).filter(
             is_active=True,
-            service__owner_organization=request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(request)
         ).order_by(
             'day_of_week',
             'service__name',
@@ -927,7 +913,7 @@ class ServiceSlotListFilter(ListAPIView):
             'service__subcategory__category',
         ).filter(
             is_active=True,
-            service__owner_organization=self.request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             'day_of_week',
             'service__name',
@@ -980,10 +966,9 @@ class ServiceExclusionCreate(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['FORBIDDEN'], status.HTTP_403_FORBIDDEN)
 
         # Validating service ID
-        service_queryset = Service.objects.filter(
+        service_queryset = Service.org_objects.filter(
             pk=request.data['service'],
             is_active=True,
-            owner_organization=request.user.user_details.organization
         )
 
         if service_queryset:
@@ -1021,7 +1006,7 @@ class ServiceExclusionDetail(GenericAPIView):
             'service__subcategory__category',
         ).filter(
             pk=pk,
-            service__owner_organization=request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(request)
         )
 
         if service_exclusion_queryset:
@@ -1072,10 +1057,9 @@ class ServiceExclusionDetail(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         # Validating service ID
-        service_queryset = Service.objects.filter(
+        service_queryset = Service.org_objects.filter(
             pk=request.data['service'],
             is_active=True,
-            owner_organization=request.user.user_details.organization
         )
 
         if service_queryset:
@@ -1139,7 +1123,7 @@ class ServiceExclusionList(GenericAPIView):
             'service__subcategory',
             'service__subcategory__category',
         ).filter(
-            service__owner_organization=request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(request)
         ).order_by(
             '-exclusion_date',
             'service__name',
@@ -1175,7 +1159,7 @@ class ServiceExclusionListFilter(ListAPIView):
             'service__subcategory',
             'service__subcategory__category',
         ).filter(
-            service__owner_organization=self.request.user.user_details.organization
+            service__owner_organization_id=get_user_organization_id(self.request)
         ).order_by(
             '-exclusion_date',
             'service__name',
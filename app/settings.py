@@ -70,9 +70,16 @@ INSTALLED_APPS = [
     'app.services',
     'app.attendance',
     'app.service_booking',
+    'app.notifications',
 ]
 
+# app.middleware.RoutingMiddleware picks the stack below per request
 MIDDLEWARE = [
+    'app.middleware.RoutingMiddleware',
+]
+
+# Full stack for /admin/, /swagger/ and the debug toolbar
+FULL_MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -82,6 +89,25 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'app.middleware.RequestContextMiddleware',
+]
+
+# JWT-authenticated API calls use no session, CSRF cookie, messages, frames or toolbar
+API_MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'app.middleware.RequestContextMiddleware',
+]
+
+API_PATH_PREFIXES = ('/api/',)
+
+# The admin and toolbar checks only look at MIDDLEWARE, their middleware is in FULL_MIDDLEWARE
+SILENCED_SYSTEM_CHECKS = [
+    'admin.E408',
+    'admin.E409',
+    'admin.E410',
+    'debug_toolbar.W001',
 ]
 
 # CORS Configurations
@@ -123,6 +149,106 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Point CACHE_URL at a shared backend (e.g. redis://) so invalidations reach every worker
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+    # Throttle counters; local memory is only a stand-in for tests and single-worker development (check --deploy fails on it)
+    'throttle': env.cache('THROTTLE_CACHE_URL', default='locmemcache://throttle'),
+}
+
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+# Seconds a user's role IDs and permissions version stay cached; UserRole signals invalidate earlier.
+# Kept short, a stale entry left in another worker's cache outlives an invalidation by at most this long
+ROLE_CACHE_TIMEOUT = 60 * 5
+
+# Seconds a user's current flat stays cached; FlatMember signals invalidate earlier
+RESIDENT_CONTEXT_CACHE_TIMEOUT = 60 * 10
+
+# Seconds a user's guard and committee memberships stay cached; their signals invalidate earlier
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 10
+
+# Login OTPs: lifetime in seconds, length and where pending codes live
+# (app.users.otp.DatabaseOTPStore or app.users.otp.CacheOTPStore)
+OTP_EXPIRY_TIME = env.int('OTP_EXPIRY_TIME')
+OTP_DIGITS = 6
+OTP_STORE = env('OTP_STORE', default='app.users.otp.DatabaseOTPStore')
+
+# Skip django.contrib.auth.login() (session row, cookie, user_logged_in) on OTP login
+SESSIONLESS_API_LOGIN = env.bool('SESSIONLESS_API_LOGIN', default=True)
+
+# login() needs request.session and request.user, so the API stack keeps sessions while OTP login creates them
+if not SESSIONLESS_API_LOGIN:
+    API_MIDDLEWARE.insert(API_MIDDLEWARE.index('django.middleware.common.CommonMiddleware'), 'django.contrib.sessions.middleware.SessionMiddleware')
+    API_MIDDLEWARE.insert(API_MIDDLEWARE.index('app.middleware.RequestContextMiddleware'), 'django.contrib.auth.middleware.AuthenticationMiddleware')
+
+# Seconds of overlap when reloading blacklisted refresh tokens, covers rows committed late by slow transactions
+REVOKED_TOKEN_LOOKBACK = 60
+
+# Push notifications (FCM legacy HTTP API), delivered by manage.py process_notification_outbox
+FCM_URL = env('FCM_URL', default='https://fcm.googleapis.com/fcm/send')
+FCM_TOKEN = env('FCM_TOKEN', default='')
+# Instance ID API, (un)subscribes devices to broadcast topics
+FCM_IID_URL = env('FCM_IID_URL', default='https://iid.googleapis.com/iid/v1')
+FCM_TIMEOUT = 5
+# Devices per multicast request (the FCM limit) and keep-alive connections kept per worker
+FCM_MULTICAST_LIMIT = 1000
+FCM_POOL_SIZE = 10
+FCM_NOTIFICATION_ICON = 'https://static.vecteezy.com/system/resources/previews/010/366/202/original/bell-icon-transparent-notification-free-png.png'
+
+# Outbox worker: rows per batch, attempts before giving up, backoff (seconds, doubled per attempt) and lease
+NOTIFICATION_OUTBOX_BATCH_SIZE = 500
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = 8
+NOTIFICATION_OUTBOX_BACKOFF = 30
+NOTIFICATION_OUTBOX_MAX_BACKOFF = 60 * 60
+# A worker stops sending once the lease is about to run out and hands the unsent rows back, so the lease has
+# to leave room for at least one request (connect and read timeout) and should cover a typical batch
+NOTIFICATION_OUTBOX_LEASE = 60 * 5
+# Dead device tokens deleted per query
+PUSH_TOKEN_PRUNE_BATCH_SIZE = 500
+# Seconds a coalescable notification waits for newer messages with its key, and a digest collects low-priority ones
+NOTIFICATION_COALESCE_WINDOW = 10
+NOTIFICATION_DIGEST_WINDOW = 60 * 15
+# Latest messages shown in a digest, and its body size in bytes (FCM refuses payloads over 4KB)
+NOTIFICATION_DIGEST_LINES = 5
+NOTIFICATION_DIGEST_MAX_BYTES = 2048
+
+# Razorpay API root, point it at manage.py razorpay_stub_server for local runs
+RAZORPAY_BASE_URL = env('RAZORPAY_BASE_URL', default='https://api.razorpay.com/v1')
+RAZORPAY_KEY_ID = env('PUBLIC_KEY', default='')
+RAZORPAY_KEY_SECRET = env('SECRET_KEY', default='')
+# Secret of the webhook set up in the Razorpay dashboard, webhooks are refused while it is empty
+RAZORPAY_WEBHOOK_SECRET = env('RAZORPAY_WEBHOOK_SECRET', default='')
+
+# Payment gateway (connect, read) timeouts in seconds, bookings commit before the gateway is called
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)
+# Keep-alive connections kept per worker
+PAYMENT_GATEWAY_POOL_SIZE = 10
+# Extra attempts of read-only gateway calls and their backoff (seconds, doubled per attempt, jittered)
+PAYMENT_GATEWAY_RETRIES = 2
+PAYMENT_GATEWAY_BACKOFF = 0.2
+# Consecutive failed calls that open the circuit, and seconds it stays open before one trial call goes through
+PAYMENT_GATEWAY_FAILURE_THRESHOLD = 5
+PAYMENT_GATEWAY_COOLDOWN = 30
+
+# manage.py reconcile_payments: seconds before a pending payment is checked with the gateway, and before an unpaid one is dropped
+PAYMENT_RECONCILE_AFTER = 60 * 30
+PAYMENT_ABANDON_AFTER = 60 * 60 * 24
+
+# manage.py process_payment_webhooks: stored webhook events applied per transaction
+PAYMENT_WEBHOOK_BATCH_SIZE = 500
+
+# Build request.user from the access token and load the user row only when a view needs it
+JWT_STATELESS_AUTHENTICATION = env.bool('JWT_STATELESS_AUTHENTICATION', default=True)
+
+# Per-process LRU of hot users for stateless authentication (entries, seconds)
+HOT_USER_CACHE_SIZE = 1024
+HOT_USER_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -167,12 +293,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Rest framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.JWTAuthentication',
     ),
     'NON_FIELD_ERRORS_KEY': 'detail',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 5,
     'COERCE_DECIMAL_TO_STRING': False,
+    'DEFAULT_THROTTLE_RATES': {
+        'otp_phone': env('OTP_PHONE_THROTTLE_RATE', default='5/min'),
+        'otp_ip': env('OTP_IP_THROTTLE_RATE', default='60/min'),
+    },
 }
 
 # Custom user model
@@ -199,7 +329,7 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'USER_AUTHENTICATION_RULE': 'rest_framework_simplejwt.authentication.default_user_authentication_rule',
 
-    'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'AUTH_TOKEN_CLASSES': ('app.tokens.CustomAccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
 
@@ -0,0 +1,101 @@
+# Package imports
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class SlidingWindowThrottle(SimpleRateThrottle):
+    """ Throttle: Sliding window counter kept in the shared throttle cache, so every worker enforces the same limit """
+
+    def __init__(self):
+        super().__init__()
+
+        self.cache = caches[settings.THROTTLE_CACHE_ALIAS]
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+
+        window = int(self.now // self.duration)
+        current_key = '%s:%d' % (self.key, window)
+        previous_key = '%s:%d' % (self.key, window - 1)
+
+        # add and incr are atomic in the cache, concurrent requests never spend the same slot.
+        # The counter outlives its window, it is weighted into the next one as the previous window
+        self.cache.add(current_key, 0, self.duration * 2)
+
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Evicted between add and incr
+            self.cache.add(current_key, 1, self.duration * 2)
+            current = 1
+
+        previous = self.cache.get(previous_key, 0)
+
+        # Share of the current window gone by, the previous window counts for the rest
+        elapsed = (self.now % self.duration) / self.duration
+
+        if previous * (1 - elapsed) + current <= self.num_requests:
+            return True
+
+        # Rejected requests give their slot back, hammering does not push the limit further out
+        self.cache.decr(current_key)
+
+        self.wait_seconds = self.get_wait_seconds(previous, current - 1, elapsed)
+
+        return False
+
+    def get_wait_seconds(self, previous, current, elapsed):
+        """ Seconds until one more request fits, rejections never touch the database """
+
+        if current >= self.num_requests or not previous:
+            return (1 - elapsed) * self.duration
+
+        # The previous window's weight has to drop far enough for one more request
+        fits_at = 1 - (self.num_requests - 1 - current) / previous
+
+        return max(0, fits_at - elapsed) * self.duration
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class PhoneRateThrottle(SlidingWindowThrottle):
+    """ Throttle: Sliding window per phone number in the request body """
+
+    scope = 'otp_phone'
+
+    def get_cache_key(self, request, view):
+        # A JSON list or scalar body has no phone, the view rejects it
+        if not isinstance(request.data, dict):
+            return None
+
+        phone = request.data.get('phone')
+
+        if not phone:
+            return None
+
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': str(phone).strip()
+        }
+
+
+class ClientIPRateThrottle(SlidingWindowThrottle):
+    """ Throttle: Sliding window per client IP address """
+
+    scope = 'otp_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
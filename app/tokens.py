@@ -0,0 +1,258 @@
+# Package imports
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+)
+from rest_framework_simplejwt.tokens import (
+    AccessToken,
+    RefreshToken,
+)
+
+# Model imports
+from app.core.models import (
+    UserDetail,
+)
+
+# Utility imports
+from app.utils import (
+    get_global_values,
+    is_shared_cache,
+)
+
+
+# Start permissions version helpers
+def get_permissions_version_cache_key(user_id):
+    """ Token: Cache key holding the permissions version of the user """
+
+    return 'permissions_version:' + str(user_id)
+
+
+def get_permissions_version(user_id):
+    """ Token: Current permissions version of an active user from the shared cache, None for inactive or deleted users """
+
+    cache_key = get_permissions_version_cache_key(user_id)
+
+    permissions_version = cache.get(cache_key)
+
+    if permissions_version is None:
+
+        # Deactivation is read here rather than trusted to the signals, a queryset update() sends none.
+        # It takes effect once the cached version expires (ROLE_CACHE_TIMEOUT), or at once when the signal bumps it
+        permissions_version = get_user_model().objects.filter(
+            pk=user_id,
+            is_active=True
+        ).values_list(
+            'permissions_version',
+            flat=True
+        ).first()
+
+        if permissions_version is None:
+            return None
+
+        cache.set(cache_key, permissions_version, settings.ROLE_CACHE_TIMEOUT)
+
+    return permissions_version
+
+
+def bump_permissions_version(user_id):
+    """ Token: Invalidate every access token issued to the user before this call """
+
+    get_user_model().objects.filter(
+        pk=user_id
+    ).update(
+        permissions_version=F('permissions_version') + 1
+    )
+
+    cache_key = get_permissions_version_cache_key(user_id)
+
+    cache.delete(cache_key)
+
+    # A concurrent request may have re-read the old version before our transaction committed
+    transaction.on_commit(lambda: cache.delete(cache_key))
+# End permissions version helpers
+
+
+# Start revoked token filter
+REVOKED_TOKEN_GENERATION_CACHE_KEY = 'revoked_token_generation'
+
+
+class RevokedTokenFilter:
+    """ Token: Per-process set of blacklisted refresh token JTIs, refreshed incrementally """
+
+    def __init__(self):
+        self.revoked_jtis = {}
+        self.generation = None
+        self.loaded_until = None
+        self.lock = threading.Lock()
+
+    def refresh(self, generation):
+        """ Load the tokens blacklisted since the last refresh and forget the expired ones """
+
+        now = timezone.now()
+
+        blacklisted_token_queryset = BlacklistedToken.objects.filter(
+            token__expires_at__gt=now
+        )
+
+        # Look back a little, a transaction may commit a row stamped before our previous refresh
+        if self.loaded_until is not None:
+            blacklisted_token_queryset = blacklisted_token_queryset.filter(
+                blacklisted_at__gte=self.loaded_until - timedelta(seconds=settings.REVOKED_TOKEN_LOOKBACK)
+            )
+
+        for jti, expires_at in blacklisted_token_queryset.values_list('token__jti', 'token__expires_at'):
+            self.revoked_jtis[jti] = expires_at
+
+        self.revoked_jtis = {
+            jti: expires_at for jti, expires_at in self.revoked_jtis.items() if expires_at > now
+        }
+
+        self.loaded_until = now
+        self.generation = generation
+
+    def is_revoked(self, jti):
+        """ Check the JTI, only querying the database when a token was blacklisted since the last check """
+
+        # A generation bump in a per-process cache never reaches the other workers, ask the database every time
+        if not is_shared_cache('default'):
+            return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+        generation = cache.get_or_set(REVOKED_TOKEN_GENERATION_CACHE_KEY, 0, None)
+
+        with self.lock:
+            if self.loaded_until is None or generation != self.generation:
+                self.refresh(generation)
+
+            return jti in self.revoked_jtis
+
+    def add(self, jti, expires_at):
+        """ Record a token blacklisted by this process """
+
+        with self.lock:
+            self.revoked_jtis[jti] = expires_at
+
+
+revoked_token_filter = RevokedTokenFilter()
+
+
+def bump_revoked_token_generation():
+    """ Token: Make every process reload its revoked token filter on the next check """
+
+    if not cache.add(REVOKED_TOKEN_GENERATION_CACHE_KEY, 1, None):
+        cache.incr(REVOKED_TOKEN_GENERATION_CACHE_KEY)
+# End revoked token filter
+
+
+def get_user_token_claims(user):
+    """ Token: Role, organization and permissions version claims of the user """
+
+    try:
+        organization_id = user.user_details.organization_id
+    except UserDetail.DoesNotExist:
+        organization_id = None
+
+    return {
+        get_global_values()['ROLES_CLAIM']: sorted(role.pk for role in user.role.all()),
+        get_global_values()['ORGANIZATION_CLAIM']: organization_id,
+        get_global_values()['PERMISSIONS_VERSION_CLAIM']: user.permissions_version,
+    }
+
+
+class CustomAccessToken(AccessToken):
+    """ Token: Access token whose claims are rejected once the user's permissions version moves on """
+
+    def verify(self):
+        super().verify()
+
+        permissions_version_claim = get_global_values()['PERMISSIONS_VERSION_CLAIM']
+
+        # Tokens issued without claims fall back to database lookups and stay valid
+        if permissions_version_claim not in self.payload:
+            return
+
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+
+        if self.payload[permissions_version_claim] != get_permissions_version(user_id):
+            raise TokenError(_('Token permissions are outdated'))
+
+
+class CustomRefreshToken(RefreshToken):
+    """ Token: Refresh token issuing access tokens with signed role and organization claims """
+
+    access_token_class = CustomAccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+
+        for claim, value in get_user_token_claims(user).items():
+            token[claim] = value
+
+        # The claims were just read from this user, the access token does not need to re-read them
+        token.claims_user = user
+
+        return token
+
+    def get_claims_user(self):
+        """ Return the user the claims are read from, loading it for tokens decoded from a string """
+
+        claims_user = getattr(self, 'claims_user', None)
+
+        if claims_user is not None:
+            return claims_user
+
+        # Re-read the claims so a refresh after a role change is not issued stale claims
+        user_queryset = get_user_model().objects.select_related(
+            'user_detail'
+        ).prefetch_related(
+            'role'
+        ).filter(
+            pk=self.payload[api_settings.USER_ID_CLAIM],
+            is_active=True
+        )
+
+        user = user_queryset.first()
+
+        if user is None:
+            raise TokenError(_('User not found'))
+
+        return user
+
+    def check_blacklist(self):
+        """ Check the JTI against the in-process revoked token filter instead of querying the blacklist """
+
+        if revoked_token_filter.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self):
+        blacklisted_token = super().blacklist()
+
+        revoked_token_filter.add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+
+        # Other processes reload once the blacklist row is visible to them
+        transaction.on_commit(bump_revoked_token_generation)
+
+        return blacklisted_token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+
+        user = self.get_claims_user()
+
+        for claim, value in get_user_token_claims(user).items():
+            access[claim] = value
+
+        return access
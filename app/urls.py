@@ -3,9 +3,11 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
-    TokenRefreshView,
     TokenVerifyView
 )
+from app.users.views import (
+    CustomTokenRefreshView,
+)
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -33,7 +35,7 @@ urlpatterns = [
 
     # JWT Authentication
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/refresh/', CustomTokenRefreshView.as_view(), name='token_refresh'),
     path('api/token/verify/', TokenVerifyView.as_view(), name='token_verify'),
 
     # App URLs
@@ -54,6 +56,7 @@ urlpatterns = [
     path('api/vehicle/', include('app.vehicle.urls')),
     path('api/role/', include('app.role.urls')),
     path('api/bill_payment/', include('app.bill_payment.urls')),
+    path('api/notifications/', include('app.notifications.urls')),
 
     # Debugging
     path('debuger/', include(debug_toolbar.urls)),
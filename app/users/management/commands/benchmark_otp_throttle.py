@@ -0,0 +1,64 @@
+# Package imports
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+# View imports
+from app.users.views import (
+    GenerateOTPLoginView,
+)
+
+# Utility imports
+from app.throttling import (
+    PhoneRateThrottle,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Measure how many throttled generate-otp requests per second one worker can reject """
+
+    help = 'Benchmark rejected requests per second of the OTP throttles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        view = GenerateOTPLoginView.as_view()
+
+        factory = APIRequestFactory()
+
+        # A phone nobody owns, so the requests that get through before the limit do not send OTPs
+        phone = str(uuid.uuid4().int)[:10]
+
+        throttle = PhoneRateThrottle()
+
+        if throttle.rate is None:
+            self.stdout.write('The otp_phone throttle is disabled, nothing to benchmark')
+            return
+
+        # Use up the phone's limit first, a window boundary crossed meanwhile lets through at most one limit more
+        for _ in range(throttle.num_requests * 2 + 1):
+            response = view(factory.post('/api/users/generate-otp/', {'phone': phone}, format='json'))
+
+            if response.status_code == 429:
+                break
+        else:
+            self.stdout.write('The otp_phone throttle never rejected a request, nothing to benchmark')
+            return
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+
+            for _ in range(options['requests']):
+                response = view(factory.post('/api/users/generate-otp/', {'phone': phone}, format='json'))
+
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write('Rejected requests: %d' % options['requests'])
+        self.stdout.write('Last status code: %d' % response.status_code)
+        self.stdout.write('Database queries while rejecting: %d' % len(queries))
+        self.stdout.write('Rejected requests per second: %.0f' % (options['requests'] / elapsed))
@@ -0,0 +1,60 @@
+# Package imports
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import (
+    BlacklistedToken,
+    OutstandingToken,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Delete expired outstanding and blacklisted refresh tokens in small batches (schedule it, e.g. daily) """
+
+    help = 'Prune expired refresh tokens from the token blacklist tables in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        now = timezone.now()
+
+        pruned_outstanding = 0
+        pruned_blacklisted = 0
+
+        while True:
+
+            # Short transactions per batch, the token tables stay writable for logins meanwhile
+            outstanding_token_ids = list(OutstandingToken.objects.filter(
+                expires_at__lte=now
+            ).order_by(
+                'id'
+            ).values_list(
+                'id',
+                flat=True
+            )[:batch_size])
+
+            if not outstanding_token_ids:
+                break
+
+            # Delete the dependants explicitly, so the cascade does not load every row into memory
+            blacklisted, _ = BlacklistedToken.objects.filter(
+                token_id__in=outstanding_token_ids
+            ).delete()
+
+            outstanding, _ = OutstandingToken.objects.filter(
+                id__in=outstanding_token_ids
+            ).delete()
+
+            pruned_blacklisted += blacklisted
+            pruned_outstanding += outstanding
+
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write('Outstanding tokens pruned: %d' % pruned_outstanding)
+        self.stdout.write('Blacklisted tokens pruned: %d' % pruned_blacklisted)
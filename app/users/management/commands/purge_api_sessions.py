@@ -0,0 +1,68 @@
+# Package imports
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """ Command: Delete the session rows left behind by OTP logins, keeping staff (admin) sessions """
+
+    help = 'Purge API login sessions in batches, staff sessions are kept unless expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        staff_user_ids = {
+            str(user_id) for user_id in get_user_model().objects.filter(
+                is_staff=True
+            ).values_list(
+                'pk',
+                flat=True
+            )
+        }
+
+        now = timezone.now()
+
+        purged = 0
+        kept = 0
+        last_session_key = ''
+
+        while True:
+
+            # Keyset pagination, deleted rows never shift the next batch
+            sessions = list(Session.objects.filter(
+                session_key__gt=last_session_key
+            ).order_by(
+                'session_key'
+            )[:batch_size])
+
+            if not sessions:
+                break
+
+            last_session_key = sessions[-1].session_key
+
+            purge_session_keys = []
+
+            for session in sessions:
+                user_id = session.get_decoded().get('_auth_user_id')
+
+                if session.expire_date > now and user_id in staff_user_ids:
+                    kept += 1
+                    continue
+
+                purge_session_keys.append(session.session_key)
+
+            if purge_session_keys and not options['dry_run']:
+                Session.objects.filter(
+                    session_key__in=purge_session_keys
+                ).delete()
+
+            purged += len(purge_session_keys)
+
+        self.stdout.write('Sessions purged: %d%s' % (purged, ' (dry run)' if options['dry_run'] else ''))
+        self.stdout.write('Staff sessions kept: %d' % kept)
@@ -0,0 +1,68 @@
+# Package imports
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+# Model imports
+from app.core.models import (
+    UserRole,
+)
+
+# Utility imports
+from app.roles import (
+    get_role_mask,
+)
+
+
+class Command(BaseCommand):
+    """ Command: Recompute User.role_mask from UserRole for every user (run once after the migration) """
+
+    help = 'Rebuild the denormalized role mask of all users in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        last_user_id = 0
+        updated = 0
+
+        while True:
+            users = list(get_user_model().objects.filter(
+                pk__gt=last_user_id
+            ).order_by(
+                'pk'
+            ).only(
+                'pk',
+                'role_mask'
+            )[:options['batch_size']])
+
+            if not users:
+                break
+
+            last_user_id = users[-1].pk
+
+            user_role_ids = defaultdict(list)
+
+            for user_id, role_id in UserRole.objects.filter(
+                user_id__in=[user.pk for user in users]
+            ).values_list(
+                'user_id',
+                'role_id'
+            ):
+                user_role_ids[user_id].append(role_id)
+
+            changed_users = []
+
+            for user in users:
+                role_mask = get_role_mask(user_role_ids[user.pk])
+
+                if user.role_mask != role_mask:
+                    user.role_mask = role_mask
+                    changed_users.append(user)
+
+            get_user_model().objects.bulk_update(changed_users, ['role_mask'])
+
+            updated += len(changed_users)
+
+        self.stdout.write('Users updated: %d' % updated)
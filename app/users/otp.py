@@ -0,0 +1,115 @@
+# Package imports
+import hashlib
+import hmac
+import secrets
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+# Model imports
+from app.core.models import (
+    LoginOTP,
+)
+
+
+def generate_otp_code():
+    """ OTP: Random numeric login code """
+
+    return str(secrets.randbelow(10 ** settings.OTP_DIGITS)).zfill(settings.OTP_DIGITS)
+
+
+def get_otp_digest(phone, otp):
+    """ OTP: Keyed digest of the code, so stored codes are useless without the secret key """
+
+    message = (str(phone) + ':' + str(otp)).encode()
+
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+class DatabaseOTPStore:
+    """ OTP store: Pending codes in the LoginOTP table, one row per phone """
+
+    def save(self, phone, otp, timeout):
+        """ Replace any pending code of the phone """
+
+        # Upsert in a single statement, concurrent requests for one phone do not collide on the unique key
+        LoginOTP.objects.bulk_create(
+            [
+                LoginOTP(
+                    phone=phone,
+                    otp_digest=get_otp_digest(phone, otp),
+                    expires_at=timezone.now() + timedelta(seconds=timeout)
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=['phone'],
+            update_fields=['otp_digest', 'expires_at', 'modified'],
+        )
+
+    def consume(self, phone, otp):
+        """ Delete the matching unexpired code, True when there was one (a code verifies at most once) """
+
+        deleted, _ = LoginOTP.objects.filter(
+            phone=phone,
+            otp_digest=get_otp_digest(phone, otp),
+            expires_at__gt=timezone.now()
+        ).delete()
+
+        return deleted > 0
+
+
+class CacheOTPStore:
+    """ OTP store: Pending codes in the default cache, expired by the cache TTL """
+
+    def get_cache_key(self, phone):
+        return 'login_otp:' + str(phone)
+
+    def save(self, phone, otp, timeout):
+        """ Replace any pending code of the phone """
+
+        cache.set(self.get_cache_key(phone), get_otp_digest(phone, otp), timeout)
+
+    def consume(self, phone, otp):
+        """ Delete the matching code, True when there was one (a code verifies at most once) """
+
+        cache_key = self.get_cache_key(phone)
+
+        otp_digest = cache.get(cache_key)
+
+        if otp_digest is None or not hmac.compare_digest(otp_digest, get_otp_digest(phone, otp)):
+            return False
+
+        # Only the request that actually removes the key wins a concurrent verification
+        return bool(cache.delete(cache_key))
+
+
+@lru_cache(maxsize=None)
+def get_otp_store():
+    """ OTP: Store configured in settings.OTP_STORE """
+
+    return import_string(settings.OTP_STORE)()
+
+
+def generate_login_otp(user):
+    """ OTP: Issue a new login code for the user, replacing the pending one """
+
+    # Atomic increment, no full-row save of the deferred user and no lost updates under concurrency
+    user.otp_counter = F('otp_counter') + 1
+    user.save(update_fields=['otp_counter'])
+
+    otp = generate_otp_code()
+
+    get_otp_store().save(user.phone, otp, settings.OTP_EXPIRY_TIME)
+
+    return otp
+
+
+def verify_login_otp(phone, otp):
+    """ OTP: Check and consume the pending login code of the phone """
+
+    return get_otp_store().consume(phone, otp)
@@ -3,6 +3,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 import re
 from drf_extra_fields.fields import Base64ImageField
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 
 # Model imports
 from app.core.models import (
@@ -12,6 +13,7 @@ from app.core.models import (
 
 # Serializer imports
 from app.role.serializers import (
+    RoleRegistryField,
     RoleDisplaySerializer,
 )
 from app.employeecategory.serializers import (
@@ -23,6 +25,9 @@ from app.organization.serializers import (
 
 # Utility imports
 from app.utils import get_global_error_messages
+from app.tokens import (
+    CustomRefreshToken,
+)
 
 
 # Start validation helper functions
@@ -84,7 +89,7 @@ class UserDisplayLoginSerializer(serializers.ModelSerializer):
 class UserCreateSerializer(serializers.ModelSerializer):
     """ Serializer: User Create """
 
-    role = serializers.PrimaryKeyRelatedField(many=True, queryset=Role.objects.all())
+    role = RoleRegistryField(many=True, queryset=Role.objects.all())
     profile_image = Base64ImageField(required=False)
 
     class Meta:
@@ -141,10 +146,16 @@ class UserUpdateSerializer(serializers.ModelSerializer):
 
         final_user_role_list = self.context.get('final_user_role_list', [])
 
+        # The roles the requester may grant (final_user_role_list) replace the submitted ones
+        validated_data.pop('role', None)
+
+        super().update(instance=instance, validated_data=validated_data)
+
+        # After the save, the m2m signals rewrite role_mask and permissions_version with queryset updates
         if final_user_role_list:
             instance.role.set(final_user_role_list)
 
-        super().update(instance=instance, validated_data=validated_data)
+            instance.refresh_from_db(fields=['role_mask', 'permissions_version'])
 
         return instance
 
@@ -157,3 +168,11 @@ class UserDetailCreateSeializer(serializers.ModelSerializer):
         model = UserDetail
         fields = ('pk', 'user', 'organization',)
 # End UserDetail serializers
+
+
+# Start Token serializers
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """ Serializer: Token Refresh with signed role and organization claims """
+
+    token_class = CustomRefreshToken
+# End Token serializers
@@ -0,0 +1,278 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+# Model imports
+from app.core.models import (
+    Address,
+    EmployeeCategory,
+    Organization,
+    User,
+    UserDetail,
+    UserEmployeeCategory,
+)
+
+# Utility imports
+from app.authentication import (
+    JWTAuthentication,
+    hot_user_cache,
+)
+from app.roles import (
+    get_role_mask,
+)
+from app.throttling import (
+    PhoneRateThrottle,
+)
+from app.tokens import (
+    CustomRefreshToken,
+    RevokedTokenFilter,
+)
+from app.users.otp import (
+    generate_login_otp,
+    get_otp_store,
+)
+from app.utils import (
+    get_global_values,
+)
+
+
+@override_settings(JWT_STATELESS_AUTHENTICATION=True)
+class StatelessAuthenticationTests(TestCase):
+    """ Test: Access tokens authenticated without the user row stop working once the user loses access """
+
+    fixtures = ['role']
+
+    def setUp(self):
+        cache.clear()
+        hot_user_cache.clear()
+
+        self.user = User.objects.create_user(phone='9000000002', first_name='Stateless', last_name='Auth')
+        self.user.role.add(get_global_values()['RESIDENT_USERS_ROLE_ID'])
+        self.user.refresh_from_db()
+
+        self.access_token = str(CustomRefreshToken.for_user(self.user).access_token)
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/api/', HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+
+        return JWTAuthentication().authenticate(request)
+
+    def test_active_user_is_authenticated(self):
+        user, _ = self.authenticate()
+
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_user_deactivated_with_save_is_rejected(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
+
+    def test_user_deactivated_with_update_is_rejected(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        # No signal ran, the deactivation shows once the cached permissions version is gone
+        cache.clear()
+
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
+
+    def test_revoked_role_is_rejected(self):
+        self.authenticate()
+
+        self.user.role.remove(get_global_values()['RESIDENT_USERS_ROLE_ID'])
+
+        with self.assertRaises(InvalidToken):
+            self.authenticate()
+
+
+class PhoneRateThrottleTests(TestCase):
+    """ Test: OTP requests per phone are counted atomically in the throttle cache """
+
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+
+    def get_request(self, data):
+        return Request(APIRequestFactory().post('/api/users/generate-otp/', data, format='json'), parsers=[JSONParser()])
+
+    def test_requests_past_the_rate_are_rejected(self):
+        throttle = PhoneRateThrottle()
+
+        # Start of a window, nothing carried over from the previous one
+        throttle.timer = lambda: throttle.duration * 1000
+
+        request = self.get_request({'phone': '9000000003'})
+
+        allowed = [throttle.allow_request(request, None) for _ in range(throttle.num_requests + 2)]
+
+        self.assertEqual(allowed, [True] * throttle.num_requests + [False, False])
+        self.assertGreater(throttle.wait(), 0)
+
+    def test_body_without_a_phone_is_not_throttled_per_phone(self):
+        throttle = PhoneRateThrottle()
+
+        self.assertTrue(throttle.allow_request(self.get_request(['9000000003']), None))
+
+
+@override_settings(OTP_STORE='app.users.otp.DatabaseOTPStore', SESSIONLESS_API_LOGIN=True)
+class VerifyOTPLoginQueryTests(TestCase):
+    """ Test: The login payload and tokens are built from a fixed number of queries """
+
+    fixtures = ['role']
+
+    def setUp(self):
+        cache.clear()
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+        get_otp_store.cache_clear()
+
+        self.user = User.objects.create_user(phone='9000000004', first_name='Query', last_name='Count')
+        self.user.role.add(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'], get_global_values()['EMPLOYEE_ROLE_ID'])
+
+        organization = Organization.objects.create(
+            owner_user=self.user,
+            address=Address.objects.create(address_line_1='Street'),
+            name='Organization'
+        )
+
+        user_detail = UserDetail.objects.create(user=self.user, organization=organization)
+
+        for name in ('Plumber', 'Electrician'):
+            UserEmployeeCategory.objects.create(
+                user_detail=user_detail,
+                employee_category=EmployeeCategory.objects.create(organization=organization, name=name)
+            )
+
+        self.otp = generate_login_otp(self.user)
+
+    def tearDown(self):
+        get_otp_store.cache_clear()
+
+    def test_login_query_count(self):
+        # User with user_detail, organization and address joined, roles, employee categories,
+        # consuming the OTP and recording the outstanding refresh token
+        with self.assertNumQueries(5):
+            response = self.client.post(reverse('verify-otp'), {'phone': self.user.phone, 'otp': self.otp}, content_type='application/json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']['user']['user_employee_categories']), 2)
+
+
+class RevokedTokenFilterTests(TestCase):
+    """ Test: A refresh token blacklisted by one process is rejected by the others """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+        self.user = User.objects.create_user(phone='9000000005', first_name='Revoked', last_name='Token')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def get_shared_caches(self):
+        # The file cache stands in for a shared backend, every process would see the same files
+        return {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': self.cache_dir,
+            },
+            settings.THROTTLE_CACHE_ALIAS: settings.CACHES[settings.THROTTLE_CACHE_ALIAS],
+        }
+
+    def test_revocation_reaches_another_filter(self):
+        with self.settings(CACHES=self.get_shared_caches()):
+            revoking_filter = RevokedTokenFilter()
+            other_filter = RevokedTokenFilter()
+
+            refresh = CustomRefreshToken.for_user(self.user)
+            jti = refresh['jti']
+
+            self.assertFalse(revoking_filter.is_revoked(jti))
+            self.assertFalse(other_filter.is_revoked(jti))
+
+            with mock.patch('app.tokens.revoked_token_filter', revoking_filter):
+                with self.captureOnCommitCallbacks(execute=True):
+                    refresh.blacklist()
+
+            self.assertTrue(revoking_filter.is_revoked(jti))
+            self.assertTrue(other_filter.is_revoked(jti))
+
+    def test_revocation_is_read_from_the_database_without_a_shared_cache(self):
+        refresh = CustomRefreshToken.for_user(self.user)
+
+        other_filter = RevokedTokenFilter()
+
+        self.assertFalse(other_filter.is_revoked(refresh['jti']))
+
+        # The generation bump is never run, the local cache could not carry it to other workers anyway
+        with mock.patch('app.tokens.revoked_token_filter', RevokedTokenFilter()):
+            refresh.blacklist()
+
+        self.assertTrue(other_filter.is_revoked(refresh['jti']))
+
+        with self.assertRaises(TokenError):
+            CustomRefreshToken(str(refresh))
+
+
+class UserUpdateRoleTests(TestCase):
+    """ Test: Changing roles over PATCH keeps the denormalized role mask and permissions version """
+
+    fixtures = ['role']
+
+    def setUp(self):
+        cache.clear()
+        hot_user_cache.clear()
+
+        self.admin = User.objects.create_user(phone='9000000006', first_name='Organization', last_name='Admin')
+        self.admin.role.add(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])
+        self.admin.refresh_from_db()
+
+        self.employee = User.objects.create_user(phone='9000000007', first_name='Employee', last_name='User')
+        self.employee.role.add(get_global_values()['EMPLOYEE_ROLE_ID'])
+        self.employee.refresh_from_db()
+
+        self.access_token = str(CustomRefreshToken.for_user(self.admin).access_token)
+
+    def test_role_change_updates_the_mask_and_bumps_the_version(self):
+        permissions_version = self.employee.permissions_version
+
+        response = self.client.patch(
+            reverse('user-details', args=[self.employee.pk]),
+            {'first_name': 'Promoted', 'role': [get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']]},
+            content_type='application/json',
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.employee.refresh_from_db()
+
+        self.assertEqual(self.employee.first_name, 'Promoted')
+        self.assertEqual(self.employee.role_mask, get_role_mask([get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']]))
+        self.assertGreater(self.employee.permissions_version, permissions_version)
+
+    def test_full_save_keeps_the_denormalized_columns(self):
+        stale_employee = User.objects.get(pk=self.employee.pk)
+
+        self.employee.role.set([get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']])
+
+        stale_employee.first_name = 'Stale'
+        stale_employee.save()
+
+        self.employee.refresh_from_db()
+
+        self.assertEqual(self.employee.first_name, 'Stale')
+        self.assertEqual(self.employee.role_mask, get_role_mask([get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']]))
+        self.assertNotEqual(self.employee.permissions_version, stale_employee.permissions_version)
@@ -1,17 +1,14 @@
 # Package imports
 from django.conf import settings
 from rest_framework import status
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from app.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.generics import GenericAPIView, ListAPIView
 from django.contrib.auth import (
     login, 
     get_user_model,
 )
-from rest_framework_simplejwt.tokens import RefreshToken
-import base64
-import pyotp
-import os
+from rest_framework_simplejwt.views import TokenRefreshView
 from django.db import transaction
 from rest_framework.response import Response
 
@@ -27,6 +24,7 @@ from app.users.serializers import (
     UserCreateSerializer,
     UserDetailCreateSeializer,
     UserUpdateSerializer,
+    CustomTokenRefreshSerializer,
 )
 from app.establishment.serializers import (
     EstablishmentAdminCreateSeializer,
@@ -49,7 +47,6 @@ from app.core.models import (
 
 # Utility imports
 from app.utils import (
-    GenerateKey,
     get_response_schema,
     get_global_error_messages,
     get_global_success_messages,
@@ -58,11 +55,26 @@ from app.utils import (
     get_allowed_user_roles_for_create_user,
     get_list_intersection,
     get_current_flat,
-    check_valid_management_committee_record
+    check_valid_management_committee_record,
+    get_user_organization_id,
 )
 from app.permissions import (
     does_permission_exist
 )
+from app.roles import (
+    get_role_mask,
+)
+from app.throttling import (
+    ClientIPRateThrottle,
+    PhoneRateThrottle,
+)
+from app.tokens import (
+    CustomRefreshToken,
+)
+from app.users.otp import (
+    generate_login_otp,
+    verify_login_otp,
+)
 
 # Custom schema in swagger
 from drf_yasg.utils import swagger_auto_schema
@@ -73,11 +85,14 @@ from drf_yasg import openapi
 class GenerateOTPLoginView(GenericAPIView):
     """ View: Generate OTP Login View """
 
+    throttle_classes = [ClientIPRateThrottle, PhoneRateThrottle]
+
     def get_object(self, phone, request):
         user_queryset = get_user_model().objects.filter(
             phone=phone,
             is_active=True
         ).only(
+            'phone',
             'otp_counter'
         )
         if user_queryset:
@@ -102,25 +117,10 @@ class GenerateOTPLoginView(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         try:
-            user.otp_counter += 1
-
-            user.save()
-
-            otp_counter = user.otp_counter
-
-            key_generation = GenerateKey()
-
-            # Encoded string that will be used to create TOTP model
-            # Used otp_counter based logic so each time new OTP will be generated eventhough previous one was not expired.
-            key = base64.b32encode(key_generation.returnBaseString(phone, otp_counter).encode())
-            print("➡ otp_counter :", otp_counter)
-
-            OTP = pyotp.TOTP(key, digits = 6, interval = float(os.environ.get('OTP_EXPIRY_TIME')))
-            print("➡ OTP :", float(os.environ.get('OTP_EXPIRY_TIME')))
-            print("➡ OTP :", key)
+            otp = generate_login_otp(user)
 
             return_data = {
-                'otp': str(OTP.now())
+                'otp': otp
             }
 
             return get_response_schema(return_data, get_global_success_messages()['OTP_GENERATED'], status.HTTP_200_OK)
@@ -134,8 +134,14 @@ class GenerateOTPLoginView(GenericAPIView):
 class VerifyOTPLoginView(GenericAPIView):
     """ View: Verify OTP Login View """
 
+    throttle_classes = [ClientIPRateThrottle, PhoneRateThrottle]
+
     def get_object(self, phone, request):
-        user_queryset = get_user_model().objects.prefetch_related(
+        # Everything the login payload and token claims read, in three queries
+        user_queryset = get_user_model().objects.select_related(
+            'user_detail__organization__address'
+        ).prefetch_related(
+            'role',
             'user_details__user_employee_categories'
         ).filter(
             phone=phone,
@@ -150,7 +156,9 @@ class VerifyOTPLoginView(GenericAPIView):
             type=openapi.TYPE_OBJECT,
             properties={
                 'phone': openapi.Schema(type=openapi.TYPE_STRING),
-                'otp': openapi.Schema(type=openapi.TYPE_STRING)
+                'otp': openapi.Schema(type=openapi.TYPE_STRING),
+                'current_token': openapi.Schema(type=openapi.TYPE_STRING),
+                'device_id': openapi.Schema(type=openapi.TYPE_STRING)
             }
         )
     )
@@ -164,33 +172,22 @@ class VerifyOTPLoginView(GenericAPIView):
             return get_response_schema({}, get_global_error_messages()['NOT_FOUND'], status.HTTP_404_NOT_FOUND)
 
         try:
-            otp_counter = user.otp_counter
-
-            key_generation = GenerateKey()
-
-            # Encoded string that will be used to create TOTP model
-            # Used otp_counter based logic so each time new OTP will be generated eventhough previous one was not expired.
-            key = base64.b32encode(key_generation.returnBaseString(phone, otp_counter).encode())
-            print("➡ key :", key)
-            print("➡ otp_counter :", otp_counter)
+            if verify_login_otp(phone, request.data['otp']):
 
-            OTP = pyotp.TOTP(key, digits = 6, interval = float(os.environ.get('OTP_EXPIRY_TIME')))
-
-            print(str(OTP.now()))
-            print("➡ request.data :", request.data)
-            if OTP.verify(request.data['otp']):
-                login(request, user)
+                # API clients authenticate with the JWT below, a session row and cookie would never be read
+                if not settings.SESSIONLESS_API_LOGIN:
+                    login(request, user)
 
                 # Save the Device Token for Push Notification
                 try:
-                    push_notification_token_obj = save_current_token(user, request.data['current_token'])
+                    push_notification_token_obj = save_current_token(user, request.data['current_token'], request.data.get('device_id'))
 
                     current_token = push_notification_token_obj.current_token
                 except:
                     current_token = None
 
-                # Get token details
-                refresh = RefreshToken.for_user(user)
+                # Get token details (signed role and organization claims included)
+                refresh = CustomRefreshToken.for_user(user)
 
                 # Get user details
                 user_data = UserDisplayLoginSerializer(user)
@@ -216,6 +213,12 @@ class VerifyOTPLoginView(GenericAPIView):
             return get_response_schema(return_data, get_global_error_messages()['BAD_REQUEST'], status.HTTP_400_BAD_REQUEST)
 
 
+class CustomTokenRefreshView(TokenRefreshView):
+    """ View: Refresh the access token with the user's current role and organization claims """
+
+    serializer_class = CustomTokenRefreshSerializer
+
+
 class CustomLogoutView(GenericAPIView):
     """ View: Custom User Logout """
 
@@ -233,7 +236,7 @@ class CustomLogoutView(GenericAPIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh_token"]
-            token = RefreshToken(refresh_token)
+            token = CustomRefreshToken(refresh_token)
             token.blacklist()
             return get_response_schema({}, get_global_success_messages()['CREDENTIALS_REMOVED'], status.HTTP_200_OK)
         except:
@@ -407,24 +410,24 @@ class UserDetails(GenericAPIView):
         elif (permissions[str(get_global_values()['SUPER_ADMIN_ROLE_ID'])]):
 
             user_queryset = user_queryset.filter(
-                user_role__role__id__in=get_allowed_user_roles_for_create_user()['SUPER_ADMIN_ALLOWED_ROLE_IDS'],
+                role_mask__has_any_role=get_role_mask(get_allowed_user_roles_for_create_user()['SUPER_ADMIN_ALLOWED_ROLE_IDS']),
                 user_detail__organization__id__in=list(request.user.owned_organizations.all().values_list('id', flat=True))
             )
 
         # Query when Organization Administrator request for Employee role user
         elif (permissions[str(get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID'])]):
 
-            user_queryset = user_queryset.filter(user_role__role__id__in=get_allowed_user_roles_for_create_user()['ORGANIZATION_ADMINISTRATOR_ALLOWED_ROLE_IDS'])
+            user_queryset = user_queryset.filter(role_mask__has_any_role=get_role_mask(get_allowed_user_roles_for_create_user()['ORGANIZATION_ADMINISTRATOR_ALLOWED_ROLE_IDS']))
 
         # Query when Establishment Admin request for Management Committee role user
         elif (permissions[str(get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID'])]):
 
-            user_queryset = user_queryset.filter(user_role__role__id__in=get_allowed_user_roles_for_create_user()['ESTABLISHMENT_ADMIN_ALLOWED_ROLE_IDS'])
+            user_queryset = user_queryset.filter(role_mask__has_any_role=get_role_mask(get_allowed_user_roles_for_create_user()['ESTABLISHMENT_ADMIN_ALLOWED_ROLE_IDS']))
 
         # Query when Management Committee request for Resident role user
         elif (permissions[str(get_global_values()['MANAGEMENT_COMMITTEE_ROLE_ID'])]):
 
-            user_queryset = user_queryset.filter(user_role__role__id__in=get_allowed_user_roles_for_create_user()['MANAGEMENT_COMMITTEE_ALLOWED_ROLE_IDS'])
+            user_queryset = user_queryset.filter(role_mask__has_any_role=get_role_mask(get_allowed_user_roles_for_create_user()['MANAGEMENT_COMMITTEE_ALLOWED_ROLE_IDS']))
 
         if user_queryset != None and user_queryset:
             permissions['model'] = user_queryset[0]
@@ -674,7 +677,7 @@ class UserList(GenericAPIView):
             'role'
         ).filter(
             is_active=True,
-            user_role__role__id__in=[int(request.query_params.get('role'))]
+            role_mask__has_any_role=get_role_mask([int(request.query_params.get('role'))])
         ).order_by(
             'first_name',
             'last_name'
@@ -739,7 +742,7 @@ class UserListFilter(ListAPIView):
             'role'
         ).filter(
             is_active=True,
-            user_role__role__id__in=allowed_roles
+            role_mask__has_any_role=get_role_mask(allowed_roles)
         ).order_by(
             'first_name',
             'last_name'
@@ -748,7 +751,7 @@ class UserListFilter(ListAPIView):
         if self.request.query_params.get('role'):
             if int(self.request.query_params.get('role')) not in allowed_roles:
                 return []
-            queryset = queryset.filter(user_role__role__id__in=[self.request.query_params.get('role')])
+            queryset = queryset.filter(role_mask__has_any_role=get_role_mask([self.request.query_params.get('role')]))
 
         return queryset
 
@@ -799,7 +802,7 @@ class OrganizationAdministratorLinkingCreate(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID']]
+            role_mask__has_any_role=get_role_mask([get_global_values()['ORGANIZATION_ADMINISTRATOR_ROLE_ID']])
         )
 
         if organization_queryset and user_queryset:
@@ -887,12 +890,12 @@ class EmployeeLinkingCreate(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']]
+            role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']])
         )
 
         if user_queryset:
 
-            request.data['organization'] = request.user.user_details.organization.id
+            request.data['organization'] = get_user_organization_id(request)
 
             serializer = UserDetailCreateSeializer(data=request.data)
 
@@ -934,7 +937,7 @@ class EmployeeLinkingDetail(GenericAPIView):
         # Validating User ID with direct Linking model
         user_details_queryset = UserDetail.objects.filter(
             user__id=pk,
-            organization=request.user.user_details.organization,
+            organization_id=get_user_organization_id(request),
             organization__is_active=True,
         )
 
@@ -978,14 +981,14 @@ class EstablishmentAdminLinkingCreate(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']]
+            role_mask__has_any_role=get_role_mask([get_global_values()['ESTABLISHMENT_ADMIN_ROLE_ID']])
         )
 
         # Validating Establishment ID
         establishment_queryset = Establishment.objects.filter(
             pk=request.data['establishment'],
             is_active=True,
-            owner_organization=request.user.user_details.organization
+            owner_organization_id=get_user_organization_id(request)
         )
 
         if user_queryset and establishment_queryset:
@@ -1038,7 +1041,7 @@ class EstablishmentAdminLinkingDetail(GenericAPIView):
         establishment_queryset = Establishment.objects.filter(
             pk=pk,
             is_active=True,
-            owner_organization=request.user.user_details.organization
+            owner_organization_id=get_user_organization_id(request)
         )
 
         if establishment_queryset:
@@ -1105,7 +1108,7 @@ class ResidentUserLinking(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['RESIDENT_USERS_ROLE_ID']]
+            role_mask__has_any_role=get_role_mask([get_global_values()['RESIDENT_USERS_ROLE_ID']])
         )
 
         # Validating Flat ID
@@ -1252,7 +1255,7 @@ class EstablishmentGuardLinkingCreate(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['SECURITY_GUARD_ROLE_ID']]
+            role_mask__has_any_role=get_role_mask([get_global_values()['SECURITY_GUARD_ROLE_ID']])
         )
 
         # Validating Establishment ID
@@ -1382,7 +1385,7 @@ class ManagementCommitteeLinking(GenericAPIView):
         user_queryset = get_user_model().objects.filter(
             pk=request.data['user'],
             is_active=True,
-            user_role__role__id__in=[get_global_values()['RESIDENT_USERS_ROLE_ID']],
+            role_mask__has_any_role=get_role_mask([get_global_values()['RESIDENT_USERS_ROLE_ID']]),
             flat__flat__building__establishment__id=request.data['establishment']
         )
 
@@ -1462,7 +1465,7 @@ class ManagementCommitteeLinking(GenericAPIView):
         management_committee_queryset = ManagementCommittee.objects.filter(
             is_active=True,
             user__id=request.data['user'],
-            user__user_role__role__id__in=[get_global_values()['MANAGEMENT_COMMITTEE_ROLE_ID']],
+            user__role_mask__has_any_role=get_role_mask([get_global_values()['MANAGEMENT_COMMITTEE_ROLE_ID']]),
             user__flat__flat__building__establishment__id=request.data['establishment'],
             establishment__id=request.data['establishment'],
             establishment__establishment_admin=request.user
@@ -1534,8 +1537,7 @@ class UserEmployeeCategoryCreate(GenericAPIView):
         # Check if all records are valid
         selected_employee_categories = request.data['employee_categories']
 
-        employee_category_queryset = EmployeeCategory.objects.filter(
-            organization=request.user.user_details.organization,
+        employee_category_queryset = EmployeeCategory.org_objects.filter(
             organization__is_active=True,
             pk__in=selected_employee_categories
         )
@@ -1545,8 +1547,8 @@ class UserEmployeeCategoryCreate(GenericAPIView):
         user_detail_queryset = UserDetail.objects.filter(
             user__id=request.data['user'],
             user__is_active=True,
-            user__user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']],
-            organization=request.user.user_details.organization,
+            user__role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']]),
+            organization_id=get_user_organization_id(request),
             organization__is_active=True
         )
 
@@ -1581,8 +1583,8 @@ class UserEmployeeCategoryDetail(GenericAPIView):
         ).filter(
             user__id=pk,
             user__is_active=True,
-            user__user_role__role__id__in=[get_global_values()['EMPLOYEE_ROLE_ID']],
-            organization=request.user.user_details.organization,
+            user__role_mask__has_any_role=get_role_mask([get_global_values()['EMPLOYEE_ROLE_ID']]),
+            organization_id=get_user_organization_id(request),
             organization__is_active=True
         )
 
@@ -1,10 +1,12 @@
 # Package imports
 from rest_framework.response import Response
-import requests
-import json
 import environ
 from datetime import date
 from django.utils import timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from contextvars import ContextVar
 
 # For distance calculation
 from math import(
@@ -20,12 +22,41 @@ environ.Env.read_env()
 
 # Model imports 
 from app.core.models import (
+    FlatMember,
+    UserDetail,
     PushNotificationToken,
     ManagementCommittee,
     EstablishmentGuard,
     EstablishmentGuardAttendanceRecord,
 )
 
+# Utility imports
+from app.notifications.topics import (
+    queue_token_unsubscriptions,
+    resync_user_devices,
+)
+
+# Request currently being served, bound by app.middleware.RequestContextMiddleware
+current_request = ContextVar('current_request', default=None)
+
+# Cache backends private to one process, what one worker writes there the others never see
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_current_request():
+    """ Utility: Get the request currently being served (None outside of a request) """
+
+    return current_request.get()
+
+
+def is_shared_cache(alias):
+    """ Utility: Check whether every worker reads and writes the same cache under this alias """
+
+    return settings.CACHES[alias]['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
 
 def get_global_success_messages():
     """ Utility: Get global success messages """
@@ -52,6 +83,7 @@ def get_global_success_messages():
         'REQUEST_ASSIGNED': 'Service Request assigned.',
         'EMPLOYEE_ASSIGNED': 'Employee assigned.',
         'SERVICE_REQUEST_MARKED_COMPLETED': 'Service request completed.',
+        'NOTIFICATION_DIGEST': '%d new updates.',
     }   
     return data
 
@@ -95,6 +127,8 @@ def get_global_error_messages():
         'INVALID_RATING': 'The rating must be between 1 and 5.',
         'INVALID_REQUESTED_ROLE': 'The requested role is not valid.',
         'SOMETHING_WENT_WRONG': 'Something went wrong. Please try again.',
+        'PAYMENT_GATEWAY_UNAVAILABLE': 'The payment could not be started. Please try again.',
+        'INVALID_PAYMENT_SIGNATURE': 'The payment could not be verified.',
     }
     return data
 
@@ -129,10 +163,79 @@ def get_global_values():
 
         # Tabs filter in Bill Payment List Records
         'OVERDUE': 'Overdue',
+
+        # Signed claims in the access token
+        'ROLES_CLAIM': 'roles',
+        'ORGANIZATION_CLAIM': 'organization_id',
+        'PERMISSIONS_VERSION_CLAIM': 'permissions_version',
     }   
     return data
 
 
+class OrganizationContext:
+    """ Resolver: Organization the request acts for, resolved once the user is authenticated """
+
+    def __init__(self, request):
+        self.request = request
+        self.organization_id = None
+        self.is_resolved = False
+
+    def get_organization_id(self):
+        """ Return the organization ID of the requesting user, memoized for the lifetime of the request """
+
+        if not self.is_resolved:
+            user = getattr(self.request, 'user', None)
+
+            # Nothing to memoize before authentication has run
+            if user is None or not user.is_authenticated:
+                return None
+
+            self.organization_id = resolve_user_organization_id(self.request)
+            self.is_resolved = True
+
+        return self.organization_id
+
+
+def resolve_user_organization_id(request):
+    """ Utility: Organization ID of the requesting user, trusted from the signed access token when present """
+
+    organization_claim = get_global_values()['ORGANIZATION_CLAIM']
+
+    token = getattr(request, 'auth', None)
+
+    if token is not None and organization_claim in token:
+        return token[organization_claim]
+
+    return UserDetail.objects.filter(
+        user_id=request.user.pk
+    ).values_list(
+        'organization_id',
+        flat=True
+    ).first()
+
+
+def get_user_organization_id(request):
+    """ Utility: Organization ID of the requesting user, resolved once per request """
+
+    organization_context = getattr(request, 'organization_context', None)
+
+    if organization_context is None:
+        return resolve_user_organization_id(request)
+
+    return organization_context.get_organization_id()
+
+
+def get_current_organization_id():
+    """ Utility: Organization ID of the request currently being served (None outside of a request) """
+
+    request = get_current_request()
+
+    if request is None:
+        return None
+
+    return get_user_organization_id(request)
+
+
 def get_allowed_user_roles_for_create_user():
     """ Utility: User roles that are allowed to while creating a user """
 
@@ -168,122 +271,279 @@ def get_list_intersection(list1, list2):
     return list(set(list1).intersection(list2))
 
 
-def save_current_token(user,current_token):
-    """ Utility: Save device Token in its respective model """
-    
-    currentToken = current_token
-    
-    deviceId = 'device_id'
-    
-    push_notification_token_obj, _ = PushNotificationToken.objects.get_or_create(user=user)
-    
-    push_notification_token_obj.device_id = deviceId
-    
-    push_notification_token_obj.current_token = currentToken
-    
-    push_notification_token_obj.save()
+def save_current_token(user,current_token,device_id=None):
+    """ Utility: Save the device token of one of the user's devices, a user gets one row per device """
+
+    # Older clients send no device id, the token then stands for the device
+    device_id = device_id or current_token
+
+    push_notification_token_obj = PushNotificationToken(
+        user=user,
+        device_id=device_id,
+        current_token=current_token
+    )
+
+    with transaction.atomic():
+        # Single INSERT ... ON CONFLICT, instead of get_or_create followed by a save
+        PushNotificationToken.objects.bulk_create(
+            [push_notification_token_obj],
+            update_conflicts=True,
+            unique_fields=['user', 'device_id'],
+            update_fields=['current_token', 'modified'],
+        )
+
+        # A token belongs to one install, drop it from the previous user or device of that install
+        moved_tokens = PushNotificationToken.objects.filter(
+            current_token=current_token
+        ).exclude(
+            user=user,
+            device_id=device_id
+        )
+
+        # The install must stop getting the previous user's broadcasts
+        queue_token_unsubscriptions(moved_tokens)
+
+        moved_tokens.delete()
+
+        # The new token joins the user's broadcast topics on the next worker pass
+        resync_user_devices(user.pk)
 
     return push_notification_token_obj
 
 
-def send_notification(user,message_title,message_desc):
-    """ Utility: Send Notification to the User """
+class ResidentContextResolver:
+    """ Resolver: Current flat (with building and establishment) of users, loaded at most once per request """
 
-    fcm_api = env('FCM_TOKEN')
-    url = "https://fcm.googleapis.com/fcm/send"
-    
-    headers = {
-        "Content-Type":"application/json",
-        "Authorization": 'key='+fcm_api
-    }
-    
-    try:
-        user_token = PushNotificationToken.objects.get(user=user).current_token
-    except Exception as e:
-        return None
-    
-    registratred_device = [user_token]
-    
-    payload = {
-        "registration_ids" :registratred_device,
-        "priority" : "high",
-        "notification" : {
-            "body" : message_desc,
-            "title" : message_title,
-            "image" : "",
-            "icon": "https://static.vecteezy.com/system/resources/previews/010/366/202/original/bell-icon-transparent-notification-free-png.png",
-        }
-    }
+    def __init__(self):
+        self.current_flats = {}
+
+    def get_current_flat(self, user_id):
+        """ Return the current flat of the user, memoized for the lifetime of the request """
+
+        if user_id not in self.current_flats:
+            self.current_flats[user_id] = get_cached_current_flat(user_id)
+
+        return self.current_flats[user_id]
+
+    def invalidate(self, user_id):
+        """ Forget the memoized current flat of the user """
+
+        self.current_flats.pop(user_id, None)
+
+
+def get_current_flat_cache_key(user_id):
+    """ Utility: Cache key holding the current flat of the user """
+
+    return 'current_flat:' + str(user_id)
 
-    result = requests.post(url,  data=json.dumps(payload), headers=headers )
 
-    return result
+def get_cached_current_flat(user_id):
+    """ Utility: Current flat of the user from the shared cache, falling back to a single query """
 
+    cache_key = get_current_flat_cache_key(user_id)
 
-class GenerateKey:
-    """ Utility: For generating dynamic OTP """
+    # Users without a current flat are cached as None, so a missing key has to be told apart
+    flat_obj = cache.get(cache_key, cache_key)
 
-    @staticmethod
-    def returnBaseString(phone, counter):
-        """ Generating a symmetric string using phone, otp_counter and other things to use in OTP generation logic """
-        return str(phone) + str(date.today()) + "SeccdzeKey" + str(counter)
+    if flat_obj is cache_key:
+
+        flat_member = FlatMember.objects.select_related(
+            'flat__building__establishment'
+        ).filter(
+            user_id=user_id,
+            is_active=True,
+            is_current_flat=True
+        ).first()
+
+        flat_obj = flat_member.flat if flat_member else None
+
+        cache.set(cache_key, flat_obj, settings.RESIDENT_CONTEXT_CACHE_TIMEOUT)
+
+    return flat_obj
 
 
 def get_current_flat(user_obj):
-    """ Utility: Give current selected flat object """
-
-    flat_member_queryset = user_obj.flats.filter(
-        is_active=True,
-        is_current_flat=True
-    ).select_related(
-        'flat__building',
-        'flat__building__establishment'
-    )
+    """ Utility: Give current selected flat object (building and establishment already attached) """
+
+    request = get_current_request()
+
+    resident_context = getattr(request, 'resident_context', None)
+
+    if resident_context is None:
+        return get_cached_current_flat(user_obj.pk)
+
+    return resident_context.get_current_flat(user_obj.pk)
+
+
+def invalidate_current_flat(user_id):
+    """ Utility: Drop the cached current flat of the user (called from the FlatMember signals) """
+
+    cache_key = get_current_flat_cache_key(user_id)
+
+    cache.delete(cache_key)
+
+    # A concurrent request may have re-read the old rows before our transaction committed
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+    request = get_current_request()
+
+    resident_context = getattr(request, 'resident_context', None)
+
+    if resident_context is not None:
+        resident_context.invalidate(user_id)
+
+
+class MembershipIndex:
+    """ Resolver: Guard and management committee memberships of users, loaded at most once per request """
+
+    def __init__(self):
+        self.establishment_guards = {}
+        self.management_committees = {}
+
+    def get_establishment_guard(self, user_id):
+        """ Return the active EstablishmentGuard of the user, memoized for the lifetime of the request """
+
+        if user_id not in self.establishment_guards:
+            self.establishment_guards[user_id] = get_cached_establishment_guard(user_id)
+
+        return self.establishment_guards[user_id]
+
+    def get_management_committees(self, user_id):
+        """ Return the active ManagementCommittee records of the user by establishment ID, memoized for the request """
+
+        if user_id not in self.management_committees:
+            self.management_committees[user_id] = get_cached_management_committees(user_id)
+
+        return self.management_committees[user_id]
+
+    def invalidate(self, user_id):
+        """ Forget the memoized memberships of the user """
+
+        self.establishment_guards.pop(user_id, None)
+        self.management_committees.pop(user_id, None)
+
+
+def get_establishment_guard_cache_key(user_id):
+    """ Utility: Cache key holding the active EstablishmentGuard of the user """
+
+    return 'establishment_guard:' + str(user_id)
+
+
+def get_management_committees_cache_key(user_id):
+    """ Utility: Cache key holding the active ManagementCommittee records of the user """
 
-    if flat_member_queryset.exists():
-        return flat_member_queryset.first().flat
-    return None
+    return 'management_committees:' + str(user_id)
+
+
+def get_cached_establishment_guard(user_id):
+    """ Utility: Active EstablishmentGuard of the user from the shared cache, falling back to a single query """
+
+    cache_key = get_establishment_guard_cache_key(user_id)
+
+    # Users who are not guards are cached as None, so a missing key has to be told apart
+    establishment_guard = cache.get(cache_key, cache_key)
+
+    if establishment_guard is cache_key:
+
+        establishment_guard = EstablishmentGuard.objects.select_related(
+            'establishment__location'
+        ).filter(
+            user_id=user_id,
+            is_active=True
+        ).first()
+
+        cache.set(cache_key, establishment_guard, settings.MEMBERSHIP_CACHE_TIMEOUT)
+
+    return establishment_guard
+
+
+def get_cached_management_committees(user_id):
+    """ Utility: Active ManagementCommittee records of the user by establishment ID, from the shared cache falling back to a single query """
+
+    cache_key = get_management_committees_cache_key(user_id)
+
+    management_committees = cache.get(cache_key)
+
+    if management_committees is None:
+
+        management_committees = {
+            management_committee.establishment_id: management_committee
+            for management_committee in ManagementCommittee.objects.filter(
+                user_id=user_id,
+                is_active=True
+            )
+        }
+
+        cache.set(cache_key, management_committees, settings.MEMBERSHIP_CACHE_TIMEOUT)
+
+    return management_committees
+
+
+def get_membership_index():
+    """ Utility: Membership index of the current request (None outside of a request) """
+
+    return getattr(get_current_request(), 'membership_index', None)
+
+
+def invalidate_memberships(user_id):
+    """ Utility: Drop the cached guard and committee memberships of the user (called from the signals) """
+
+    cache_keys = [
+        get_establishment_guard_cache_key(user_id),
+        get_management_committees_cache_key(user_id),
+    ]
+
+    cache.delete_many(cache_keys)
+
+    # A concurrent request may have re-read the old rows before our transaction committed
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+    membership_index = get_membership_index()
+
+    if membership_index is not None:
+        membership_index.invalidate(user_id)
 
 
 def check_valid_management_committee_record(user_obj, establishment_id):
     """ Utility: Check valid entry for the Management Committee """
 
-    management_committee_queryset = ManagementCommittee.objects.filter(
-        user=user_obj,
-        establishment__id=establishment_id,
-        is_active=True
-    )
+    membership_index = get_membership_index()
+
+    if membership_index is None:
+        management_committees = get_cached_management_committees(user_obj.pk)
+    else:
+        management_committees = membership_index.get_management_committees(user_obj.pk)
 
     status = {
         'allowed': False
     }
 
-    if management_committee_queryset:
+    if establishment_id in management_committees:
         status['allowed'] = True
 
-        status['management_committee'] = management_committee_queryset.first()
+        status['management_committee'] = management_committees[establishment_id]
         return status
     return status
 
 
 def check_valid_establishment_guard_record(user_obj):
-    """ Utility: Check valid entry for the Establishment Guard """
+    """ Utility: Check valid entry for the Establishment Guard (establishment and location already attached) """
 
-    establishment_guard_queryset = EstablishmentGuard.objects.select_related(
-        'establishment'
-    ).filter(
-        user=user_obj,
-        is_active=True
-    )
+    membership_index = get_membership_index()
+
+    if membership_index is None:
+        establishment_guard = get_cached_establishment_guard(user_obj.pk)
+    else:
+        establishment_guard = membership_index.get_establishment_guard(user_obj.pk)
 
     status = {
         'allowed': False
     }
 
-    if establishment_guard_queryset.exists():
+    if establishment_guard is not None:
         status['allowed'] = True
 
-        status['establishment_guard'] = establishment_guard_queryset.first()
+        status['establishment_guard'] = establishment_guard
 
         return status
 